@@ -1,7 +1,11 @@
 from ci_plumber.helpers.config_helpers import (
+    ConfigSession,
+    config_option,
     get_config,
     get_config_file,
+    get_current_repo_config,
     load_config,
+    migrate_config_to_sqlite,
     save_config,
     set_config,
 )
@@ -9,5 +13,37 @@ from ci_plumber.helpers.file_generators import (
     generate_docker_file,
     generate_gitlab_yaml,
 )
-from ci_plumber.helpers.git_helpers import get_repo
-from ci_plumber.helpers.run_command import run_command
+from ci_plumber.helpers.git_helpers import (
+    RepoContext,
+    get_repo,
+    get_repo_context,
+)
+from ci_plumber.helpers.json_stream import (
+    extract_json_keys,
+    iter_json_items,
+    read_json_keys,
+    stream_json_array,
+)
+from ci_plumber.helpers.polling import (
+    WaitTimeoutError,
+    poll_delays,
+    wait_until,
+    wait_until_async,
+)
+from ci_plumber.helpers.run_command import (
+    CommandError,
+    CommandTimeoutError,
+    RetryPolicy,
+    gather_limited,
+    probe_command_async,
+    run_command,
+    run_command_async,
+    run_commands,
+)
+from ci_plumber.helpers.stream_command import (
+    LiveTail,
+    run_command_streaming,
+    run_command_streaming_async,
+    stream_command,
+)
+from ci_plumber.helpers.workflow import Checkpoint, Workflow, WorkflowError
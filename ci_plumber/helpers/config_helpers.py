@@ -1,18 +1,39 @@
 import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Optional
 
 import typer
 
+from ci_plumber.helpers.git_helpers import get_repo
+from ci_plumber.helpers.sqlite_config import (
+    SQLITE_CONFIG_FILE,
+    delete_values,
+    get_value,
+    is_sqlite_config,
+    load_remote,
+    migrate_json_config,
+    set_values,
+)
+
 
 def get_config_file() -> Path:
-    """Gets the location of the config file, as well as ensuring it exists
+    """Gets the location of the config file, as well as ensuring it exists.
+    Once the config has been migrated to SQLite, this is the database.
 
     Returns:
         Path: The path to the config file
     """
     # Get the config directory
     app_dir: str = typer.get_app_dir("CI-Plumber")
+    # Prefer the SQLite store if the config has been migrated
+    db_path: Path = Path(app_dir) / SQLITE_CONFIG_FILE
+    if db_path.is_file():
+        return db_path
     # Get the config file
     config_path: Path = Path(app_dir) / "config.json"
     # If it doesn't exist, create it
@@ -20,15 +41,51 @@ def get_config_file() -> Path:
         typer.echo("Config file doesn't exist yet")
         # Make the config directory
         Path.mkdir(Path(app_dir), parents=True, exist_ok=True)
-        # Make the config file
-        config_path.touch()
-        # Fill it with valid JSON
-        with config_path.open("w") as fp:
-            json.dump({"repos": {}}, fp)
+        with lock_config(config_path):
+            # Another process may have created it while we were waiting
+            if not config_path.is_file():
+                # Fill it with valid JSON
+                save_config(config_path, {"repos": {}})
         typer.echo("Created config file")
     return config_path
 
 
+@contextmanager
+def lock_config(config_path: Path) -> Iterator[None]:
+    """Holds an exclusive advisory lock on the config file. Writers take the
+    lock so that they don't lose each other's changes. Readers don't need it
+    as the file is always replaced atomically.
+
+    Args:
+        config_path (Path): The path to the config file
+    """
+    lock_path = config_path.with_name(config_path.name + ".lock")
+    with lock_path.open("a+") as fp:
+        if sys.platform == "win32":
+            import msvcrt
+
+            while True:
+                try:
+                    # Blocks for up to 10 seconds before raising
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
 def load_config(
     config_path: Path, remote: str
 ) -> tuple[dict[str, str], dict[str, dict[str, dict[str, str]]]]:
@@ -43,9 +100,13 @@ def load_config(
             and repo data.
     """
     config: dict[str, dict[str, dict[str, str]]] = {}
+    current_config: dict[str, str] = {}
+    if is_sqlite_config(config_path):
+        # Only the requested remote is read from the database
+        current_config = load_remote(config_path, remote)
+        return current_config, {"repos": {remote: current_config}}
     with config_path.open("r") as fp:
         config = json.load(fp)
-    current_config: dict[str, str] = {}
     if remote in config["repos"]:
         current_config = config["repos"][remote]
     else:
@@ -54,15 +115,125 @@ def load_config(
 
 
 def save_config(config_path: Path, config: dict[str, Any]) -> None:
-    """Saves the config to the config file
+    """Saves the config to the config file. The config is written to a
+    temporary file which then replaces the config file, so that it is never
+    left half written.
 
     Args:
         config_path (Path): The path to the config file
-        remote (str): The remote to use
         config (dict[str, Any]): The config to save
     """
-    with config_path.open("w") as fp:
-        json.dump(config, fp, indent=4)
+    if is_sqlite_config(config_path):
+        set_values(config_path, config["repos"])
+        return
+    fd, temp_path = tempfile.mkstemp(
+        dir=config_path.parent, prefix=config_path.name, suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(config, fp, indent=4)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp_path, config_path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+class ConfigSession:
+    """A batch of reads and writes to one repo's config. The config file is
+    loaded once, and is only written when the session is committed.
+
+    Can be used as a context manager, which commits the session if no
+    exception was raised:
+
+        with ConfigSession(remote) as config:
+            config.set("registry.url", url)
+            config.set("registry.name", name)
+
+    Args:
+        remote (str): The git remote to use
+        config_path (Optional[Path], optional): The path to the config file.
+            Defaults to the one from get_config_file.
+    """
+
+    def __init__(self, remote: str, config_path: Optional[Path] = None):
+        self.remote = remote
+        self.config_path = config_path or get_config_file()
+        self.repo_config, self.config = load_config(self.config_path, remote)
+        self.changes: dict[str, Any] = {}
+        self.deleted: set[str] = set()
+
+    def get(self, key: str) -> Any:
+        """Gets a config value, including uncommitted changes
+
+        Args:
+            key (str): The key for the config value
+
+        Returns:
+            Any: The value corresponding to the key
+        """
+        return self.repo_config[key]
+
+    def set(self, key: str, value: Any) -> None:
+        """Sets a config value. It is saved when the session is committed.
+
+        Args:
+            key (str): The key for the config value
+            value (Any): The value stored in the key
+        """
+        self.repo_config[key] = value
+        self.changes[key] = value
+        self.deleted.discard(key)
+
+    def update(self, values: dict[str, Any]) -> None:
+        """Sets several config values at once
+
+        Args:
+            values (dict[str, Any]): The values to store, keyed by key
+        """
+        for key, value in values.items():
+            self.set(key, value)
+
+    def delete(self, key: str) -> None:
+        """Deletes a config value, if it exists. It is deleted when the
+        session is committed.
+
+        Args:
+            key (str): The key for the config value
+        """
+        self.repo_config.pop(key, None)
+        self.changes.pop(key, None)
+        self.deleted.add(key)
+
+    def commit(self) -> None:
+        """Saves the changes made in this session to the config file. They
+        are merged into the latest version of the file, so changes made by
+        other processes since the session was loaded are kept."""
+        if not self.changes and not self.deleted:
+            return
+        if is_sqlite_config(self.config_path):
+            # SQLite only writes the changed rows, in its own transaction
+            set_values(self.config_path, {self.remote: self.changes})
+            delete_values(self.config_path, self.remote, self.deleted)
+            self.changes, self.deleted = {}, set()
+            return
+        with lock_config(self.config_path):
+            repo_config, config = load_config(self.config_path, self.remote)
+            repo_config.update(self.changes)
+            for key in self.deleted:
+                repo_config.pop(key, None)
+            config["repos"][self.remote] = repo_config
+            save_config(self.config_path, config)
+        self.repo_config, self.config = repo_config, config
+        self.changes, self.deleted = {}, set()
+
+    def __enter__(self) -> "ConfigSession":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.commit()
 
 
 def set_config(remote: str, key: str, value: Any) -> None:
@@ -73,11 +244,8 @@ def set_config(remote: str, key: str, value: Any) -> None:
         key (str): The key for the config value
         value (Any): The value stored in the key
     """
-    config_path: Path = get_config_file()
-    repo_config, config = load_config(config_path, remote)
-    repo_config[key] = value
-    config["repos"][remote] = repo_config
-    save_config(config_path, config)
+    with ConfigSession(remote) as config:
+        config.set(key, value)
 
 
 def get_config(remote: str, key: str) -> Any:
@@ -91,5 +259,76 @@ def get_config(remote: str, key: str) -> Any:
         Any: The value corresponding to the key
     """
     config_path: Path = get_config_file()
-    repo_config, _ = load_config(config_path, remote)
-    return repo_config[key]
+    if is_sqlite_config(config_path):
+        return get_value(config_path, remote, key)
+    return ConfigSession(remote, config_path).get(key)
+
+
+def migrate_config_to_sqlite() -> tuple[Path, int]:
+    """Moves the config from config.json into the SQLite store
+
+    Raises:
+        FileExistsError: If the config has already been migrated
+
+    Returns:
+        tuple[Path, int]: The path to the database and the number of
+            remotes migrated
+    """
+    config_path: Path = get_config_file()
+    if is_sqlite_config(config_path):
+        raise FileExistsError(config_path)
+    db_path = config_path.with_name(SQLITE_CONFIG_FILE)
+    with lock_config(config_path):
+        remotes = migrate_json_config(config_path, db_path)
+    return db_path, remotes
+
+
+@lru_cache(maxsize=None)
+def get_current_repo_config() -> dict[str, Any]:
+    """Gets the config of the repo in the current directory. It is only read
+    once per process, so it shouldn't be used after the config is changed.
+
+    Returns:
+        dict[str, Any]: The repo's config, or an empty dict if the current
+            directory doesn't have a usable remote.
+    """
+    try:
+        return ConfigSession(get_repo()).repo_config
+    except KeyError:
+        return {}
+
+
+def config_option(
+    key: str, help: str, default: Any = ..., prompt: bool = False
+) -> Any:
+    """Creates a typer Option that defaults to a value from the current repo's
+    config. The config is only read when the command using the option is run.
+
+    Args:
+        key (str): The config key holding the default.
+        help (str): The help text of the option.
+        default (Any, optional): The value to suggest if the key isn't set.
+            Defaults to ..., which doesn't suggest anything.
+        prompt (bool, optional): Whether to always prompt, suggesting the
+            configured value. Otherwise the user is only prompted if the key
+            isn't set. Defaults to False.
+
+    Returns:
+        Any: The typer Option.
+    """
+
+    def callback(
+        ctx: typer.Context, param: typer.CallbackParam, value: Optional[Any]
+    ) -> Any:
+        if value is not None or ctx.resilient_parsing:
+            return value
+        repo_config = get_current_repo_config()
+        if key in repo_config and not prompt:
+            return repo_config[key]
+        suggestion = repo_config.get(key, default)
+        return typer.prompt(
+            str(param.name).replace("_", " ").capitalize(),
+            default=None if suggestion is ... else suggestion,
+        )
+
+    return typer.Option(None, help=help, callback=callback)
@@ -1,40 +1,168 @@
+import configparser
+import os
+import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Union
+from typing import Optional
 
-# import typer
-from git import InvalidGitRepositoryError, NoSuchPathError, Repo
-from git.remote import Remote
-from git.util import IterableList
+# The environment variable that selects a remote when there are several
+REMOTE_ENV_VAR = "CI_PLUMBER_REMOTE"
 
+# The remote to fall back to when there are several and none was selected
+DEFAULT_REMOTE = "origin"
+
+_REMOTE_SECTION = re.compile(r'^remote\s+"(?P<name>.+)"$')
 
-def get_repo(git_dir: Path = Path.cwd()) -> str:
-    """Gets a repo remote from a directory
+
+class RepoContext:
+    """The git repo that ci-plumber is being run in.
 
     Args:
-        dir (Path): The path to the directory to get the repo from
+        root (Optional[Path]): The root of the working tree, or None if not in
+            a git repo.
+        remotes (dict[str, str]): The URLs of the repo's remotes, keyed by
+            name.
+    """
+
+    def __init__(self, root: Optional[Path], remotes: dict[str, str]) -> None:
+        self.root = root
+        self.remotes = remotes
+
+    def remote(self, name: Optional[str] = None) -> str:
+        """Gets the URL of one of the repo's remotes
+
+        Args:
+            name (Optional[str], optional): The name of the remote. Defaults
+                to the remote named by CI_PLUMBER_REMOTE, the only remote, or
+                origin, in that order.
+
+        Raises:
+            KeyError: If the remote doesn't exist or can't be chosen.
+
+        Returns:
+            str: The URL of the remote
+        """
+        name = name or os.environ.get(REMOTE_ENV_VAR)
+        if name is None:
+            if len(self.remotes) == 1:
+                return next(iter(self.remotes.values()))
+            name = DEFAULT_REMOTE
+        if name not in self.remotes:
+            raise KeyError(
+                f"Remote '{name}' not found. Found: "
+                f"{', '.join(self.remotes) or 'no remotes'}"
+            )
+        return self.remotes[name]
+
+
+def find_git_dir(path: Path) -> tuple[Optional[Path], Optional[Path]]:
+    """Finds the working tree root and the git directory holding the config
+    for a path
+
+    Args:
+        path (Path): A path inside the working tree
 
     Returns:
-        str: The repo remote
+        tuple[Optional[Path], Optional[Path]]: The root of the working tree
+            and the git directory, or None if the path isn't in a repo.
+    """
+    for directory in [path, *path.parents]:
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            return directory, dot_git
+        if dot_git.is_file():
+            # Worktrees and submodules point to their git directory
+            content = dot_git.read_text().strip()
+            if not content.startswith("gitdir:"):
+                return directory, None
+            git_dir = (directory / content[len("gitdir:") :].strip()).resolve()
+            # Worktrees share the config of the main repo
+            common_dir = git_dir / "commondir"
+            if common_dir.is_file():
+                git_dir = (git_dir / common_dir.read_text().strip()).resolve()
+            return directory, git_dir
+    return None, None
+
+
+def read_remotes(git_dir: Path) -> Optional[dict[str, str]]:
+    """Reads the remotes straight from the repo's config file
+
+    Args:
+        git_dir (Path): The git directory
+
+    Returns:
+        Optional[dict[str, str]]: The URLs of the remotes keyed by name, or
+            None if the config can't be read without git.
+    """
+    parser = configparser.RawConfigParser(
+        strict=False, inline_comment_prefixes=("#", ";")
+    )
+    try:
+        with (git_dir / "config").open("r") as fp:
+            parser.read_file(fp)
+    except (OSError, configparser.Error):
+        return None
+
+    remotes: dict[str, str] = {}
+    for section in parser.sections():
+        if section.split(" ")[0].lower() in ("include", "includeif"):
+            # Included files can define remotes too
+            return None
+        match = _REMOTE_SECTION.match(section)
+        if match and parser.has_option(section, "url"):
+            remotes[match["name"]] = parser.get(section, "url").strip('"')
+    return remotes
+
+
+def read_remotes_with_gitpython(path: Path) -> dict[str, str]:
+    """Reads the remotes using GitPython, for configs that can't be read
+    directly
+
+    Args:
+        path (Path): A path inside the working tree
+
+    Returns:
+        dict[str, str]: The URLs of the remotes keyed by name
     """
-    # Get the repo
-    remotes: Union[IterableList[Remote], None] = None
+    from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+
     try:
-        repo: Repo = Repo(git_dir)
+        repo: Repo = Repo(path, search_parent_directories=True)
         assert not repo.bare
-        remotes = repo.remotes
+        return {remote.name: remote.url for remote in repo.remotes}
     except (InvalidGitRepositoryError, NoSuchPathError, AssertionError):
-        # typer.echo(
-        #     "This directory is not a Git repository. Please run 'git init'"
-        #     " first"
-        # )
-        ...
-
-    # Get the remote
-    remote: str = ""
-    if remotes and len(remotes) == 1:
-        # Get the remote
-        remote = remotes[0].url
-    else:
-        # TODO Allow for multiple remotes
-        raise KeyError("Found multiple/no remotes")
-    return remote
+        return {}
+
+
+@lru_cache(maxsize=None)
+def get_repo_context(git_dir: Path = Path.cwd()) -> RepoContext:
+    """Gets the repo a directory is in. This is resolved once per process.
+
+    Args:
+        git_dir (Path): A path inside the repo
+
+    Returns:
+        RepoContext: The repo
+    """
+    root, config_dir = find_git_dir(git_dir.resolve())
+    remotes = read_remotes(config_dir) if config_dir else None
+    if root and remotes is None:
+        remotes = read_remotes_with_gitpython(root)
+    return RepoContext(root, remotes or {})
+
+
+def get_repo(git_dir: Path = Path.cwd(), remote: Optional[str] = None) -> str:
+    """Gets a repo remote from a directory
+
+    Args:
+        dir (Path): The path to the directory to get the repo from
+        remote (Optional[str], optional): The name of the remote to use. See
+            RepoContext.remote.
+
+    Raises:
+        KeyError: If the remote can't be found.
+
+    Returns:
+        str: The repo remote
+    """
+    return get_repo_context(git_dir).remote(remote)
@@ -0,0 +1,282 @@
+import json
+import subprocess
+import tempfile
+from time import sleep
+from typing import Any, Generator, Iterable, Iterator, Optional
+
+from ci_plumber.helpers.run_command import (
+    CommandError,
+    RetryPolicy,
+    backoff_delays,
+    get_retry_policy,
+    is_transient,
+)
+
+# How much of a command's output is read at a time
+CHUNK_SIZE = 2 ** 16
+
+_WHITESPACE = " \t\n\r"
+
+# Characters that may continue a number that was cut off at the end of a chunk
+_NUMBER = set("0123456789.eE+-")
+
+
+class _JsonReader:
+    """Reads JSON values one at a time from chunks of text, so that only the
+    value being read is held in memory."""
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+
+    def _read(self) -> bool:
+        """Reads another chunk into the buffer
+
+        Returns:
+            bool: False if there is nothing left to read.
+        """
+        if self.exhausted:
+            return False
+        self.buffer = self.buffer[self.position :]
+        self.position = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += chunk
+                return True
+        self.exhausted = True
+        return False
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character, or "" at the end
+        of the input"""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in _WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        """Consumes the next character, which must be one of `characters`
+
+        Raises:
+            ValueError: If the next character is something else.
+
+        Returns:
+            str: The character.
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(
+                f"Expected one of {characters!r} in JSON, got "
+                f"{character or 'the end of the output'!r}"
+            )
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        """Reads the next JSON value
+
+        Raises:
+            ValueError: If the value isn't valid JSON.
+
+        Returns:
+            Any: The value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+            # A number may continue in the next chunk
+            if (
+                isinstance(value, (int, float))
+                and _NUMBER.issuperset(self.buffer[end:])
+                and self._read()
+            ):
+                continue
+            self.position = end
+            return value
+
+
+def iter_json_items(chunks: Iterable[str]) -> Iterator[Any]:
+    """Yields the items of a JSON array as they are parsed
+
+    Args:
+        chunks (Iterable[str]): The JSON text, in chunks of any size.
+
+    Raises:
+        ValueError: If the text isn't a JSON array.
+
+    Yields:
+        Iterator[Any]: The items of the array. Nothing is yielded for empty
+            input.
+    """
+    reader = _JsonReader(chunks)
+    if not reader.peek():
+        return
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return
+
+
+def extract_json_keys(
+    chunks: Iterable[str], keys: Iterable[str]
+) -> dict[str, Any]:
+    """Gets some of the top level keys of a JSON object. Reading stops as soon
+    as they have all been found.
+
+    Args:
+        chunks (Iterable[str]): The JSON text, in chunks of any size.
+        keys (Iterable[str]): The keys to get.
+
+    Raises:
+        ValueError: If the text isn't a JSON object.
+        KeyError: If one of the keys isn't in the object.
+
+    Returns:
+        dict[str, Any]: The values of the keys.
+    """
+    wanted = set(keys)
+    found: dict[str, Any] = {}
+    reader = _JsonReader(chunks)
+    reader.expect("{")
+    if reader.peek() != "}":
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            value = reader.value()
+            if key in wanted:
+                found[key] = value
+                if len(found) == len(wanted):
+                    return found
+            if reader.expect(",}") == "}":
+                break
+    missing = wanted - found.keys()
+    if missing:
+        raise KeyError(", ".join(sorted(missing)))
+    return found
+
+
+def command_chunks(command: str) -> Generator[str, None, None]:
+    """Runs a command and yields its STDOUT in chunks as it arrives. STDERR
+    is kept aside for error reporting. If the generator is closed early, the
+    command is killed.
+
+    Args:
+        command (str): The command to run.
+
+    Raises:
+        CommandError: If the command fails.
+
+    Yields:
+        Generator[str, None, None]: Chunks of STDOUT.
+    """
+    with tempfile.TemporaryFile("w+") as stderr, subprocess.Popen(
+        command.split(), stdout=subprocess.PIPE, stderr=stderr, text=True
+    ) as process:
+        assert process.stdout is not None
+        try:
+            while True:
+                chunk = process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        except GeneratorExit:
+            process.kill()
+            raise
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise CommandError(command, process.returncode, stderr.read())
+
+
+def _retry_failure(
+    error: CommandError, delays: Iterator[float], policy: RetryPolicy
+) -> None:
+    """Waits before retrying a failed command, or re-raises its error if the
+    failure isn't worth retrying"""
+    delay = next(delays, None)
+    if delay is None or not is_transient(error.stderr, policy):
+        raise error
+    sleep(delay)
+
+
+def stream_json_array(
+    command: str, retry: Optional[RetryPolicy] = None
+) -> Iterator[Any]:
+    """Runs a command that prints a JSON array, such as `az account list`,
+    and yields the items as they are parsed
+
+    Args:
+        command (str): The command to run.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures that happen before any items are read. Defaults to the
+            policy for the command.
+
+    Raises:
+        CommandError: If the command fails.
+
+    Yields:
+        Iterator[Any]: The items of the array.
+    """
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        read_any = False
+        try:
+            for item in iter_json_items(command_chunks(command)):
+                read_any = True
+                yield item
+            return
+        except CommandError as error:
+            if read_any:
+                raise
+            _retry_failure(error, delays, policy)
+
+
+def read_json_keys(
+    command: str, keys: Iterable[str], retry: Optional[RetryPolicy] = None
+) -> dict[str, Any]:
+    """Runs a command that prints a JSON object, such as `az acr create`, and
+    gets some of its top level keys without parsing the rest
+
+    Args:
+        command (str): The command to run.
+        keys (Iterable[str]): The keys to get.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures. Defaults to the policy for the command.
+
+    Raises:
+        CommandError: If the command fails.
+        KeyError: If one of the keys isn't in the output.
+
+    Returns:
+        dict[str, Any]: The values of the keys.
+    """
+    keys = list(keys)
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        chunks = command_chunks(command)
+        try:
+            return extract_json_keys(chunks, keys)
+        except CommandError as error:
+            _retry_failure(error, delays, policy)
+        finally:
+            chunks.close()
@@ -0,0 +1,130 @@
+import asyncio
+import random
+from time import monotonic, sleep
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class WaitTimeoutError(TimeoutError):
+    """Raised when a condition isn't met before the deadline"""
+
+    def __init__(self, description: str, timeout: float) -> None:
+        super().__init__(
+            f"Timed out after {timeout:.0f}s waiting for {description}"
+        )
+        self.description = description
+        self.timeout = timeout
+
+
+def poll_delays(
+    base_delay: float = 1.0, max_delay: float = 15.0
+) -> Iterator[float]:
+    """Generates the delays between checks, using exponential backoff with
+    jitter. Unlike a retry policy, there is no limit on the number of checks;
+    the caller's deadline ends them.
+
+    Args:
+        base_delay (float, optional): The delay before the second check, in
+            seconds. It doubles with each check. Defaults to 1.0.
+        max_delay (float, optional): The longest delay between checks, in
+            seconds. Defaults to 15.0.
+
+    Yields:
+        Iterator[float]: The delay before each check, in seconds.
+    """
+    delay = base_delay
+    while True:
+        yield delay / 2 + random.uniform(0, delay / 2)
+        delay = min(max_delay, delay * 2)
+
+
+def wait_until(
+    check: Callable[[], Optional[T]],
+    timeout: float,
+    description: str = "the condition",
+    base_delay: float = 1.0,
+    max_delay: float = 15.0,
+    retry_on: tuple[type[Exception], ...] = (),
+) -> T:
+    """Calls check until it returns something truthy, backing off between
+    calls. It is checked straight away, and once more at the deadline.
+
+    Args:
+        check (Callable[[], Optional[T]]): Returns a falsy value while the
+            condition isn't met.
+        timeout (float): How long to wait, in seconds.
+        description (str, optional): What is being waited for, for the
+            error. Defaults to "the condition".
+        base_delay (float, optional): The first delay, in seconds. Defaults
+            to 1.0.
+        max_delay (float, optional): The longest delay, in seconds. Defaults
+            to 15.0.
+        retry_on (tuple[type[Exception], ...], optional): Exceptions that
+            mean the condition isn't met yet, rather than that it failed.
+            Defaults to ().
+
+    Raises:
+        WaitTimeoutError: If the condition isn't met in time.
+
+    Returns:
+        T: What check returned.
+    """
+    deadline = monotonic() + timeout
+    for delay in poll_delays(base_delay, max_delay):
+        try:
+            result = check()
+            if result:
+                return result
+        except retry_on:
+            pass
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise WaitTimeoutError(description, timeout)
+        sleep(min(delay, remaining))
+    raise AssertionError("poll_delays never ends")
+
+
+async def wait_until_async(
+    check: Callable[[], Awaitable[Optional[T]]],
+    timeout: float,
+    description: str = "the condition",
+    base_delay: float = 1.0,
+    max_delay: float = 15.0,
+    retry_on: tuple[type[Exception], ...] = (),
+) -> T:
+    """Awaits check until it returns something truthy, backing off between
+    calls without blocking the event loop. See wait_until.
+
+    Args:
+        check (Callable[[], Awaitable[Optional[T]]]): Returns a falsy value
+            while the condition isn't met.
+        timeout (float): How long to wait, in seconds.
+        description (str, optional): What is being waited for, for the
+            error. Defaults to "the condition".
+        base_delay (float, optional): The first delay, in seconds. Defaults
+            to 1.0.
+        max_delay (float, optional): The longest delay, in seconds. Defaults
+            to 15.0.
+        retry_on (tuple[type[Exception], ...], optional): Exceptions that
+            mean the condition isn't met yet. Defaults to ().
+
+    Raises:
+        WaitTimeoutError: If the condition isn't met in time.
+
+    Returns:
+        T: What check returned.
+    """
+    deadline = monotonic() + timeout
+    for delay in poll_delays(base_delay, max_delay):
+        try:
+            result = await check()
+            if result:
+                return result
+        except retry_on:
+            pass
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise WaitTimeoutError(description, timeout)
+        await asyncio.sleep(min(delay, remaining))
+    raise AssertionError("poll_delays never ends")
@@ -1,26 +1,337 @@
+import asyncio
+import random
+import re
 import subprocess
 from time import sleep
+from typing import Awaitable, Iterable, Iterator, NamedTuple, Optional, TypeVar
 
 from rich.console import Console
 
+# Errors that are worth retrying for any command
+TRANSIENT_ERRORS = (
+    r"connection (refused|reset|timed out)",
+    r"i/o timeout",
+    r"tls handshake timeout",
+    r"temporarily unavailable",
+    r"service ?unavailable",
+    r"too many requests",
+    r"\b(429|502|503|504)\b",
+    r"try again",
+    r"please retry",
+    r"the object has been modified",
+)
 
-def run_command(command: str) -> str:
+
+T = TypeVar("T")
+
+
+class CommandError(Exception):
+    """Raised when a command that is checked fails, after any retries."""
+
+    def __init__(self, command: str, returncode: int, stderr: str) -> None:
+        super().__init__(f"'{command}' failed with exit code {returncode}")
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class CommandTimeoutError(TimeoutError):
+    """Raised when a command doesn't finish before its timeout. The command
+    is killed before this is raised."""
+
+    def __init__(self, command: str, timeout: float) -> None:
+        super().__init__(f"'{command}' timed out after {timeout}s")
+        self.command = command
+        self.timeout = timeout
+
+
+class RetryPolicy(NamedTuple):
+    """How a command is retried when it fails with a transient error.
+
+    Args:
+        attempts (int): The maximum number of times to run the command.
+        base_delay (float): The delay before the first retry, in seconds. It
+            doubles with each retry.
+        max_delay (float): The longest delay between retries, in seconds.
+        patterns (tuple[str, ...]): Regexes matching the stderr of failures
+            that are worth retrying.
+    """
+
+    attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 16.0
+    patterns: tuple[str, ...] = TRANSIENT_ERRORS
+
+
+# Commands that need more than the default policy, keyed by prefix
+COMMAND_RETRY_POLICIES: dict[str, RetryPolicy] = {
+    # The service accounts of a new project are created in the background
+    "oc secrets link": RetryPolicy(
+        attempts=6, patterns=TRANSIENT_ERRORS + (r"not found",)
+    ),
+    "oc patch serviceaccount": RetryPolicy(
+        attempts=6, patterns=TRANSIENT_ERRORS + (r"not found",)
+    ),
+    # So is the project itself
+    "oc create secret": RetryPolicy(
+        attempts=6, patterns=TRANSIENT_ERRORS + (r"forbidden", r"not found")
+    ),
+    "oc new-app": RetryPolicy(
+        attempts=6, patterns=TRANSIENT_ERRORS + (r"forbidden",)
+    ),
+    # New identities take a while to propagate through Azure AD
+    "az role assignment create": RetryPolicy(
+        attempts=6,
+        base_delay=2.0,
+        max_delay=30.0,
+        patterns=TRANSIENT_ERRORS
+        + (r"does not exist in the directory", r"PrincipalNotFound"),
+    ),
+}
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def get_retry_policy(command: str) -> RetryPolicy:
+    """Gets the retry policy for a command
+
+    Args:
+        command (str): The command to run.
+
+    Returns:
+        RetryPolicy: The policy of the longest matching prefix, or the default
+            policy.
+    """
+    matches = [
+        prefix
+        for prefix in COMMAND_RETRY_POLICIES
+        if command.startswith(prefix)
+    ]
+    if not matches:
+        return DEFAULT_RETRY_POLICY
+    return COMMAND_RETRY_POLICIES[max(matches, key=len)]
+
+
+def backoff_delays(policy: RetryPolicy) -> Iterator[float]:
+    """Generates the delays between attempts, using exponential backoff with
+    jitter so that parallel jobs don't retry in lockstep.
+
+    Args:
+        policy (RetryPolicy): The retry policy.
+
+    Yields:
+        Iterator[float]: The delay before each retry, in seconds.
+    """
+    for attempt in range(policy.attempts - 1):
+        delay = min(policy.max_delay, policy.base_delay * 2 ** attempt)
+        yield delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_transient(stderr: str, policy: RetryPolicy) -> bool:
+    """Checks whether a failure is worth retrying
+
+    Args:
+        stderr (str): STDERR of the failed command.
+        policy (RetryPolicy): The retry policy.
+
+    Returns:
+        bool: Whether the failure matches one of the policy's patterns.
+    """
+    return any(
+        re.search(pattern, stderr, re.IGNORECASE)
+        for pattern in policy.patterns
+    )
+
+
+def run_command(
+    command: str,
+    retry: Optional[RetryPolicy] = None,
+    timeout: Optional[float] = None,
+    check: bool = False,
+) -> str:
     """Runs a command and returns the output.
 
     Args:
         command (str): The command to run.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures. Defaults to the policy for the command.
+        timeout (Optional[float], optional): How long each attempt may take,
+            in seconds. Defaults to no limit.
+        check (bool, optional): Whether to raise if the command fails.
+            Otherwise the failure is logged. Defaults to False.
+
+    Raises:
+        CommandTimeoutError: If the command doesn't finish in time.
+        CommandError: If the command fails and check is set.
 
     Returns:
         str: STDOUT of the command.
     """
-    sleep(2)  # Most commands seem to benefit from this delay
     console = Console()
-    output = subprocess.run(command.split(), capture_output=True, text=True)
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        try:
+            output = subprocess.run(
+                command.split(),
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise CommandTimeoutError(command, timeout or 0)
+        if output.returncode == 0:
+            break
+        delay = next(delays, None)
+        if delay is None or not is_transient(output.stderr, policy):
+            console.log("[bold red]Command failed:[/bold red]")
+            console.log(output.stderr)
+            if check:
+                raise CommandError(command, output.returncode, output.stderr)
+            break
+        console.log(f"[dim]Command failed, retrying in {delay:.1f}s")
+        sleep(delay)
+    return output.stdout + output.stderr
+
+
+async def run_command_async(
+    command: str,
+    retry: Optional[RetryPolicy] = None,
+    timeout: Optional[float] = None,
+    check: bool = False,
+) -> str:
+    """Runs a command without blocking the event loop and returns the output.
+    If the task is cancelled, the command is killed.
+
+    Args:
+        command (str): The command to run.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures. Defaults to the policy for the command.
+        timeout (Optional[float], optional): How long each attempt may take,
+            in seconds. Defaults to no limit.
+        check (bool, optional): Whether to raise if the command fails.
+            Otherwise the failure is logged. Defaults to False.
+
+    Raises:
+        CommandTimeoutError: If the command doesn't finish in time.
+        CommandError: If the command fails and check is set.
+
+    Returns:
+        str: STDOUT of the command.
+    """
+    console = Console()
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        process = await asyncio.create_subprocess_exec(
+            *command.split(),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(), timeout
+            )
+        except asyncio.TimeoutError:
+            await _kill(process)
+            raise CommandTimeoutError(command, timeout or 0)
+        except asyncio.CancelledError:
+            await _kill(process)
+            raise
+        output = stdout.decode() + stderr.decode()
+        if process.returncode == 0:
+            return output
+        delay = next(delays, None)
+        if delay is None or not is_transient(stderr.decode(), policy):
+            console.log("[bold red]Command failed:[/bold red]")
+            console.log(stderr.decode())
+            if check:
+                raise CommandError(
+                    command, process.returncode or 1, stderr.decode()
+                )
+            return output
+        console.log(f"[dim]Command failed, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+async def probe_command_async(command: str) -> Optional[str]:
+    """Runs a command that checks something, without retrying or logging
+    failures, e.g. to poll until a resource exists.
+
+    Args:
+        command (str): The command to run.
 
+    Returns:
+        Optional[str]: STDOUT of the command, or None if it failed.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command.split(),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
     try:
-        output.check_returncode()
-    except subprocess.CalledProcessError:
-        console.log("[bold red]Command failed:[/bold red]")
-        console.log(output.stderr)
-        # console.print_exception(show_locals=True)
-    return output.stdout + output.stderr
+        stdout, _ = await process.communicate()
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+    return stdout.decode() if process.returncode == 0 else None
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    """Kills a process if it is still running and reaps it"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+async def gather_limited(
+    awaitables: Iterable[Awaitable[T]], limit: int = 4
+) -> list[T]:
+    """Runs awaitables concurrently, with at most `limit` running at once.
+    If one of them fails, the rest are cancelled.
+
+    Args:
+        awaitables (Iterable[Awaitable[T]]): The awaitables to run.
+        limit (int, optional): The most to run at once. Defaults to 4.
+
+    Returns:
+        list[T]: The results, in the same order as the awaitables.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(awaitable: Awaitable[T]) -> T:
+        async with semaphore:
+            return await awaitable
+
+    tasks = [asyncio.ensure_future(limited(a)) for a in awaitables]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run_commands(
+    commands: Iterable[str], limit: int = 4, timeout: Optional[float] = None
+) -> list[str]:
+    """Runs independent commands concurrently and returns their outputs.
+
+    Args:
+        commands (Iterable[str]): The commands to run.
+        limit (int, optional): The most to run at once. Defaults to 4.
+        timeout (Optional[float], optional): How long each command may take,
+            in seconds. Defaults to no limit.
+
+    Returns:
+        list[str]: The output of each command, in order.
+    """
+    return asyncio.run(
+        gather_limited(
+            (run_command_async(c, timeout=timeout) for c in commands), limit
+        )
+    )
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Iterable
+
+# The name of the SQLite config store, next to config.json
+SQLITE_CONFIG_FILE = "config.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (
+    remote TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (remote, key)
+) WITHOUT ROWID
+"""
+
+
+def is_sqlite_config(config_path: Path) -> bool:
+    """Checks whether a config path points to a SQLite store
+
+    Args:
+        config_path (Path): The path to the config file
+
+    Returns:
+        bool: Whether the config is stored in SQLite
+    """
+    return config_path.suffix == ".db"
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Opens the SQLite config store, creating it if it doesn't exist
+
+    Args:
+        db_path (Path): The path to the database
+
+    Returns:
+        sqlite3.Connection: The connection to the database
+    """
+    connection = sqlite3.connect(db_path, timeout=30)
+    # WAL lets readers carry on while another process is writing
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def load_remote(db_path: Path, remote: str) -> dict[str, Any]:
+    """Loads the config of one remote
+
+    Args:
+        db_path (Path): The path to the database
+        remote (str): The remote to use
+
+    Returns:
+        dict[str, Any]: The remote's config
+    """
+    with closing(connect(db_path)) as connection:
+        rows = connection.execute(
+            "SELECT key, value FROM config WHERE remote = ?", (remote,)
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+
+def get_value(db_path: Path, remote: str, key: str) -> Any:
+    """Gets a single config value
+
+    Args:
+        db_path (Path): The path to the database
+        remote (str): The remote to use
+        key (str): The key for the config value
+
+    Raises:
+        KeyError: If the key isn't set
+
+    Returns:
+        Any: The value corresponding to the key
+    """
+    with closing(connect(db_path)) as connection:
+        row = connection.execute(
+            "SELECT value FROM config WHERE remote = ? AND key = ?",
+            (remote, key),
+        ).fetchone()
+    if row is None:
+        raise KeyError(key)
+    return json.loads(row[0])
+
+
+def set_values(db_path: Path, repos: dict[str, dict[str, Any]]) -> None:
+    """Sets config values in a single transaction. Keys that aren't given
+    are left as they are.
+
+    Args:
+        db_path (Path): The path to the database
+        repos (dict[str, dict[str, Any]]): The values to set, keyed by remote
+            and then by key
+    """
+    with closing(connect(db_path)) as connection, connection:
+        connection.executemany(
+            "INSERT INTO config (remote, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (remote, key) DO UPDATE SET value = excluded.value",
+            [
+                (remote, key, json.dumps(value))
+                for remote, values in repos.items()
+                for key, value in values.items()
+            ],
+        )
+
+
+def delete_values(db_path: Path, remote: str, keys: Iterable[str]) -> None:
+    """Deletes config values in a single transaction
+
+    Args:
+        db_path (Path): The path to the database
+        remote (str): The remote whose values are deleted
+        keys (Iterable[str]): The keys to delete
+    """
+    with closing(connect(db_path)) as connection, connection:
+        connection.executemany(
+            "DELETE FROM config WHERE remote = ? AND key = ?",
+            [(remote, key) for key in keys],
+        )
+
+
+def migrate_json_config(json_path: Path, db_path: Path) -> int:
+    """Copies every repo's config from config.json into the SQLite store.
+    The JSON file is renamed to config.json.bak afterwards.
+
+    Args:
+        json_path (Path): The path to config.json
+        db_path (Path): The path to the database
+
+    Returns:
+        int: The number of remotes migrated
+    """
+    with json_path.open("r") as fp:
+        config: dict[str, dict[str, dict[str, Any]]] = json.load(fp)
+    set_values(db_path, config["repos"])
+    json_path.replace(json_path.with_name(json_path.name + ".bak"))
+    return len(config["repos"])
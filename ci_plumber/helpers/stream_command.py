@@ -0,0 +1,281 @@
+import asyncio
+import subprocess
+from collections import deque
+from pathlib import Path
+from time import sleep
+from typing import IO, Generator, Optional
+
+from rich.console import Console
+from rich.markup import escape
+from rich.status import Status
+
+from ci_plumber.helpers.run_command import (
+    CommandError,
+    RetryPolicy,
+    _kill,
+    backoff_delays,
+    get_retry_policy,
+    is_transient,
+)
+
+# How many lines of output are kept for error reporting
+BUFFER_LINES = 200
+
+# How many lines at the end of the output are logged on failure and checked
+# for transient errors. Earlier lines are usually progress, not the error.
+ERROR_LINES = 20
+
+# asyncio's default of 64KiB is too small for the single line JSON that some
+# commands print
+_LINE_LIMIT = 2 ** 20
+
+
+class LiveTail:
+    """Shows the last few lines of a running command's output under a
+    console.status spinner.
+
+    Args:
+        status (Optional[Status]): The spinner to show the output under. If
+            None, nothing is shown.
+        lines (int, optional): How many lines to show. Defaults to 3.
+    """
+
+    def __init__(self, status: Optional[Status], lines: int = 3) -> None:
+        self.status = status
+        self.message = str(status.status) if status else ""
+        self.lines: deque[str] = deque(maxlen=lines)
+
+    def feed(self, line: str) -> None:
+        """Adds a line of output to the tail
+
+        Args:
+            line (str): The line of output.
+        """
+        if self.status is None:
+            return
+        self.lines.append(line.rstrip()[:120])
+        tail = "\n".join(escape(line) for line in self.lines)
+        self.status.update(f"{self.message}\n[dim]{tail}[/dim]")
+
+    def clear(self) -> None:
+        """Stops showing output under the spinner"""
+        self.lines.clear()
+        if self.status is not None:
+            self.status.update(self.message)
+
+
+def _tee(
+    line: str,
+    buffer: deque[str],
+    tail: Optional[LiveTail],
+    log: Optional[IO[str]],
+) -> None:
+    """Passes a line of a command's output to wherever it is kept or shown
+
+    Args:
+        line (str): The line, including its newline.
+        buffer (deque[str]): The last lines of output, which are kept as the
+            command's result.
+        tail (Optional[LiveTail]): The live tail to show the line in, if any.
+        log (Optional[IO[str]]): The log file to write the line to, if any.
+    """
+    buffer.append(line)
+    if tail:
+        tail.feed(line)
+    if log:
+        log.write(line)
+
+
+def stream_command(
+    command: str,
+    tail: Optional[LiveTail] = None,
+    log_file: Optional[Path] = None,
+    buffer: Optional[deque[str]] = None,
+) -> Generator[str, None, int]:
+    """Runs a command and yields its output line by line as it arrives.
+    STDERR is merged into STDOUT.
+
+    Args:
+        command (str): The command to run.
+        tail (Optional[LiveTail], optional): Where to show the output live.
+            Defaults to None.
+        log_file (Optional[Path], optional): A file to append the output to.
+            Defaults to None.
+        buffer (Optional[deque[str]], optional): A ring buffer that keeps the
+            last lines of output. Defaults to None.
+
+    Yields:
+        Generator[str, None, int]: The lines of output. The generator returns
+            the exit code of the command.
+    """
+    buffer = buffer if buffer is not None else deque(maxlen=BUFFER_LINES)
+    log = log_file.open("a") if log_file else None
+    try:
+        with subprocess.Popen(
+            command.split(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        ) as process:
+            assert process.stdout is not None
+            try:
+                for line in process.stdout:
+                    _tee(line, buffer, tail, log)
+                    yield line
+            except GeneratorExit:
+                # Stopped reading early, so nothing will drain the pipe
+                process.kill()
+                raise
+        return process.returncode
+    finally:
+        if log:
+            log.close()
+
+
+async def _stream_command_async(
+    command: str,
+    tail: Optional[LiveTail],
+    log_file: Optional[Path],
+    buffer: deque[str],
+) -> int:
+    """Runs a command without blocking the event loop, passing its output to
+    the buffer, tail and log file as it arrives. If the task is cancelled,
+    the command is killed.
+
+    Returns:
+        int: The exit code of the command.
+    """
+    log = log_file.open("a") if log_file else None
+    process = await asyncio.create_subprocess_exec(
+        *command.split(),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        limit=_LINE_LIMIT,
+    )
+    try:
+        assert process.stdout is not None
+        async for line in process.stdout:
+            _tee(line.decode(), buffer, tail, log)
+        return await process.wait()
+    finally:
+        await _kill(process)
+        if log:
+            log.close()
+
+
+def _error_lines(buffer: deque[str]) -> str:
+    return "".join(list(buffer)[-ERROR_LINES:])
+
+
+def _report_failure(
+    console: Console,
+    command: str,
+    returncode: int,
+    buffer: deque[str],
+    check: bool,
+) -> None:
+    console.log("[bold red]Command failed:[/bold red]")
+    console.log(_error_lines(buffer))
+    if check:
+        raise CommandError(command, returncode, "".join(buffer))
+
+
+def run_command_streaming(
+    command: str,
+    tail: Optional[LiveTail] = None,
+    log_file: Optional[Path] = None,
+    retry: Optional[RetryPolicy] = None,
+    check: bool = False,
+) -> str:
+    """Runs a command, showing its output live, and returns the end of the
+    output. Only the last BUFFER_LINES lines are held in memory.
+
+    Args:
+        command (str): The command to run.
+        tail (Optional[LiveTail], optional): Where to show the output live.
+            Defaults to None.
+        log_file (Optional[Path], optional): A file to append the output to.
+            Defaults to None.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures. Defaults to the policy for the command.
+        check (bool, optional): Whether to raise if the command fails.
+            Defaults to False.
+
+    Raises:
+        CommandError: If the command fails and check is set.
+
+    Returns:
+        str: The last lines of output.
+    """
+    console = Console()
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        buffer: deque[str] = deque(maxlen=BUFFER_LINES)
+        lines = stream_command(command, tail, log_file, buffer)
+        while True:
+            try:
+                next(lines)
+            except StopIteration as stop:
+                returncode = stop.value
+                break
+        if tail:
+            tail.clear()
+        output = "".join(buffer)
+        if returncode == 0:
+            return output
+        delay = next(delays, None)
+        if delay is None or not is_transient(_error_lines(buffer), policy):
+            _report_failure(console, command, returncode, buffer, check)
+            return output
+        console.log(f"[dim]Command failed, retrying in {delay:.1f}s")
+        sleep(delay)
+
+
+async def run_command_streaming_async(
+    command: str,
+    tail: Optional[LiveTail] = None,
+    log_file: Optional[Path] = None,
+    retry: Optional[RetryPolicy] = None,
+    check: bool = False,
+) -> str:
+    """Runs a command without blocking the event loop, showing its output
+    live, and returns the end of the output. See run_command_streaming.
+
+    Args:
+        command (str): The command to run.
+        tail (Optional[LiveTail], optional): Where to show the output live.
+            Defaults to None.
+        log_file (Optional[Path], optional): A file to append the output to.
+            Defaults to None.
+        retry (Optional[RetryPolicy], optional): How to retry transient
+            failures. Defaults to the policy for the command.
+        check (bool, optional): Whether to raise if the command fails.
+            Defaults to False.
+
+    Raises:
+        CommandError: If the command fails and check is set.
+
+    Returns:
+        str: The last lines of output.
+    """
+    console = Console()
+    policy = retry or get_retry_policy(command)
+    delays = backoff_delays(policy)
+    while True:
+        buffer: deque[str] = deque(maxlen=BUFFER_LINES)
+        returncode = await _stream_command_async(
+            command, tail, log_file, buffer
+        )
+        if tail:
+            tail.clear()
+        output = "".join(buffer)
+        if returncode == 0:
+            return output
+        delay = next(delays, None)
+        if delay is None or not is_transient(_error_lines(buffer), policy):
+            _report_failure(console, command, returncode, buffer, check)
+            return output
+        console.log(f"[dim]Command failed, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,346 @@
+import asyncio
+import inspect
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from rich.console import Console
+from rich.status import Status
+
+from ci_plumber.helpers.config_helpers import ConfigSession
+from ci_plumber.helpers.git_helpers import get_repo
+from ci_plumber.helpers.run_command import run_command_async
+from ci_plumber.helpers.stream_command import (
+    LiveTail,
+    run_command_streaming_async,
+)
+
+# The results of the steps that have finished, keyed by step name
+Results = dict[str, Any]
+
+# A step's action. It may be a coroutine function or a plain function, which
+# is run in a thread so that it doesn't block the other steps.
+Action = Callable[[Results], Union[Any, Awaitable[Any]]]
+
+
+class WorkflowError(Exception):
+    """Raised when a workflow's steps can't be run, e.g. when they depend on
+    a step that doesn't exist or on each other."""
+
+
+@dataclass
+class Step:
+    """A step of a workflow.
+
+    Args:
+        name (str): The name of the step. Other steps refer to it by this.
+        action (Action): Called with the results of the finished steps once
+            all of the step's requirements have finished.
+        requires (tuple[str, ...]): The steps that must finish first.
+        description (Optional[str]): Logged when the step starts.
+        checkpoint (bool): Whether the step's result is recorded so that it
+            isn't run again when the workflow is resumed. The result must be
+            JSON serialisable.
+    """
+
+    name: str
+    action: Action
+    requires: tuple[str, ...] = ()
+    description: Optional[str] = None
+    checkpoint: bool = True
+
+
+class Checkpoint:
+    """Records the options of a workflow and the results of its finished
+    steps in the repo's config, so that a failed run can be resumed without
+    repeating the steps that already finished.
+
+    Args:
+        name (str): The name of the workflow, e.g. "azure.deploy".
+        resume (bool, optional): Whether to resume the last run rather than
+            starting a new one. Defaults to False.
+        remote (Optional[str], optional): The git remote to store the
+            checkpoint under. Defaults to the current repo's remote. If there
+            isn't one, nothing is recorded.
+        keep (bool, optional): Whether to keep the checkpoint once the
+            workflow has finished, e.g. when it only starts something that a
+            resumed run waits for. Defaults to False, which removes it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        resume: bool = False,
+        remote: Optional[str] = None,
+        keep: bool = False,
+    ):
+        self.key = f"workflows.{name}"
+        self.resume = resume
+        self.keep = keep
+        try:
+            self.remote: Optional[str] = remote or get_repo()
+        except KeyError:
+            self.remote = None
+        self.options: dict[str, Any] = {}
+        self.results: Results = {}
+
+    def start(self, options: dict[str, Any]) -> dict[str, Any]:
+        """Starts a run of the workflow. When resuming, the options and
+        results of the last run are loaded instead.
+
+        Args:
+            options (dict[str, Any]): The options of this run.
+
+        Returns:
+            dict[str, Any]: The options to use. When resuming, these are the
+                options of the last run.
+        """
+        last_run: Optional[dict[str, Any]] = None
+        if self.resume and self.remote:
+            try:
+                last_run = ConfigSession(self.remote).get(self.key)
+            except KeyError:
+                pass
+        if last_run:
+            self.options = {**options, **last_run["options"]}
+            self.results = last_run["results"]
+        else:
+            self.options = options
+            self.results = {}
+            self._save()
+        return self.options
+
+    def record(self, step: str, result: Any) -> None:
+        """Records the result of a finished step
+
+        Args:
+            step (str): The name of the step.
+            result (Any): The result of the step.
+        """
+        self.results[step] = result
+        self._save()
+
+    def finish(self) -> None:
+        """Removes the checkpoint once the workflow has finished, unless it
+        is kept, so that the results of old runs don't pile up in the
+        config"""
+        if self.remote and not self.keep:
+            with ConfigSession(self.remote) as config:
+                config.delete(self.key)
+
+    def _save(self) -> None:
+        if self.remote:
+            with ConfigSession(self.remote) as config:
+                config.set(
+                    self.key,
+                    {"options": self.options, "results": self.results},
+                )
+
+
+class Workflow:
+    """Runs steps as soon as the steps they require have finished, so that
+    independent steps run in parallel.
+
+    Args:
+        console (Optional[Console], optional): The console to log the steps'
+            descriptions to. Defaults to a new console.
+        limit (int, optional): The most steps to run at once. Defaults to 4.
+        verbose (bool, optional): Whether to log the result of each step.
+            Defaults to False.
+        checkpoint (Optional[Checkpoint], optional): Where to record the
+            results of finished steps. Steps whose results have been recorded
+            aren't run again. Defaults to None.
+        status (Optional[Status], optional): The spinner to show the output
+            of streamed commands under. Defaults to None.
+        log_file (Optional[Path], optional): A file to append the output of
+            streamed commands to. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        console: Optional[Console] = None,
+        limit: int = 4,
+        verbose: bool = False,
+        checkpoint: Optional[Checkpoint] = None,
+        status: Optional[Status] = None,
+        log_file: Optional[Path] = None,
+    ):
+        self.console = console or Console()
+        self.limit = limit
+        self.verbose = verbose
+        self.checkpoint = checkpoint
+        self.tail = LiveTail(status) if status else None
+        self.log_file = log_file
+        self.steps: dict[str, Step] = {}
+
+    def add(
+        self,
+        name: str,
+        action: Action,
+        requires: tuple[str, ...] = (),
+        description: Optional[str] = None,
+        checkpoint: bool = True,
+    ) -> None:
+        """Adds a step to the workflow
+
+        Args:
+            name (str): The name of the step.
+            action (Action): Called with the results of the finished steps.
+            requires (tuple[str, ...], optional): The steps that must finish
+                first. Defaults to ().
+            description (Optional[str], optional): Logged when the step
+                starts. Defaults to None.
+            checkpoint (bool, optional): Whether the step's result is
+                recorded in the workflow's checkpoint. Defaults to True.
+        """
+        if name in self.steps:
+            raise WorkflowError(f"Step '{name}' has already been added")
+        self.steps[name] = Step(
+            name, action, requires, description, checkpoint
+        )
+
+    def add_command(
+        self,
+        name: str,
+        command: Union[str, Callable[[Results], str]],
+        requires: tuple[str, ...] = (),
+        description: Optional[str] = None,
+        check: bool = False,
+        stream: bool = False,
+    ) -> None:
+        """Adds a step that runs a command. Its result is the command's
+        output.
+
+        Args:
+            name (str): The name of the step.
+            command (Union[str, Callable[[Results], str]]): The command, or a
+                function building the command from the results of the
+                finished steps.
+            requires (tuple[str, ...], optional): The steps that must finish
+                first. Defaults to ().
+            description (Optional[str], optional): Logged when the step
+                starts. Defaults to None.
+            check (bool, optional): Whether the workflow stops if the command
+                fails. Otherwise the failure is only logged, and the step
+                isn't checkpointed, so that a resumed run tries it again.
+                Defaults to False.
+            stream (bool, optional): Whether to show the command's output
+                while it runs and tee it to the workflow's log file. Only
+                the last lines of output are kept as the result, so it
+                shouldn't be used for commands whose output is parsed.
+                Defaults to False.
+        """
+
+        async def action(results: Results) -> str:
+            line = command(results) if callable(command) else command
+            if stream:
+                return await run_command_streaming_async(
+                    line, self.tail, self.log_file, check=check
+                )
+            return await run_command_async(line, check=check)
+
+        self.add(name, action, requires, description, checkpoint=check)
+
+    def validate(self) -> None:
+        """Checks that every requirement exists and that there are no cycles
+
+        Raises:
+            WorkflowError: If the steps can't be run.
+        """
+        for step in self.steps.values():
+            for requirement in step.requires:
+                if requirement not in self.steps:
+                    raise WorkflowError(
+                        f"Step '{step.name}' requires unknown step "
+                        f"'{requirement}'"
+                    )
+        done: set[str] = set()
+        remaining = dict(self.steps)
+        while remaining:
+            ready = [
+                name
+                for name, step in remaining.items()
+                if done.issuperset(step.requires)
+            ]
+            if not ready:
+                raise WorkflowError(
+                    f"Steps {', '.join(remaining)} depend on each other"
+                )
+            for name in ready:
+                done.add(name)
+                del remaining[name]
+
+    async def _run_step(self, step: Step, results: Results) -> Any:
+        if step.description:
+            self.console.log(step.description)
+        if inspect.iscoroutinefunction(step.action):
+            result = await step.action(results)
+        else:
+            result = await asyncio.to_thread(step.action, results)
+        if self.verbose:
+            self.console.log(result)
+        return result
+
+    async def run_async(self, results: Optional[Results] = None) -> Results:
+        """Runs the workflow. If a step fails, the running steps are
+        cancelled and its exception is raised. Once every step has finished,
+        the checkpoint is removed.
+
+        Args:
+            results (Optional[Results], optional): Results of steps that have
+                already finished, which won't be run again. Defaults to None.
+
+        Returns:
+            Results: The results of every step, keyed by step name.
+        """
+        self.validate()
+        results = dict(results or {})
+        if self.checkpoint:
+            for name, result in self.checkpoint.results.items():
+                if name in self.steps and self.steps[name].checkpoint:
+                    results.setdefault(name, result)
+        pending = {
+            name: step
+            for name, step in self.steps.items()
+            if name not in results
+        }
+        running: dict[asyncio.Task[Any], str] = {}
+        try:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if len(running) >= self.limit:
+                        break
+                    if all(r in results for r in step.requires):
+                        task = asyncio.ensure_future(
+                            self._run_step(step, results)
+                        )
+                        running[task] = name
+                        del pending[name]
+                finished, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    name = running.pop(task)
+                    # Raises the step's exception, if it failed
+                    results[name] = task.result()
+                    if self.checkpoint and self.steps[name].checkpoint:
+                        self.checkpoint.record(name, results[name])
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        if self.checkpoint:
+            self.checkpoint.finish()
+        return results
+
+    def run(self, results: Optional[Results] = None) -> Results:
+        """Runs the workflow from synchronous code. See run_async.
+
+        Args:
+            results (Optional[Results], optional): Results of steps that have
+                already finished. Defaults to None.
+
+        Returns:
+            Results: The results of every step, keyed by step name.
+        """
+        return asyncio.run(self.run_async(results))
@@ -1,6 +1,4 @@
-import importlib
 import importlib.resources
-import pkgutil
 
 import typer
 from rich.console import Console
@@ -8,34 +6,15 @@ from rich.markdown import Markdown
 from rich.traceback import install
 
 from ci_plumber import docs
-
-# Get all of the modules that have the "ci_plumber_" prefix
-# https://packaging.python.org/guides/creating-and-discovering-plugins/
-discovered_plugins = {
-    name: importlib.import_module(name)
-    for finder, name, ispkg in pkgutil.iter_modules()
-    if name.startswith("ci_plumber_")
-}
+from ci_plumber.plugin_loader import PluginRootGroup
 
 install(show_locals=True)
 
 
-# Create the main typer app
-app = typer.Typer()
-
-# For each of the plugins found, load them as sub-commands into the main
-# app
-for plugin in discovered_plugins:
-    # We're going a bit ambiguous here with types so I've just turned mypy
-    # off
-    try:
-        app.add_typer(
-            discovered_plugins[plugin].app,  # type: ignore
-            name=discovered_plugins[plugin].name,  # type: ignore
-        )
-    except AttributeError:
-        # It's always a possibility that there was a false positive plugin
-        pass  # shhhh
+# Create the main typer app. The plugins are discovered from their entry
+# points when the app is run, and each one is only imported once one of its
+# sub-commands is invoked.
+app = typer.Typer(cls=PluginRootGroup)
 
 
 @app.callback()
@@ -55,5 +34,21 @@ def readme() -> None:
     console.print(Markdown(readme))
 
 
+@app.command(name="migrate-config")
+def migrate_config() -> None:
+    """
+    Move the config into an indexed SQLite database
+    """
+    # Imported here so that the helpers aren't loaded for every command
+    from ci_plumber.helpers import migrate_config_to_sqlite
+
+    try:
+        db_path, remotes = migrate_config_to_sqlite()
+    except FileExistsError as e:
+        typer.echo(f"The config is already stored in {e}")
+        raise typer.Exit(1)
+    typer.echo(f"Migrated {remotes} repos to {db_path}")
+
+
 if __name__ == "__main__":
     app()
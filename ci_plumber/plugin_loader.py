@@ -0,0 +1,326 @@
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import pkgutil
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Collection, Optional
+
+import click
+import typer
+
+from ci_plumber.module_attributes import Module_attribute
+
+try:
+    import importlib.metadata as importlib_metadata
+except ModuleNotFoundError:
+    import importlib_metadata  # type: ignore
+
+try:
+    from typer.core import TyperGroup
+except ImportError:
+    # Older versions of typer build plain click groups
+    from click import Group as TyperGroup  # type: ignore
+
+# The entry point group that plugins register themselves under
+PLUGIN_GROUP = "ci_plumber.plugins"
+
+# The file, next to the plugin's __init__.py, that describes the plugin
+MANIFEST_FILE = "plugin.json"
+
+# The file, in the config directory, that caches the discovered plugins
+REGISTRY_FILE = "plugins.json"
+
+# The entries of a sys.path directory that change when a package is
+# installed, upgraded or removed
+_INSTALL_SUFFIXES = (".dist-info", ".egg-info", ".egg-link", ".pth")
+
+
+@dataclass
+class PluginManifest:
+    """Everything that is needed to list a plugin without importing it.
+
+    Args:
+        name (str): The name of the sub-command the plugin is mounted as.
+        module (str): The module that holds the plugin's typer app.
+        app (str): The attribute of the module holding the typer app.
+        help (Optional[str]): The help text of the plugin.
+        attributes (list[Module_attribute]): The attributes of the plugin.
+        commands (Optional[dict[str, str]]): The plugin's sub-commands and
+            their help text. None if the plugin didn't declare them.
+    """
+
+    name: str
+    module: str
+    app: str = "app"
+    help: Optional[str] = None
+    attributes: list[Module_attribute] = field(default_factory=list)
+    commands: Optional[dict[str, str]] = None
+
+
+def read_manifest(name: str, target: str) -> PluginManifest:
+    """Builds the manifest for a plugin from its entry point and its
+    plugin.json, without importing the plugin.
+
+    Args:
+        name (str): The name of the entry point.
+        target (str): The value of the entry point, i.e. "module:app".
+
+    Returns:
+        PluginManifest: The plugin's manifest.
+    """
+    module, _, app = target.partition(":")
+    manifest = PluginManifest(name=name, module=module, app=app or "app")
+
+    # Finding the spec of a top level package doesn't import it
+    spec = importlib.util.find_spec(module.split(".")[0])
+    if spec is None or not spec.submodule_search_locations:
+        return manifest
+    manifest_path = (
+        Path(list(spec.submodule_search_locations)[0]) / MANIFEST_FILE
+    )
+    if not manifest_path.is_file():
+        return manifest
+
+    with manifest_path.open("r") as fp:
+        data: dict[str, Any] = json.load(fp)
+    manifest.help = data.get("help")
+    manifest.attributes = [
+        Module_attribute(attribute) for attribute in data.get("attributes", [])
+    ]
+    manifest.commands = data.get("commands")
+    return manifest
+
+
+def discover_legacy_plugins(
+    skip: Collection[str] = (),
+) -> dict[str, PluginManifest]:
+    """Finds plugins that don't register an entry point by importing every
+    module with the "ci_plumber_" prefix.
+
+    https://packaging.python.org/guides/creating-and-discovering-plugins/
+
+    Args:
+        skip (Collection[str], optional): Modules that aren't imported, as
+            they are already known from their entry points. Defaults to ().
+
+    Returns:
+        dict[str, PluginManifest]: The plugins, keyed by name.
+    """
+    plugins: dict[str, PluginManifest] = {}
+    for finder, module_name, ispkg in pkgutil.iter_modules():
+        if not module_name.startswith("ci_plumber_") or module_name in skip:
+            continue
+        module = importlib.import_module(module_name)
+        try:
+            name = getattr(module, "name")
+            plugins[name] = PluginManifest(
+                name=name,
+                module=module_name,
+                help=typer.main.get_command(getattr(module, "app")).help,
+                attributes=list(getattr(module, "attributes", [])),
+            )
+        except AttributeError:
+            # It's always a possibility that there was a false positive plugin
+            pass  # shhhh
+    return plugins
+
+
+def discover_plugins() -> dict[str, PluginManifest]:
+    """Finds all of the installed plugins from their entry points, and from
+    the "ci_plumber_" modules that don't register one, such as older
+    releases and symlinked plugins. If both give a plugin the same name, the
+    entry point is used.
+
+    Returns:
+        dict[str, PluginManifest]: The plugins, keyed by name.
+    """
+    try:
+        entry_points = importlib_metadata.entry_points(group=PLUGIN_GROUP)
+    except TypeError:
+        # Python 3.9 doesn't support selecting the group
+        entry_points = importlib_metadata.entry_points().get(  # type: ignore
+            PLUGIN_GROUP, []
+        )
+
+    plugins = {
+        entry_point.name: read_manifest(entry_point.name, entry_point.value)
+        for entry_point in entry_points
+    }
+    modules = {plugin.module.split(".")[0] for plugin in plugins.values()}
+    return {**discover_legacy_plugins(skip=modules), **plugins}
+
+
+def get_registry_file() -> Path:
+    """Gets the location of the plugin registry cache
+
+    Returns:
+        Path: The path to the registry cache
+    """
+    return Path(typer.get_app_dir("CI-Plumber")) / REGISTRY_FILE
+
+
+def environment_fingerprint() -> str:
+    """Fingerprints the installed packages from the modification times of
+    the sys.path entries and the packaging metadata inside them.
+
+    Returns:
+        str: The fingerprint of the environment.
+    """
+    digest = hashlib.sha256(sys.version.encode())
+    for entry in sys.path:
+        path = Path(entry or ".")
+        try:
+            digest.update(f"{path}:{path.stat().st_mtime_ns}".encode())
+            if not path.is_dir():
+                continue
+            with os.scandir(path) as entries:
+                for dir_entry in sorted(entries, key=lambda e: e.name):
+                    if dir_entry.name.endswith(_INSTALL_SUFFIXES):
+                        mtime = dir_entry.stat().st_mtime_ns
+                        digest.update(f"{dir_entry.name}:{mtime}".encode())
+        except OSError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()
+
+
+def load_registry(
+    registry_path: Path, fingerprint: str
+) -> Optional[dict[str, PluginManifest]]:
+    """Loads the cached plugins if they were discovered in the same
+    environment
+
+    Args:
+        registry_path (Path): The path to the registry cache
+        fingerprint (str): The fingerprint of the current environment
+
+    Returns:
+        Optional[dict[str, PluginManifest]]: The cached plugins, or None if
+            the cache is missing or stale.
+    """
+    try:
+        with registry_path.open("r") as fp:
+            registry = json.load(fp)
+        if registry["fingerprint"] != fingerprint:
+            return None
+        return {
+            plugin["name"]: PluginManifest(
+                name=plugin["name"],
+                module=plugin["module"],
+                app=plugin["app"],
+                help=plugin["help"],
+                attributes=[
+                    Module_attribute(attribute)
+                    for attribute in plugin["attributes"]
+                ],
+                commands=plugin["commands"],
+            )
+            for plugin in registry["plugins"]
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_registry(
+    registry_path: Path, fingerprint: str, plugins: dict[str, PluginManifest]
+) -> None:
+    """Saves the discovered plugins to the registry cache
+
+    Args:
+        registry_path (Path): The path to the registry cache
+        fingerprint (str): The fingerprint of the current environment
+        plugins (dict[str, PluginManifest]): The discovered plugins
+    """
+    registry = {
+        "fingerprint": fingerprint,
+        "plugins": [asdict(plugin) for plugin in plugins.values()],
+    }
+    try:
+        Path.mkdir(registry_path.parent, parents=True, exist_ok=True)
+        with registry_path.open("w") as fp:
+            json.dump(registry, fp, indent=4)
+    except OSError:
+        # The cache is only an optimisation
+        pass
+
+
+def get_plugins() -> dict[str, PluginManifest]:
+    """Gets the installed plugins, only discovering them again if the
+    environment has changed since they were last cached.
+
+    Returns:
+        dict[str, PluginManifest]: The plugins, keyed by name.
+    """
+    registry_path = get_registry_file()
+    fingerprint = environment_fingerprint()
+    plugins = load_registry(registry_path, fingerprint)
+    if plugins is None:
+        plugins = discover_plugins()
+        save_registry(registry_path, fingerprint, plugins)
+    return plugins
+
+
+class LazyPluginGroup(click.Group):
+    """A click group standing in for a plugin. The plugin is only imported
+    once one of its sub-commands is run."""
+
+    def __init__(self, manifest: PluginManifest) -> None:
+        super().__init__(
+            name=manifest.name,
+            help=manifest.help,
+            no_args_is_help=True,
+        )
+        self.manifest = manifest
+        self._group: Optional[click.Group] = None
+
+    def load(self) -> click.Group:
+        """Imports the plugin and builds its click group.
+
+        Returns:
+            click.Group: The plugin's click group.
+        """
+        if self._group is None:
+            module = importlib.import_module(self.manifest.module)
+            app: typer.Typer = getattr(module, self.manifest.app)
+            group = typer.main.get_command(app)
+            assert isinstance(group, click.Group)
+            self._group = group
+        return self._group
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        if self.manifest.commands is None:
+            return list(self.load().list_commands(ctx))
+        return sorted(self.manifest.commands)
+
+    def get_command(
+        self, ctx: click.Context, cmd_name: str
+    ) -> Optional[click.Command]:
+        if self.manifest.commands is None:
+            return self.load().get_command(ctx, cmd_name)
+        if cmd_name not in self.manifest.commands:
+            return None
+        # Enough to render the help page. The real command is resolved
+        # when it is invoked.
+        return click.Command(cmd_name, help=self.manifest.commands[cmd_name])
+
+    def resolve_command(
+        self, ctx: click.Context, args: list[str]
+    ) -> tuple[Optional[str], Optional[click.Command], list[str]]:
+        return self.load().resolve_command(ctx, args)
+
+    def invoke(self, ctx: click.Context) -> Any:
+        return self.load().invoke(ctx)
+
+
+class PluginRootGroup(TyperGroup):
+    """The root group of ci-plumber. Every discovered plugin is mounted as a
+    lazily loaded sub-command."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        for name, manifest in get_plugins().items():
+            if name not in self.commands:
+                self.add_command(LazyPluginGroup(manifest), name)
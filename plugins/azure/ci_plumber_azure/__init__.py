@@ -9,6 +9,7 @@ from ci_plumber_azure.auth import (
 from ci_plumber_azure.create_app import create_app
 from ci_plumber_azure.create_registry import create_registry
 from ci_plumber_azure.database import create_database
+from ci_plumber_azure.provision import provision
 
 attributes = [Module_attribute.image_store, Module_attribute.consumer]
 
@@ -22,6 +23,7 @@ app.command(name="deploy")(create_app)
 app.command(name="set-default-subscription")(set_default_subscription)
 app.command(name="list-subscriptions")(list_subscriptions)
 app.command(name="create-db")(create_database)
+app.command(name="provision")(provision)
 
 
 @app.callback()
@@ -0,0 +1,1058 @@
+import asyncio
+import os
+import uuid
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+from typing import Any, Callable, Iterator, NamedTuple, Optional
+from urllib.parse import quote
+
+import requests
+from ci_plumber_azure.auth import TOKEN_MARGIN, AccessToken, get_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ci_plumber.helpers import WaitTimeoutError
+
+# The environment variable that overrides the ARM endpoint, e.g. to point
+# at a stand-in server
+ARM_ENDPOINT_ENV_VAR = "CI_PLUMBER_ARM_ENDPOINT"
+
+ARM_ENDPOINT = "https://management.azure.com"
+
+# The API version of each resource provider
+API_VERSIONS = {
+    "subscriptions": "2020-01-01",
+    "resourcegroups": "2021-04-01",
+    "Microsoft.ContainerRegistry": "2019-05-01",
+    "Microsoft.DBforMariaDB": "2018-06-01",
+    "Microsoft.Web": "2021-02-01",
+    "Microsoft.Authorization": "2022-04-01",
+    "Microsoft.ResourceGraph": "2021-03-01",
+}
+
+# The built in role that lets an identity pull from a container registry
+ACR_PULL_ROLE = "7f951dda-4ed3-4680-a7ca-43fe172d538d"
+
+# States of a long running operation that it won't leave
+TERMINAL_STATES = ("Succeeded", "Failed", "Canceled")
+
+# Properties that are set when a resource is written but aren't returned when
+# it is read, so they are never compared
+UNREAD_PROPERTIES = ("administratorLoginPassword", "createMode", "siteConfig")
+
+# How long to wait between polls of a long running operation, in seconds,
+# if the server doesn't say
+POLL_INTERVAL = 5.0
+
+# How long a long running operation may take, in seconds. A MariaDB server
+# can take a quarter of an hour
+OPERATION_TIMEOUT = 30 * 60
+
+
+class ArmError(Exception):
+    """Raised when an ARM request or long running operation fails"""
+
+    def __init__(self, status: int, code: str, message: str) -> None:
+        super().__init__(f"{code}: {message}" if code else message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> "ArmError":
+        """Builds the error from an ARM error response
+
+        Args:
+            response (requests.Response): The response.
+
+        Returns:
+            ArmError: The error.
+        """
+        try:
+            error = response.json().get("error") or {}
+        except ValueError:
+            error = {}
+        return cls(
+            response.status_code,
+            error.get("code", ""),
+            error.get("message", response.text or response.reason),
+        )
+
+
+def api_version(path: str) -> str:
+    """Gets the API version for a resource path, from its provider. A path
+    can nest one provider's resources under another's, such as a role
+    assignment scoped to a registry, so the last provider is used.
+
+    Args:
+        path (str): The path of the resource.
+
+    Returns:
+        str: The API version.
+    """
+    parts = path.strip("/").split("/")
+    if "providers" in parts:
+        last = len(parts) - 1 - parts[::-1].index("providers")
+        return API_VERSIONS[parts[last + 1]]
+    if "resourcegroups" in [part.lower() for part in parts]:
+        return API_VERSIONS["resourcegroups"]
+    return API_VERSIONS["subscriptions"]
+
+
+def create_session(pool_size: int = 16) -> requests.Session:
+    """Creates an HTTP session whose connections are kept alive and reused,
+    and which retries throttled and unavailable requests, honouring
+    Retry-After
+
+    Args:
+        pool_size (int, optional): The most connections to keep open.
+            Defaults to 16.
+
+    Returns:
+        requests.Session: The session.
+    """
+    retry = Retry(
+        total=4,
+        backoff_factor=1.0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # ARM's PUTs are idempotent, so they are retried too
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_maxsize=pool_size, max_retries=retry),
+    )
+    session.mount(
+        "http://",
+        HTTPAdapter(pool_maxsize=pool_size, max_retries=retry),
+    )
+    return session
+
+
+class Operation(NamedTuple):
+    """A long running operation, which can be recorded and polled later
+
+    Args:
+        path (str): The path of the resource it provisions.
+        url (Optional[str], optional): The URL to poll. Defaults to None,
+            which polls the resource's provisioning state.
+        header (Optional[str], optional): The header the URL came from,
+            Azure-AsyncOperation or Location. Defaults to None.
+        retry_after (float, optional): How long to wait between polls, in
+            seconds. Defaults to POLL_INTERVAL.
+    """
+
+    path: str
+    url: Optional[str] = None
+    header: Optional[str] = None
+    retry_after: float = POLL_INTERVAL
+
+
+def retry_after(response: requests.Response) -> float:
+    """Gets how long a response asks to wait before polling again. The
+    Retry-After header is either a number of seconds or an HTTP date.
+
+    Args:
+        response (requests.Response): The response.
+
+    Returns:
+        float: The delay in seconds, or POLL_INTERVAL if the header is
+            missing or can't be parsed.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return POLL_INTERVAL
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Python < 3.10 raises TypeError for an invalid date
+        return POLL_INTERVAL
+    return max(when.timestamp() - time(), 0.0)
+
+
+def operation_from_response(
+    response: requests.Response, path: str
+) -> Optional[Operation]:
+    """Gets the long running operation that a request started
+
+    Args:
+        response (requests.Response): The response to the PUT or PATCH.
+        path (str): The path of the resource.
+
+    Returns:
+        Optional[Operation]: The operation, or None if the resource has
+            already been provisioned.
+    """
+    delay = retry_after(response)
+    if response.status_code in (201, 202):
+        for header in ("Azure-AsyncOperation", "Location"):
+            if header in response.headers:
+                return Operation(path, response.headers[header], header, delay)
+    resource = response.json() if response.content else {}
+    state = resource.get("properties", {}).get("provisioningState")
+    if response.status_code != 202 and state in (None, "Succeeded"):
+        return None
+    return Operation(path, retry_after=delay)
+
+
+def resource_changes(
+    desired: dict[str, Any], actual: dict[str, Any]
+) -> dict[str, Any]:
+    """Gets the parts of a resource that differ from the existing resource.
+    Only what is desired is compared, and strings are compared ignoring
+    case, as ARM does.
+
+    Args:
+        desired (dict[str, Any]): The resource that would be written.
+        actual (dict[str, Any]): The existing resource.
+
+    Returns:
+        dict[str, Any]: The values that differ, nested like the resource.
+            Empty if the resource is up to date.
+    """
+    changes: dict[str, Any] = {}
+    for key, value in desired.items():
+        if key in UNREAD_PROPERTIES:
+            continue
+        current = actual.get(key)
+        if isinstance(value, dict):
+            nested = resource_changes(
+                value, current if isinstance(current, dict) else {}
+            )
+            if nested:
+                changes[key] = nested
+        elif isinstance(value, str) and isinstance(current, str):
+            if value.casefold() != current.casefold():
+                changes[key] = value
+        elif value != current:
+            changes[key] = value
+    return changes
+
+
+class ArmClient:
+    """Talks to Azure Resource Manager directly over HTTP, rather than
+    starting an az process for each request. Requests share one pooled
+    session.
+
+    Args:
+        get_token (Callable[[], AccessToken], optional): Gets an access
+            token. It is called again shortly before the token expires.
+            Defaults to the cached Azure context.
+        endpoint (Optional[str], optional): The ARM endpoint. Defaults to
+            CI_PLUMBER_ARM_ENDPOINT, or the public Azure endpoint.
+        session (Optional[requests.Session], optional): The HTTP session.
+            Defaults to a new pooled session.
+    """
+
+    def __init__(
+        self,
+        get_token: Callable[[], AccessToken] = get_context,
+        endpoint: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        self.get_token = get_token
+        self._token: Optional[AccessToken] = None
+        self.endpoint = (
+            endpoint or os.environ.get(ARM_ENDPOINT_ENV_VAR) or ARM_ENDPOINT
+        ).rstrip("/")
+        self.session = session or create_session()
+        # The existing resources, keyed by lower case ID, once loaded
+        self.snapshot: Optional[dict[str, dict[str, Any]]] = None
+        self.up_to_date: list[str] = []
+
+    def token(self) -> AccessToken:
+        """Gets the access token, replacing it if it is about to expire
+
+        Returns:
+            AccessToken: The token.
+        """
+        token = self._token
+        if token is None or token.expires_on < time() + TOKEN_MARGIN:
+            token = self._token = self.get_token()
+        return token
+
+    @property
+    def subscription(self) -> str:
+        """The ID of the subscription to use"""
+        return self.token().subscription
+
+    def resource_group_path(self, resource_group: str) -> str:
+        """Gets the path of a resource group
+
+        Args:
+            resource_group (str): The name of the resource group.
+
+        Returns:
+            str: The path.
+        """
+        return (
+            f"/subscriptions/{self.subscription}/resourceGroups/"
+            f"{resource_group}"
+        )
+
+    def resource_path(
+        self, resource_group: str, provider: str, kind: str, name: str
+    ) -> str:
+        """Gets the path of a resource
+
+        Args:
+            resource_group (str): The name of the resource group.
+            provider (str): The resource provider, e.g. Microsoft.Web.
+            kind (str): The type of resource, e.g. sites.
+            name (str): The name of the resource.
+
+        Returns:
+            str: The path.
+        """
+        return (
+            f"{self.resource_group_path(resource_group)}/providers/"
+            f"{provider}/{kind}/{name}"
+        )
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[dict[str, Any]] = None,
+        version: Optional[str] = None,
+    ) -> requests.Response:
+        """Makes a request to ARM
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The path, or a full URL such as a nextLink.
+            body (Optional[dict[str, Any]], optional): The JSON body.
+                Defaults to None.
+            version (Optional[str], optional): The API version. Defaults to
+                the version of the path's provider. Not added to full URLs,
+                which already have one.
+
+        Raises:
+            ArmError: If the request fails.
+
+        Returns:
+            requests.Response: The response.
+        """
+        if path.startswith("http"):
+            url, params = path, None
+        else:
+            url = self.endpoint + path
+            params = {"api-version": version or api_version(path)}
+        response = self.session.request(
+            method,
+            url,
+            params=params,
+            json=body,
+            headers={"Authorization": f"Bearer {self.token().token}"},
+            timeout=60,
+        )
+        if response.status_code >= 400:
+            raise ArmError.from_response(response)
+        return response
+
+    def get(self, path: str) -> dict[str, Any]:
+        """Gets a resource
+
+        Args:
+            path (str): The path of the resource.
+
+        Raises:
+            ArmError: If the request fails, e.g. with status 404.
+
+        Returns:
+            dict[str, Any]: The resource.
+        """
+        return self.request("GET", path).json()
+
+    def iter_resources(
+        self, path: str, filter: Optional[str] = None
+    ) -> Iterator[dict[str, Any]]:
+        """Lists resources, following nextLink to fetch every page
+
+        Args:
+            path (str): The path of the list.
+            filter (Optional[str], optional): An OData filter, e.g.
+                "principalId eq '...'". Defaults to None.
+
+        Yields:
+            Iterator[dict[str, Any]]: The resources.
+        """
+        url = f"{path}?$filter={quote(filter)}" if filter else path
+        next_link: Optional[str] = url
+        while next_link:
+            page = self.request("GET", next_link).json()
+            yield from page.get("value", [])
+            next_link = page.get("nextLink")
+
+    def begin(self, method: str, path: str, body: dict[str, Any]) -> Operation:
+        """Starts creating or updating a resource, without waiting for it to
+        be provisioned
+
+        Args:
+            method (str): PUT or PATCH.
+            path (str): The path of the resource.
+            body (dict[str, Any]): The resource, or the properties to update.
+
+        Raises:
+            ArmError: If the request fails.
+
+        Returns:
+            Operation: The operation, to pass to wait or an OperationPoller.
+        """
+        if method == "PUT":
+            change = self.plan(path, body)
+            if change is None:
+                # One GET gets the resource
+                return Operation(path, retry_after=0)
+            method, body = change
+        response = self.request(method, path, body)
+        # If it has already been provisioned, one GET gets the resource
+        return operation_from_response(response, path) or Operation(
+            path, retry_after=0
+        )
+
+    def put(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        """Creates or updates a resource, waiting for it to be provisioned.
+        Once a snapshot has been loaded, only what differs is written.
+
+        Args:
+            path (str): The path of the resource.
+            body (dict[str, Any]): The resource.
+
+        Raises:
+            ArmError: If the request or its provisioning fails.
+
+        Returns:
+            dict[str, Any]: The resource once it has been provisioned.
+        """
+        change = self.plan(path, body)
+        if change is None:
+            return (self.snapshot or {})[path.lower()]
+        method, body = change
+        response = self.request(method, path, body)
+        operation = operation_from_response(response, path)
+        return self.wait(operation) if operation else response.json()
+
+    def query_resource_group(
+        self, resource_group: str
+    ) -> Iterator[dict[str, Any]]:
+        """Reads a resource group and every resource in it with one Azure
+        Resource Graph query, following $skipToken to fetch every page
+
+        Args:
+            resource_group (str): The name of the resource group.
+
+        Yields:
+            Iterator[dict[str, Any]]: The resources, as ARM returns them.
+        """
+        query = (
+            f"Resources | where resourceGroup =~ '{resource_group}' | union "
+            "(ResourceContainers | where type =~ "
+            "'microsoft.resources/subscriptions/resourcegroups' and name =~ "
+            f"'{resource_group}')"
+        )
+        options: dict[str, Any] = {"resultFormat": "objectArray"}
+        while True:
+            page = self.post(
+                "/providers/Microsoft.ResourceGraph/resources",
+                {
+                    "subscriptions": [self.subscription],
+                    "query": query,
+                    "options": options,
+                },
+            )
+            yield from page.get("data", [])
+            if not page.get("$skipToken"):
+                return
+            options = {**options, "$skipToken": page["$skipToken"]}
+
+    def load_snapshot(self, resource_group: str) -> int:
+        """Reads the existing resources of a resource group, so that later
+        writes are skipped or reduced to what has changed. Resources created
+        moments ago may be missing, in which case they are written again.
+
+        Args:
+            resource_group (str): The name of the resource group.
+
+        Returns:
+            int: The number of existing resources.
+        """
+        self.snapshot = {
+            resource["id"].lower(): resource
+            for resource in self.query_resource_group(resource_group)
+        }
+        return len(self.snapshot)
+
+    def plan(
+        self, path: str, body: dict[str, Any]
+    ) -> Optional[tuple[str, dict[str, Any]]]:
+        """Works out how to write a resource, given the snapshot
+
+        Args:
+            path (str): The path of the resource.
+            body (dict[str, Any]): The resource.
+
+        Returns:
+            Optional[tuple[str, dict[str, Any]]]: The method and body to
+                send, PUT with the resource if it doesn't exist, or PATCH
+                with what has changed. None if it is up to date.
+        """
+        if self.snapshot is None or path.lower() not in self.snapshot:
+            return "PUT", body
+        changes = resource_changes(body, self.snapshot[path.lower()])
+        if not changes:
+            self.up_to_date.append(path)
+            return None
+        return "PATCH", changes
+
+    def patch(self, path: str, body: dict[str, Any]) -> dict[str, Any]:
+        """Updates some of a resource's properties
+
+        Args:
+            path (str): The path of the resource.
+            body (dict[str, Any]): The properties to update.
+
+        Raises:
+            ArmError: If the request or its provisioning fails.
+
+        Returns:
+            dict[str, Any]: The resource once it has been updated.
+        """
+        response = self.request("PATCH", path, body)
+        operation = operation_from_response(response, path)
+        return self.wait(operation) if operation else response.json()
+
+    def post(
+        self, path: str, body: Optional[dict[str, Any]] = None
+    ) -> dict[str, Any]:
+        """Runs an action on a resource, e.g. listCredentials
+
+        Args:
+            path (str): The path of the action.
+            body (Optional[dict[str, Any]], optional): The JSON body.
+                Defaults to None.
+
+        Raises:
+            ArmError: If the request fails.
+
+        Returns:
+            dict[str, Any]: The result of the action.
+        """
+        response = self.request("POST", path, body)
+        return response.json() if response.content else {}
+
+    def poll(self, operation: Operation) -> Optional[dict[str, Any]]:
+        """Checks on a long running operation once
+
+        Args:
+            operation (Operation): The operation.
+
+        Raises:
+            ArmError: If the operation failed.
+
+        Returns:
+            Optional[dict[str, Any]]: The resource if the operation has
+                finished, otherwise None.
+        """
+        if operation.url is None:
+            resource = self.get(operation.path)
+            state = resource.get("properties", {}).get("provisioningState")
+            if state in (None, "Succeeded"):
+                return resource
+            if state in TERMINAL_STATES:
+                raise ArmError(200, state, f"Provisioning {state.lower()}")
+            return None
+        response = self.request("GET", operation.url)
+        if operation.header == "Azure-AsyncOperation":
+            status = response.json().get("status")
+            if status not in TERMINAL_STATES:
+                return None
+            if status != "Succeeded":
+                error = response.json().get("error") or {}
+                raise ArmError(
+                    response.status_code,
+                    error.get("code", status),
+                    error.get("message", f"Operation {status.lower()}"),
+                )
+        elif response.status_code == 202:
+            return None
+        return self.get(operation.path)
+
+    def wait(
+        self, operation: Operation, timeout: float = OPERATION_TIMEOUT
+    ) -> dict[str, Any]:
+        """Waits for a long running operation to finish, blocking the thread.
+        Use an OperationPoller to wait for several at once.
+
+        Args:
+            operation (Operation): The operation.
+            timeout (float, optional): How long to wait, in seconds.
+                Defaults to OPERATION_TIMEOUT.
+
+        Raises:
+            ArmError: If the operation fails.
+            WaitTimeoutError: If it doesn't finish in time.
+
+        Returns:
+            dict[str, Any]: The resource once the operation has finished.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            sleep(operation.retry_after)
+            resource = self.poll(operation)
+            if resource is not None:
+                return resource
+            if monotonic() >= deadline:
+                raise WaitTimeoutError(
+                    f"{operation.path} to be provisioned", timeout
+                )
+
+    def list_subscriptions(self) -> Iterator[dict[str, Any]]:
+        """Lists the subscriptions that the account can use
+
+        Yields:
+            Iterator[dict[str, Any]]: The subscriptions.
+        """
+        yield from self.iter_resources("/subscriptions")
+
+    def create_resource_group(
+        self, name: str, location: str
+    ) -> dict[str, Any]:
+        """Creates a resource group, like `az group create`
+
+        Args:
+            name (str): The name of the resource group.
+            location (str): The Azure location, e.g. uksouth.
+
+        Returns:
+            dict[str, Any]: The resource group.
+        """
+        return self.put(self.resource_group_path(name), {"location": location})
+
+    def get_location(self, resource_group: str) -> str:
+        """Gets the location of a resource group
+
+        Args:
+            resource_group (str): The name of the resource group.
+
+        Returns:
+            str: The location.
+        """
+        path = self.resource_group_path(resource_group)
+        if self.snapshot and path.lower() in self.snapshot:
+            return self.snapshot[path.lower()]["location"]
+        return self.get(path)["location"]
+
+    def begin_create_registry(
+        self, resource_group: str, name: str, sku: str, location: str
+    ) -> Operation:
+        """Starts creating a container registry with the admin user enabled,
+        like `az acr create` followed by `az acr update --admin-enabled true`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the registry.
+            sku (str): The SKU of the registry, e.g. Basic.
+            location (str): The Azure location.
+
+        Returns:
+            Operation: The operation provisioning the registry.
+        """
+        return self.begin(
+            "PUT",
+            self.resource_path(
+                resource_group,
+                "Microsoft.ContainerRegistry",
+                "registries",
+                name,
+            ),
+            {
+                "location": location,
+                "sku": {"name": sku},
+                "properties": {"adminUserEnabled": True},
+            },
+        )
+
+    def registry_credentials(
+        self, resource_group: str, name: str
+    ) -> dict[str, Any]:
+        """Gets a registry's admin credentials, like `az acr credential show`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the registry.
+
+        Returns:
+            dict[str, Any]: The username and passwords.
+        """
+        return self.post(
+            self.resource_path(
+                resource_group,
+                "Microsoft.ContainerRegistry",
+                "registries",
+                name,
+            )
+            + "/listCredentials"
+        )
+
+    def begin_create_mariadb_server(
+        self,
+        resource_group: str,
+        name: str,
+        location: str,
+        sku: str,
+        version: str,
+        admin_username: str,
+        admin_password: str,
+        ssl: str,
+        storage: int,
+        backup_retention: int,
+        geo_redundant: str,
+    ) -> Operation:
+        """Starts creating a MariaDB server, like
+        `az mariadb server create --no-wait`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the server.
+            location (str): The Azure location.
+            sku (str): The SKU of the server, e.g. B_Gen5_1.
+            version (str): The version of MariaDB.
+            admin_username (str): The administrator's user name.
+            admin_password (str): The administrator's password.
+            ssl (str): Enabled or Disabled.
+            storage (int): The storage capacity, in megabytes.
+            backup_retention (int): How long backups are kept, in days.
+            geo_redundant (str): Enabled or Disabled.
+
+        Returns:
+            Operation: The operation provisioning the server.
+        """
+        tier, family, capacity = sku.split("_")
+        tiers = {"B": "Basic", "GP": "GeneralPurpose", "MO": "MemoryOptimized"}
+        return self.begin(
+            "PUT",
+            self.resource_path(
+                resource_group, "Microsoft.DBforMariaDB", "servers", name
+            ),
+            {
+                "location": location,
+                "sku": {
+                    "name": sku,
+                    "tier": tiers[tier],
+                    "family": family,
+                    "capacity": int(capacity),
+                },
+                "properties": {
+                    "createMode": "Default",
+                    "administratorLogin": admin_username,
+                    "administratorLoginPassword": admin_password,
+                    "version": version,
+                    "sslEnforcement": ssl,
+                    "storageProfile": {
+                        "storageMB": storage,
+                        "backupRetentionDays": backup_retention,
+                        "geoRedundantBackup": geo_redundant,
+                    },
+                },
+            },
+        )
+
+    def create_app_service_plan(
+        self, resource_group: str, name: str, os_type: str, sku: str = "B1"
+    ) -> dict[str, Any]:
+        """Creates an App Service plan, like `az appservice plan create`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the plan.
+            os_type (str): linux or windows.
+            sku (str, optional): The pricing tier. Defaults to B1.
+
+        Returns:
+            dict[str, Any]: The plan.
+        """
+        return self.put(
+            self.resource_path(
+                resource_group, "Microsoft.Web", "serverfarms", name
+            ),
+            {
+                "location": self.get_location(resource_group),
+                "kind": os_type,
+                "sku": {"name": sku},
+                "properties": {"reserved": os_type == "linux"},
+            },
+        )
+
+    def begin_create_web_app(
+        self, resource_group: str, name: str, plan: str, image: str
+    ) -> Operation:
+        """Starts creating a web app that runs a container, with a system
+        assigned managed identity, like `az webapp create` followed by
+        `az webapp identity assign`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the app.
+            plan (str): The name of the App Service plan.
+            image (str): The container image to run.
+
+        Returns:
+            Operation: The operation provisioning the app.
+        """
+        return self.begin(
+            "PUT",
+            self.resource_path(resource_group, "Microsoft.Web", "sites", name),
+            {
+                "location": self.get_location(resource_group),
+                "kind": "app,linux,container",
+                "identity": {"type": "SystemAssigned"},
+                "properties": {
+                    "serverFarmId": self.resource_path(
+                        resource_group, "Microsoft.Web", "serverfarms", plan
+                    ),
+                    "siteConfig": {"linuxFxVersion": f"DOCKER|{image}"},
+                },
+            },
+        )
+
+    def update_site_config(
+        self, resource_group: str, name: str, config: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Updates some of a web app's configuration, like
+        `az resource update --set properties...`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the app.
+            config (dict[str, Any]): The properties to set.
+
+        Returns:
+            dict[str, Any]: The app's configuration.
+        """
+        return self.patch(
+            self.resource_path(resource_group, "Microsoft.Web", "sites", name)
+            + "/config/web",
+            {"properties": config},
+        )
+
+    def set_container(
+        self, resource_group: str, name: str, image: str, registry_url: str
+    ) -> dict[str, Any]:
+        """Sets the image a web app runs and the registry it pulls from, like
+        `az webapp config container set`
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the app.
+            image (str): The container image.
+            registry_url (str): The URL of the registry.
+
+        Returns:
+            dict[str, Any]: The app's configuration.
+        """
+        self.update_app_settings(
+            resource_group,
+            name,
+            {"DOCKER_REGISTRY_SERVER_URL": registry_url},
+        )
+        return self.update_site_config(
+            resource_group, name, {"linuxFxVersion": f"DOCKER|{image}"}
+        )
+
+    def update_app_settings(
+        self, resource_group: str, name: str, settings: dict[str, str]
+    ) -> dict[str, str]:
+        """Sets some of a web app's settings, which it gets as environment
+        variables, like `az webapp config appsettings set`. The settings are
+        replaced as a whole, so don't update them from two steps at once.
+
+        Args:
+            resource_group (str): The name of the resource group.
+            name (str): The name of the app.
+            settings (dict[str, str]): The settings to set.
+
+        Returns:
+            dict[str, str]: All of the app's settings.
+        """
+        site = self.resource_path(
+            resource_group, "Microsoft.Web", "sites", name
+        )
+        # The other settings are kept
+        properties = self.post(f"{site}/config/appsettings/list").get(
+            "properties", {}
+        )
+        properties.update(settings)
+        self.request(
+            "PUT", f"{site}/config/appsettings", {"properties": properties}
+        )
+        return properties
+
+    def allow_azure_services(
+        self, resource_group: str, server: str
+    ) -> dict[str, Any]:
+        """Lets services running in Azure, such as web apps, connect to a
+        MariaDB server, like `az mariadb server firewall-rule create` with
+        the address 0.0.0.0
+
+        Args:
+            resource_group (str): The name of the resource group.
+            server (str): The name of the server.
+
+        Returns:
+            dict[str, Any]: The firewall rule.
+        """
+        return self.put(
+            self.resource_path(
+                resource_group, "Microsoft.DBforMariaDB", "servers", server
+            )
+            + "/firewallRules/AllowAllWindowsAzureIps",
+            {
+                "properties": {
+                    "startIpAddress": "0.0.0.0",
+                    "endIpAddress": "0.0.0.0",
+                }
+            },
+        )
+
+    def assign_role(
+        self, scope: str, principal_id: str, role: str
+    ) -> dict[str, Any]:
+        """Grants a role to a service principal, like
+        `az role assignment create`. The assignment's name is derived from
+        its scope, principal and role, so assigning it again is a no-op.
+
+        Args:
+            scope (str): The path of the resource the role applies to.
+            principal_id (str): The ID of the service principal.
+            role (str): The ID of the role definition.
+
+        Returns:
+            dict[str, Any]: The role assignment.
+        """
+        name = uuid.uuid5(uuid.NAMESPACE_URL, f"{scope}/{principal_id}/{role}")
+        path = (
+            f"{scope}/providers/Microsoft.Authorization/roleAssignments/{name}"
+        )
+        try:
+            return self.put(
+                path,
+                {
+                    "properties": {
+                        "roleDefinitionId": (
+                            f"/subscriptions/{self.subscription}/providers/"
+                            f"Microsoft.Authorization/roleDefinitions/{role}"
+                        ),
+                        "principalId": principal_id,
+                        "principalType": "ServicePrincipal",
+                    }
+                },
+            )
+        except ArmError as error:
+            if error.code != "RoleAssignmentExists":
+                raise
+            return self.get(path)
+
+    def list_role_assignments(
+        self, scope: str, principal_id: str
+    ) -> list[dict[str, Any]]:
+        """Lists the roles granted to a service principal, like
+        `az role assignment list --assignee`. A new assignment isn't listed
+        until it has propagated.
+
+        Args:
+            scope (str): The path of the resource the roles apply to.
+            principal_id (str): The ID of the service principal.
+
+        Returns:
+            list[dict[str, Any]]: The role assignments.
+        """
+        return list(
+            self.iter_resources(
+                f"{scope}/providers/Microsoft.Authorization/roleAssignments",
+                f"principalId eq '{principal_id}'",
+            )
+        )
+
+
+class OperationPoller:
+    """Waits for long running operations from one task, which polls every
+    pending operation at once, so that waiting for several operations takes
+    as long as the slowest of them.
+
+    Args:
+        client (ArmClient): The client to poll with.
+        timeout (float, optional): How long each operation may take, in
+            seconds. Defaults to OPERATION_TIMEOUT.
+    """
+
+    def __init__(
+        self, client: ArmClient, timeout: float = OPERATION_TIMEOUT
+    ) -> None:
+        self.client = client
+        self.timeout = timeout
+        self.pending: dict[Operation, asyncio.Future[dict[str, Any]]] = {}
+        self.deadlines: dict[Operation, float] = {}
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def wait(self, operation: Operation) -> dict[str, Any]:
+        """Waits for an operation to finish
+
+        Args:
+            operation (Operation): The operation.
+
+        Raises:
+            ArmError: If the operation fails.
+            WaitTimeoutError: If it doesn't finish in time.
+
+        Returns:
+            dict[str, Any]: The resource once the operation has finished.
+        """
+        if operation not in self.pending:
+            self.pending[operation] = (
+                asyncio.get_running_loop().create_future()
+            )
+            self.deadlines[operation] = monotonic() + self.timeout
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        # Shielded, so that a cancelled waiter doesn't cancel the others
+        return await asyncio.shield(self.pending[operation])
+
+    async def _run(self) -> None:
+        while self.pending:
+            await asyncio.sleep(
+                min(operation.retry_after for operation in self.pending)
+            )
+            operations = list(self.pending)
+            results = await asyncio.gather(
+                *(
+                    asyncio.to_thread(self.client.poll, operation)
+                    for operation in operations
+                ),
+                return_exceptions=True,
+            )
+            for operation, result in zip(operations, results):
+                future = self.pending[operation]
+                if isinstance(result, asyncio.CancelledError):
+                    future.cancel()
+                elif isinstance(result, BaseException):
+                    future.set_exception(result)
+                elif result is not None:
+                    future.set_result(result)
+                elif monotonic() >= self.deadlines[operation]:
+                    future.set_exception(
+                        WaitTimeoutError(
+                            f"{operation.path} to be provisioned",
+                            self.timeout,
+                        )
+                    )
+                else:
+                    continue
+                del self.pending[operation]
+                del self.deadlines[operation]
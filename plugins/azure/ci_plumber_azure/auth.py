@@ -1,26 +1,99 @@
 import json
+import os
 import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
 
 import typer
+from ci_plumber_azure.default_generators import Engine, get_engine
 from rich.console import Console
 
-from ci_plumber.helpers import run_command
+from ci_plumber.helpers import (
+    CommandError,
+    read_json_keys,
+    run_command,
+    stream_json_array,
+)
+
+# The resource that tokens for Azure Resource Manager are issued for
+ARM_RESOURCE = "https://management.azure.com/"
+
+# Environment variables that provide the ARM token and subscription, instead
+# of asking Azure CLI for them
+ARM_TOKEN_ENV_VAR = "CI_PLUMBER_ARM_TOKEN"
+SUBSCRIPTION_ENV_VAR = "AZURE_SUBSCRIPTION_ID"
+
+# The file, inside the app directory, caching the Azure context
+CONTEXT_CACHE_FILE = "azure-context.json"
+
+# How long the cached subscription, tenant and token are used for, in
+# seconds
+CONTEXT_TTL = 10 * 60
+
+# How long before a token expires that it is no longer used, in seconds
+TOKEN_MARGIN = 5 * 60
+
+
+class AccessToken(NamedTuple):
+    """An access token for Azure Resource Manager
+
+    Args:
+        token (str): The bearer token.
+        subscription (str): The ID of the subscription it is used with.
+        tenant (str): The ID of the tenant it was issued by.
+        expires_on (float): When it expires, as a Unix timestamp.
+    """
+
+    token: str
+    subscription: str
+    tenant: str
+    expires_on: float
 
 
 def login() -> None:
     """Log in to Azure using Azure CLI."""
     subprocess.run("az login --use-device-code".split(), check=True)
+    # The new login may be for another account, so nothing cached is kept
+    get_context_cache_file().unlink(missing_ok=True)
 
 
-def list_subscriptions() -> None:
+def list_subscriptions(
+    engine: Engine = get_engine(),
+) -> None:
     """List Azure subscriptions."""
-    console = Console()
-    accounts = json.loads(run_command("az account list"))
+    # Imported here, as the client gets its tokens from this module
+    from ci_plumber_azure.arm import ArmClient, ArmError
 
-    for account in accounts:
-        console.print(f"{account['name']}", end="", highlight=False)
-        console.print(f" - {account['id']}", end="")
-        console.print(" *" if account["isDefault"] else "")
+    console = Console()
+    # Each account is printed as soon as it has been parsed
+    try:
+        if engine == Engine.arm:
+            client = ArmClient()
+            for subscription in client.list_subscriptions():
+                console.print(
+                    f"{subscription['displayName']}", end="", highlight=False
+                )
+                console.print(f" - {subscription['subscriptionId']}", end="")
+                console.print(
+                    " *"
+                    if subscription["subscriptionId"] == client.subscription
+                    else ""
+                )
+        else:
+            for account in stream_json_array("az account list"):
+                console.print(f"{account['name']}", end="", highlight=False)
+                console.print(f" - {account['id']}", end="")
+                console.print(" *" if account["isDefault"] else "")
+    except CommandError as error:
+        console.log("[bold red]Command failed:[/bold red]")
+        console.log(error.stderr)
+        raise typer.Exit(1)
+    except ArmError as error:
+        console.log(f"[bold red]Request failed:[/bold red] {error}")
+        raise typer.Exit(1)
 
 
 def set_default_subscription(
@@ -31,4 +104,144 @@ def set_default_subscription(
     )
 ) -> None:
     """Set default subscription."""
-    run_command(f"az account set --subscription {subscription_id}")
+    try:
+        run_command(
+            f"az account set --subscription {subscription_id}", check=True
+        )
+    except CommandError:
+        # run_command has already logged why
+        raise typer.Exit(1)
+    cache = load_context_cache()
+    cache["default"] = subscription_id
+    save_context_cache(cache)
+
+
+def get_arm_token(subscription: Optional[str] = None) -> AccessToken:
+    """Gets an access token for Azure Resource Manager from Azure CLI. Setting
+    CI_PLUMBER_ARM_TOKEN and AZURE_SUBSCRIPTION_ID skips Azure CLI.
+
+    Args:
+        subscription (Optional[str], optional): The ID of the subscription.
+            Defaults to Azure CLI's default subscription.
+
+    Raises:
+        CommandError: If Azure CLI isn't logged in.
+        typer.BadParameter: If CI_PLUMBER_ARM_TOKEN is set without a
+            subscription.
+
+    Returns:
+        AccessToken: The token.
+    """
+    if ARM_TOKEN_ENV_VAR in os.environ:
+        subscription = subscription or os.environ.get(SUBSCRIPTION_ENV_VAR)
+        if not subscription:
+            raise typer.BadParameter(
+                f"{ARM_TOKEN_ENV_VAR} is set, so {SUBSCRIPTION_ENV_VAR} must "
+                "be set too"
+            )
+        return AccessToken(
+            os.environ[ARM_TOKEN_ENV_VAR],
+            subscription,
+            "",
+            float("inf"),
+        )
+    command = f"az account get-access-token --resource {ARM_RESOURCE}"
+    if subscription:
+        command += f" --subscription {subscription}"
+    token = read_json_keys(
+        command,
+        ["accessToken", "expiresOn", "subscription", "tenant"],
+    )
+    return AccessToken(
+        token["accessToken"],
+        token["subscription"],
+        token["tenant"],
+        datetime.fromisoformat(token["expiresOn"]).timestamp(),
+    )
+
+
+def get_context_cache_file() -> Path:
+    """Gets the location of the Azure context cache
+
+    Returns:
+        Path: The path to the cache.
+    """
+    return Path(typer.get_app_dir("CI-Plumber")) / CONTEXT_CACHE_FILE
+
+
+def load_context_cache() -> dict[str, Any]:
+    """Loads the Azure context cache. It holds the subscription set by
+    set_default_subscription under "default", and a context for each
+    subscription under "contexts".
+
+    Returns:
+        dict[str, Any]: The cache, or an empty cache if there isn't one.
+    """
+    try:
+        with get_context_cache_file().open("r") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {"default": None, "contexts": {}}
+
+
+def save_context_cache(cache: dict[str, Any]) -> None:
+    """Saves the Azure context cache. It holds tokens, so it is only readable
+    by its owner, and it is replaced atomically so that it is never left half
+    written.
+
+    Args:
+        cache (dict[str, Any]): The cache.
+    """
+    cache_file = get_context_cache_file()
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # mkstemp creates the file readable by its owner only
+    fd, temp_path = tempfile.mkstemp(
+        dir=cache_file.parent, prefix=cache_file.name, suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(cache, fp)
+        os.replace(temp_path, cache_file)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+def get_context() -> AccessToken:
+    """Gets the subscription, tenant and an access token for Azure Resource
+    Manager. They are cached for CONTEXT_TTL seconds, or until the token is
+    about to expire, for the subscription set by set_default_subscription,
+    so that Azure commands don't ask Azure CLI every time.
+
+    Raises:
+        CommandError: If Azure CLI isn't logged in.
+
+    Returns:
+        AccessToken: The token, along with its subscription and tenant.
+    """
+    if ARM_TOKEN_ENV_VAR in os.environ:
+        return get_arm_token()
+    cache = load_context_cache()
+    account = cache.get("default") or ""
+    now = time.time()
+    try:
+        context = cache["contexts"][account]
+        if (
+            context["cached_at"] + CONTEXT_TTL > now
+            and context["expires_on"] - TOKEN_MARGIN > now
+        ):
+            return AccessToken(
+                context["token"],
+                context["subscription"],
+                context["tenant"],
+                context["expires_on"],
+            )
+    except KeyError:
+        pass
+    token = get_arm_token(account or None)
+    cache.setdefault("contexts", {})[account] = {
+        **token._asdict(),
+        "cached_at": now,
+    }
+    save_context_cache(cache)
+    return token
@@ -1,16 +1,40 @@
 import random
-from time import sleep
+from pathlib import Path
+from typing import Any, Optional
 
 import typer
+from ci_plumber_azure.arm import (
+    ACR_PULL_ROLE,
+    ArmClient,
+    ArmError,
+    Operation,
+    OperationPoller,
+)
+from ci_plumber_azure.auth import get_context
 from ci_plumber_azure.default_generators import (
+    Engine,
+    get_engine,
     get_image,
     get_login_server,
+    get_reconcile,
     get_registry_name,
     get_resource_group,
 )
 from rich.console import Console
 
-from ci_plumber.helpers import run_command
+from ci_plumber.helpers import (
+    CommandError,
+    WaitTimeoutError,
+    probe_command_async,
+    run_command_async,
+    wait_until,
+    wait_until_async,
+)
+from ci_plumber.helpers.workflow import Checkpoint, Results, Workflow
+
+# How long a new identity and its role assignment may take to propagate, in
+# seconds
+PROPAGATION_TIMEOUT = 5 * 60
 
 
 def create_app(
@@ -27,100 +51,414 @@ def create_app(
     image: str = get_image(),
     login_server: str = get_login_server(),
     registry_name: str = get_registry_name(),
+    engine: Engine = get_engine(),
+    no_wait: bool = typer.Option(
+        False,
+        "--no-wait",
+        help="Start creating the app without waiting for it, with "
+        "--engine arm. Run the command again with --resume to carry on.",
+    ),
+    reconcile: bool = get_reconcile(),
     verbose: bool = typer.Option(
         False, "--verbose", "-v", help="Verbose output."
     ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue the last run from the steps that didn't finish, "
+        "using the options of the last run.",
+    ),
+    log_file: Optional[Path] = typer.Option(
+        None, help="Append the output of the az commands to this file."
+    ),
 ) -> None:
     """Creates an azure web app"""
     console = Console()
+    if no_wait and engine != Engine.arm:
+        console.log("[bold red]--no-wait needs --engine arm")
+        raise typer.Exit(1)
+    if reconcile and engine != Engine.arm:
+        console.log("[bold red]--reconcile needs --engine arm")
+        raise typer.Exit(1)
     with console.status(
         "[bold green]Creating the app...", spinner="clock"
-    ) as _:
-        # Create an App Service plan using the az appservice plan create
-        # command
-        console.log("Creating app service plan")
-        service_plan_out = run_command(
-            f"az appservice plan create --name {service_plan} --resource-group"
-            f" {resource_group} --is-{os_type}"
+    ) as status:
+        checkpoint = Checkpoint("azure.deploy", resume, keep=no_wait)
+        options = checkpoint.start(
+            {
+                "service_plan": service_plan,
+                "app_name": app_name,
+                "resource_group": resource_group,
+                "os_type": os_type,
+                "image": image,
+                "login_server": login_server,
+                "registry_name": registry_name,
+            }
+        )
+        service_plan = options["service_plan"]
+        app_name = options["app_name"]
+        resource_group = options["resource_group"]
+        os_type = options["os_type"]
+        image = options["image"]
+        login_server = options["login_server"]
+        registry_name = options["registry_name"]
+
+        workflow = Workflow(
+            console,
+            verbose=verbose,
+            checkpoint=checkpoint,
+            status=status,
+            log_file=log_file,
+        )
+
+        if engine == Engine.arm:
+            client = add_arm_steps(
+                workflow,
+                service_plan,
+                app_name,
+                resource_group,
+                os_type,
+                image,
+                login_server,
+                registry_name,
+                no_wait,
+                reconcile,
+            )
+        else:
+            add_cli_steps(
+                workflow,
+                service_plan,
+                app_name,
+                resource_group,
+                os_type,
+                image,
+                login_server,
+                registry_name,
+            )
+
+        try:
+            workflow.run()
+        except (CommandError, ArmError, WaitTimeoutError) as error:
+            if not isinstance(error, CommandError):
+                console.log(f"[bold red]{error}")
+            console.log(
+                "[bold red]Failed to create the app.[/bold red] Run the "
+                "command again with --resume to carry on from the failed step."
+            )
+            raise typer.Exit(1)
+
+        if reconcile:
+            console.log(
+                f"{len(client.up_to_date)} resources were already up to date"
+            )
+
+        if no_wait:
+            console.log(
+                "Started creating the app. Run the command again with "
+                "--resume to carry on once it has been created."
+            )
+            return
+
+        console.log(
+            f"Deployed to https://{app_name.lower()}.azurewebsites.net"
+        )
+        console.log("[dim]It may take a moment to come online")
+
+
+def add_cli_steps(
+    workflow: Workflow,
+    service_plan: str,
+    app_name: str,
+    resource_group: str,
+    os_type: str,
+    image: str,
+    login_server: str,
+    registry_name: str,
+) -> None:
+    """Adds the steps that deploy the app by running Azure CLI
+
+    Args:
+        workflow (Workflow): The workflow to add the steps to.
+        service_plan (str): The name of the App Service plan.
+        app_name (str): The name of the app.
+        resource_group (str): The name of the resource group.
+        os_type (str): The OS of the plan, linux or windows.
+        image (str): The image to deploy.
+        login_server (str): The login server of the registry.
+        registry_name (str): The name of the registry.
+    """
+    registry = image
+
+    # Create an App Service plan using the az appservice plan create
+    # command
+    workflow.add_command(
+        "service_plan",
+        f"az appservice plan create --name {service_plan} "
+        f"--resource-group {resource_group} --is-{os_type}",
+        check=True,
+        stream=True,
+        description="Creating app service plan",
+    )
+
+    # Create the web app with the az webpp create command
+    workflow.add_command(
+        "web_app",
+        f"az webapp create --resource-group {resource_group} --plan "
+        f"{service_plan} --name {app_name} "
+        f"--deployment-container-image-name {registry}",
+        requires=("service_plan",),
+        check=True,
+        stream=True,
+        description="Creating web app. [dim]This may take a while...",
+    )
+
+    # Enable the system-assigned managed identity for the web app by using
+    # the az webapp identity assign command
+    workflow.add_command(
+        "principal_id",
+        f"az webapp identity assign --resource-group {resource_group} "
+        f"--name {app_name} --query principalId --output tsv",
+        requires=("web_app",),
+        check=True,
+        description="Assigning managed identity",
+    )
+
+    # Retrieve your subscription ID from the cached Azure context. It
+    # doesn't depend on the app, so it's fetched while the app is created
+    workflow.add(
+        "subscription_id",
+        lambda results: get_context().subscription,
+        description="Retrieving subscription ID",
+    )
+
+    # Grant the managed identity permission to access the container
+    # registry, once the identity has propagated through Azure AD
+    async def grant(results: Results) -> str:
+        principal_id = results["principal_id"].rstrip()
+        scope = (
+            f"/subscriptions/{results['subscription_id'].rstrip()}/"
+            f"resourceGroups/{resource_group}/providers/"
+            f"Microsoft.ContainerRegistry/registries/{registry_name}"
         )
-        if verbose:
-            console.log(service_plan_out)
 
-        registry = image
+        async def principal_visible() -> Optional[str]:
+            return await probe_command_async(
+                f"az ad sp show --id {principal_id} --query id --output tsv"
+            )
+
+        async def assignment_listed() -> str:
+            output = await probe_command_async(
+                f"az role assignment list --assignee {principal_id} --scope "
+                f"{scope} --role AcrPull --query [].id --output tsv"
+            )
+            return (output or "").strip()
 
-        # Create the web app with the az webpp create command
-        console.log("Creating web app. [dim]This may take a while...[/dim]")
-        create_app_out = run_command(
-            f"az webapp create --resource-group {resource_group} --plan "
-            f"{service_plan} --name {app_name} "
-            f"--deployment-container-image-name {registry}"
+        await wait_until_async(
+            principal_visible,
+            PROPAGATION_TIMEOUT,
+            "the managed identity to propagate",
         )
-        if verbose:
-            console.log(create_app_out)
-
-        # Enable the system-assigned managed identity for the web app by using
-        # the az webapp identity assign command
-        console.log("Assigning managed identity")
-        principal_id = run_command(
-            f"az webapp identity assign --resource-group {resource_group} "
-            f"--name {app_name} --query principalId --output tsv"
-        ).rstrip()
-
-        if verbose:
-            console.log(principal_id)
-        # console.log(f"Principal ID = {principal_id}")
-
-        # Retrieve your subscription ID with the az account show command
-        console.log("Retrieving subscription ID")
-        subscription_id = run_command(
-            "az account show --query id --output tsv"
-        ).rstrip()
-
-        if verbose:
-            console.log(subscription_id)
-
-        # Grant the managed identity permission to access the container
-        # registry
-        console.log("Granting permission to access container registry")
-
-        sleep(5)  # It needs some time
-        grant_out = run_command(
+        output = await run_command_async(
             f"az role assignment create --assignee {principal_id} --scope "
-            f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}"
-            f"/providers/Microsoft.ContainerRegistry/registries/"
-            f"{registry_name} --role AcrPull"
+            f"{scope} --role AcrPull",
+            check=True,
         )
+        await wait_until_async(
+            assignment_listed,
+            PROPAGATION_TIMEOUT,
+            "the AcrPull role assignment to take effect",
+        )
+        return output
 
-        if verbose:
-            console.log(grant_out)
+    workflow.add(
+        "grant",
+        grant,
+        requires=("principal_id", "subscription_id"),
+        description="Granting permission to access container registry",
+    )
 
-        # Configure your app to use the managed identity to pull from Azure
-        # Container Registry
-        console.log("Configuring app to use managed identity")
-        configure_out = run_command(
-            f"az resource update --ids /subscriptions/{subscription_id}/"
-            f"resourceGroups/{resource_group}/providers/Microsoft.Web/sites/"
+    # Configure your app to use the managed identity to pull from Azure
+    # Container Registry
+    workflow.add_command(
+        "configure",
+        lambda results: (
+            "az resource update --ids /subscriptions/"
+            f"{results['subscription_id'].rstrip()}/resourceGroups/"
+            f"{resource_group}/providers/Microsoft.Web/sites/"
             f"{app_name}/config/web --set "
             "properties.acrUseManagedIdentityCreds=True"
-        )
+        ),
+        requires=("web_app", "subscription_id"),
+        check=True,
+        description="Configuring app to use managed identity",
+    )
 
-        if verbose:
-            console.log(configure_out)
-
-        # login_server = get_config(repo, "ACI_login_server")
-        # Use the az webapp config container set command to specify the
-        # container registry and the image to deploy for the web app
-        console.log("Deploying")
-        deploy_out = run_command(
-            f"az webapp config container set --name {app_name} "
-            f"--resource-group {resource_group} --docker-custom-image-name "
-            f"{registry} --docker-registry-server-url https://{login_server}"
-        )
+    # login_server = get_config(repo, "ACI_login_server")
+    # Use the az webapp config container set command to specify the
+    # container registry and the image to deploy for the web app
+    workflow.add_command(
+        "deploy",
+        f"az webapp config container set --name {app_name} "
+        f"--resource-group {resource_group} --docker-custom-image-name "
+        f"{registry} --docker-registry-server-url https://{login_server}",
+        requires=("grant", "configure"),
+        check=True,
+        stream=True,
+        description="Deploying",
+    )
 
-        if verbose:
-            console.log(deploy_out)
 
-        console.log(
-            f"Deployed to https://{app_name.lower()}.azurewebsites.net"
+def add_arm_steps(
+    workflow: Workflow,
+    service_plan: str,
+    app_name: str,
+    resource_group: str,
+    os_type: str,
+    image: str,
+    login_server: str,
+    registry_name: str,
+    no_wait: bool = False,
+    reconcile: bool = False,
+) -> ArmClient:
+    """Adds the steps that deploy the app through Azure Resource Manager.
+    The steps have the same names as those of add_cli_steps.
+
+    Args:
+        workflow (Workflow): The workflow to add the steps to.
+        service_plan (str): The name of the App Service plan.
+        app_name (str): The name of the app.
+        resource_group (str): The name of the resource group.
+        os_type (str): The OS of the plan, linux or windows.
+        image (str): The image to deploy.
+        login_server (str): The login server of the registry.
+        registry_name (str): The name of the registry.
+        no_wait (bool, optional): Whether to stop once the app has started
+            being created. Defaults to False.
+        reconcile (bool, optional): Whether to read the existing resources
+            first, and only write those that differ. Defaults to False.
+
+    Returns:
+        ArmClient: The client the steps use.
+    """
+    client = ArmClient()
+    poller = OperationPoller(client)
+
+    if reconcile:
+        workflow.add(
+            "snapshot",
+            lambda results: client.load_snapshot(resource_group),
+            checkpoint=False,
+            description="Reading the existing resources",
         )
-        console.log("[dim]It may take a moment to come online")
+
+    workflow.add(
+        "service_plan",
+        lambda results: client.create_app_service_plan(
+            resource_group, service_plan, os_type
+        ),
+        requires=("snapshot",) if reconcile else (),
+        description="Creating app service plan",
+    )
+
+    # The managed identity is assigned when the app is created. Only the
+    # operation is recorded, so that a resumed run waits for it rather than
+    # creating the app again
+    workflow.add(
+        "web_app",
+        lambda results: client.begin_create_web_app(
+            resource_group, app_name, service_plan, image
+        )._asdict(),
+        requires=("service_plan",),
+        description="Creating web app. [dim]This may take a while...",
+    )
+    if no_wait:
+        return client
+
+    async def wait_for_web_app(results: Results) -> str:
+        web_app = await poller.wait(Operation(**results["web_app"]))
+        return web_app["identity"]["principalId"]
+
+    workflow.add("principal_id", wait_for_web_app, requires=("web_app",))
+
+    workflow.add(
+        "subscription_id",
+        lambda results: client.subscription,
+        description="Retrieving subscription ID",
+    )
+
+    workflow.add(
+        "grant",
+        lambda results: grant_acr_pull(
+            client, resource_group, registry_name, results["principal_id"]
+        ),
+        requires=("principal_id", "subscription_id"),
+        description="Granting permission to access container registry",
+    )
+
+    workflow.add(
+        "configure",
+        lambda results: client.update_site_config(
+            resource_group, app_name, {"acrUseManagedIdentityCreds": True}
+        ),
+        requires=("principal_id",),
+        description="Configuring app to use managed identity",
+    )
+
+    workflow.add(
+        "deploy",
+        lambda results: client.set_container(
+            resource_group, app_name, image, f"https://{login_server}"
+        ),
+        requires=("grant", "configure"),
+        description="Deploying",
+    )
+    return client
+
+
+def grant_acr_pull(
+    client: ArmClient,
+    resource_group: str,
+    registry_name: str,
+    principal_id: str,
+) -> dict[str, Any]:
+    """Lets a managed identity pull from a container registry. The role
+    can't be assigned until the identity has propagated through Azure AD,
+    and isn't used until the assignment has propagated, so both are waited
+    for.
+
+    Args:
+        client (ArmClient): The client.
+        resource_group (str): The name of the resource group.
+        registry_name (str): The name of the registry.
+        principal_id (str): The ID of the identity's service principal.
+
+    Raises:
+        WaitTimeoutError: If either doesn't propagate in time.
+
+    Returns:
+        dict[str, Any]: The role assignment.
+    """
+    scope = client.resource_path(
+        resource_group,
+        "Microsoft.ContainerRegistry",
+        "registries",
+        registry_name,
+    )
+
+    def assign() -> Optional[dict[str, Any]]:
+        try:
+            return client.assign_role(scope, principal_id, ACR_PULL_ROLE)
+        except ArmError as error:
+            if error.code != "PrincipalNotFound":
+                raise
+            return None
+
+    assignment = wait_until(
+        assign, PROPAGATION_TIMEOUT, "the managed identity to propagate"
+    )
+    wait_until(
+        lambda: client.list_role_assignments(scope, principal_id),
+        PROPAGATION_TIMEOUT,
+        "the AcrPull role assignment to take effect",
+    )
+    return assignment
@@ -1,20 +1,30 @@
-import json
+import asyncio
 import random
 from enum import Enum
+from typing import Any
 
 import gitlab
 import typer
+from ci_plumber_azure.arm import ArmClient, ArmError, OperationPoller
+from ci_plumber_azure.default_generators import (
+    Engine,
+    Locations,
+    get_engine,
+    get_reconcile,
+    get_resource_group,
+)
+from ci_plumber_gitlab.auth import get_gitlab_client
 from rich.console import Console
 
 from ci_plumber.helpers import (
+    CommandError,
+    ConfigSession,
+    WaitTimeoutError,
     generate_gitlab_yaml,
     get_repo,
-    run_command,
-    set_config,
+    read_json_keys,
 )
-from ci_plumber.helpers.config_helpers import get_config
-from ci_plumber_azure.default_generators import Locations, get_resource_group
-from ci_plumber_gitlab.auth import get_gitlab_client
+from ci_plumber.helpers.workflow import Checkpoint, Results, Workflow
 
 
 class Skus(str, Enum):
@@ -37,131 +47,271 @@ def create_registry(
         help="The name of the location to create the registry in.",
     ),
     sku: Skus = typer.Option(Skus.Basic, help="The SKU of the registry."),
+    engine: Engine = get_engine(),
+    reconcile: bool = get_reconcile(),
     verbose: bool = typer.Option(
         False, "--verbose", "-v", help="Verbose output."
     ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue the last run from the steps that didn't finish, "
+        "using the options of the last run.",
+    ),
 ) -> None:
     """Create a new Azure Container Registry"""
     # Create the resource group
     console = Console()
+    if reconcile and engine != Engine.arm:
+        console.log("[bold red]--reconcile needs --engine arm")
+        raise typer.Exit(1)
     with console.status(
         "[bold green]Deploying the container registry...", spinner="clock"
     ) as _:
-        console.log(f"Creating resource group {resource_group_name}")
-        run_command(
-            f"az group create --name {resource_group_name} --location "
-            f"{location}"
-        )
-
-        # Create the registry
-        console.log(f"Creating registry {registry_name}")
-        create_registry_json = run_command(
-            f"az acr create --resource-group {resource_group_name} --name "
-            f"{registry_name} --sku {sku}"
-        )
+        repo = get_repo()
 
         if verbose:
-            console.log(create_registry_json)
-
-        create_registry = json.loads(create_registry_json)
-
-        login_server = create_registry["loginServer"]
+            console.log(f"Repo: {repo}")
 
-        # Enable the admin user
-        console.log("Enabling admin user")
-        create_admin = run_command(
-            f"az acr update -n {registry_name} --admin-enabled true"
+        checkpoint = Checkpoint("azure.create-registry", resume, repo)
+        options = checkpoint.start(
+            {
+                "registry_name": registry_name,
+                "resource_group_name": resource_group_name,
+                "location": location,
+                "sku": sku,
+            }
         )
+        registry_name = options["registry_name"]
+        resource_group_name = options["resource_group_name"]
+        location = options["location"]
+        sku = options["sku"]
 
-        if verbose:
-            console.log(create_admin)
+        config = ConfigSession(repo)
 
-        # Get the admin's credentials
-        console.log("Getting admin credentials")
-        credentials_json = run_command(
-            f"az acr credential show --resource-group "
-            f"{resource_group_name} --name {registry_name}"
-        )
+        def get_gitlab_project(results: Results) -> Any:
+            console.log("Logging in to Gitlab")
+            gl = get_gitlab_client()
+            console.log("Gettingthe Gitlab project")
+            return gl.projects.get(config.get("code_store.project_id"))
 
-        if verbose:
-            console.log(credentials_json)
+        workflow = Workflow(console, verbose=verbose, checkpoint=checkpoint)
 
-        # Down with JSON, long live the Python
-        credentials = json.loads(credentials_json)
+        # The Gitlab project is fetched while the registry is created
+        workflow.add("gitlab_project", get_gitlab_project, checkpoint=False)
 
-        repo = get_repo()
+        if engine == Engine.arm:
+            client = ArmClient()
+            # The existing resources are read again on a resumed run, as
+            # they may have changed since
+            if reconcile:
+                workflow.add(
+                    "snapshot",
+                    lambda results: client.load_snapshot(resource_group_name),
+                    checkpoint=False,
+                    description="Reading the existing resources",
+                )
+            workflow.add(
+                "group",
+                lambda results: client.create_resource_group(
+                    resource_group_name, location
+                ),
+                requires=("snapshot",) if reconcile else (),
+                description=f"Creating resource group {resource_group_name}",
+            )
 
-        if verbose:
-            console.log(f"Repo: {repo}")
+            poller = OperationPoller(client)
 
-        console.log("Logging in to Gitlab")
-        gl = get_gitlab_client()
-        console.log("Gettingthe Gitlab project")
-        gl_project = gl.projects.get(get_config(repo, "code_store.project_id"))
+            # The admin user is enabled when the registry is created
+            async def create_registry(results: Results) -> dict[str, str]:
+                operation = await asyncio.to_thread(
+                    client.begin_create_registry,
+                    resource_group_name,
+                    registry_name,
+                    sku,
+                    location,
+                )
+                registry = await poller.wait(operation)
+                return {"loginServer": registry["properties"]["loginServer"]}
 
-        set_config(repo, "registry.username", credentials["username"])
-        set_config(
-            repo, "registry.password", credentials["passwords"][0]["value"]
-        )
-        set_config(repo, "registry.url", login_server)
-        set_config(repo, "registry.resource_group", resource_group_name)
-        set_config(
-            repo,
-            "registry.image",
-            login_server + "/" + gl_project.path_with_namespace + ":latest",
-        )
-        set_config(repo, "registry.name", registry_name)
+            workflow.add(
+                "registry",
+                create_registry,
+                requires=("group",),
+                description=f"Creating registry {registry_name}",
+            )
 
-        console.log("Creating Azure access keys in CI")
-        try:
-            gl_project.variables.create(
-                {"key": "AZURE_REGISTRY", "value": login_server}
+            # The credentials aren't recorded, as they include the passwords
+            workflow.add(
+                "credentials",
+                lambda results: client.registry_credentials(
+                    resource_group_name, registry_name
+                ),
+                requires=("registry",),
+                description="Getting admin credentials",
+                checkpoint=False,
             )
-            gl_project.variables.create(
-                {"key": "AZURE_USERNAME", "value": credentials["username"]}
+        else:
+            workflow.add_command(
+                "group",
+                f"az group create --name {resource_group_name} --location "
+                f"{location}",
+                check=True,
+                description=f"Creating resource group {resource_group_name}",
             )
-            gl_project.variables.create(
-                {
-                    "key": "AZURE_PASSWORD",
-                    "value": credentials["passwords"][0]["value"],
-                }
+
+            # Create the registry. Only its login server is needed from the
+            # output
+            workflow.add(
+                "registry",
+                lambda results: read_json_keys(
+                    f"az acr create --resource-group {resource_group_name} "
+                    f"--name {registry_name} --sku {sku}",
+                    ["loginServer"],
+                ),
+                requires=("group",),
+                description=f"Creating registry {registry_name}",
             )
-            gl_project.variables.create(
-                {
-                    "key": "AZURE_REGISTRY_IMAGE",
-                    "value": login_server
-                    + "/"
-                    + gl_project.path_with_namespace,
-                }
+
+            # Enable the admin user
+            workflow.add_command(
+                "admin",
+                f"az acr update -n {registry_name} --admin-enabled true",
+                requires=("registry",),
+                check=True,
+                description="Enabling admin user",
             )
-        except gitlab.exceptions.GitlabCreateError:
+
+            # Get the admin's credentials. They aren't recorded, as they
+            # include the passwords
+            workflow.add(
+                "credentials",
+                lambda results: read_json_keys(
+                    f"az acr credential show --resource-group "
+                    f"{resource_group_name} --name {registry_name}",
+                    ["username", "passwords"],
+                ),
+                requires=("admin",),
+                description="Getting admin credentials",
+                checkpoint=False,
+            )
+
+        try:
+            results = workflow.run()
+        except (CommandError, ArmError, WaitTimeoutError) as error:
+            if not isinstance(error, CommandError):
+                console.log(f"[bold red]{error}")
+            console.log(
+                "[bold red]Failed to create the registry.[/bold red] Run the "
+                "command again with --resume to carry on from the failed step."
+            )
+            raise typer.Exit(1)
+
+        if reconcile:
             console.log(
-                "Azure access keys already exist in Gitlab CI for "
-                f"{gl_project.path_with_namespace}"
+                f"{len(client.up_to_date)} resources were already up to date"
             )
-            current_AZURE_REGISTRY = gl_project.variables.get("AZURE_REGISTRY")
-            current_AZURE_REGISTRY.value = login_server
-            current_AZURE_REGISTRY.save()
 
-            current_AZURE_USERNAME = gl_project.variables.get("AZURE_USERNAME")
-            current_AZURE_USERNAME.value = credentials["username"]
-            current_AZURE_USERNAME.save()
+        # Down with JSON, long live the Python
+        login_server = results["registry"]["loginServer"]
+        credentials = results["credentials"]
+        gl_project = results["gitlab_project"]
+
+        save_registry_config(
+            console,
+            config,
+            gl_project,
+            resource_group_name,
+            registry_name,
+            login_server,
+            credentials,
+        )
 
-            current_AZURE_PASSWORD = gl_project.variables.get("AZURE_PASSWORD")
-            current_AZURE_PASSWORD.value = credentials["passwords"][0]["value"]
-            current_AZURE_PASSWORD.save()
 
-            current_AZURE_REGISTRY_IMAGE = gl_project.variables.get(
-                "AZURE_REGISTRY_IMAGE"
-            )
-            current_AZURE_REGISTRY_IMAGE.value = (
-                login_server + "/" + gl_project.path_with_namespace
-            )
-            current_AZURE_REGISTRY_IMAGE.save()
+def save_registry_config(
+    console: Console,
+    config: ConfigSession,
+    gl_project: Any,
+    resource_group_name: str,
+    registry_name: str,
+    login_server: str,
+    credentials: dict[str, Any],
+) -> None:
+    """Stores the registry in the repo's config, gives Gitlab CI its
+    credentials and generates a .gitlab-ci.yml that pushes to it
+
+    Args:
+        console (Console): The console to log to.
+        config (ConfigSession): The repo's config.
+        gl_project (Any): The Gitlab project.
+        resource_group_name (str): The name of the resource group.
+        registry_name (str): The name of the registry.
+        login_server (str): The registry's login server.
+        credentials (dict[str, Any]): The registry's admin credentials.
+    """
+    config.update(
+        {
+            "registry.username": credentials["username"],
+            "registry.password": credentials["passwords"][0]["value"],
+            "registry.url": login_server,
+            "registry.resource_group": resource_group_name,
+            "registry.image": login_server
+            + "/"
+            + gl_project.path_with_namespace
+            + ":latest",
+            "registry.name": registry_name,
+        }
+    )
+    config.commit()
+
+    console.log("Creating Azure access keys in CI")
+    try:
+        gl_project.variables.create(
+            {"key": "AZURE_REGISTRY", "value": login_server}
+        )
+        gl_project.variables.create(
+            {"key": "AZURE_USERNAME", "value": credentials["username"]}
+        )
+        gl_project.variables.create(
+            {
+                "key": "AZURE_PASSWORD",
+                "value": credentials["passwords"][0]["value"],
+            }
+        )
+        gl_project.variables.create(
+            {
+                "key": "AZURE_REGISTRY_IMAGE",
+                "value": login_server + "/" + gl_project.path_with_namespace,
+            }
+        )
+    except gitlab.exceptions.GitlabCreateError:
+        console.log(
+            "Azure access keys already exist in Gitlab CI for "
+            f"{gl_project.path_with_namespace}"
+        )
+        current_AZURE_REGISTRY = gl_project.variables.get("AZURE_REGISTRY")
+        current_AZURE_REGISTRY.value = login_server
+        current_AZURE_REGISTRY.save()
+
+        current_AZURE_USERNAME = gl_project.variables.get("AZURE_USERNAME")
+        current_AZURE_USERNAME.value = credentials["username"]
+        current_AZURE_USERNAME.save()
 
-        console.log("Creating .gitlab-ci.yml")
-        generate_gitlab_yaml(
-            file_name=".gitlab-ci.yml",
-            overwrite=True,
-            template="gitlab-ci-azure.yml",
+        current_AZURE_PASSWORD = gl_project.variables.get("AZURE_PASSWORD")
+        current_AZURE_PASSWORD.value = credentials["passwords"][0]["value"]
+        current_AZURE_PASSWORD.save()
+
+        current_AZURE_REGISTRY_IMAGE = gl_project.variables.get(
+            "AZURE_REGISTRY_IMAGE"
+        )
+        current_AZURE_REGISTRY_IMAGE.value = (
+            login_server + "/" + gl_project.path_with_namespace
         )
+        current_AZURE_REGISTRY_IMAGE.save()
+
+    console.log("Creating .gitlab-ci.yml")
+    generate_gitlab_yaml(
+        file_name=".gitlab-ci.yml",
+        overwrite=True,
+        template="gitlab-ci-azure.yml",
+    )
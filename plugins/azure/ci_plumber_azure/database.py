@@ -1,13 +1,26 @@
-import json
 import random
 from enum import Enum
 from pathlib import Path
+from typing import Optional
 
 import typer
+from ci_plumber_azure.arm import (
+    ArmClient,
+    ArmError,
+    Operation,
+    OperationPoller,
+)
+from ci_plumber_azure.default_generators import (
+    Engine,
+    Locations,
+    get_engine,
+    get_reconcile,
+    get_resource_group,
+)
 from rich.console import Console
 
-from ci_plumber.helpers import run_command
-from ci_plumber_azure.default_generators import Locations, get_resource_group
+from ci_plumber.helpers import CommandError, WaitTimeoutError, read_json_keys
+from ci_plumber.helpers.workflow import Checkpoint, Results, Workflow
 
 
 class DatabaseSku(str, Enum):
@@ -81,59 +94,211 @@ def create_database(
         hide_input=True,
         confirmation_prompt=True,
     ),
+    engine: Engine = get_engine(),
+    no_wait: bool = typer.Option(
+        False,
+        "--no-wait",
+        help="Start creating the server without waiting for it, with "
+        "--engine arm. Run the command again with --resume to wait for it.",
+    ),
+    reconcile: bool = get_reconcile(),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue the last run from the steps that didn't finish, "
+        "using the options of the last run.",
+    ),
+    log_file: Optional[Path] = typer.Option(
+        None, help="Append the output of the az commands to this file."
+    ),
 ) -> None:
     """Create a database in Azure"""
 
     console = Console()
+    if no_wait and engine != Engine.arm:
+        console.log("[bold red]--no-wait needs --engine arm")
+        raise typer.Exit(1)
+    if reconcile and engine != Engine.arm:
+        console.log("[bold red]--reconcile needs --engine arm")
+        raise typer.Exit(1)
 
     with console.status(
         "[bold green]Creating the database...", spinner="clock"
-    ):
-
-        console.log("Initialising Server. [dim]This may take a while...[/dim]")
-        # Create the database
-        run_command(
-            f"az mariadb server create "
-            f"--resource-group {resource_group} "
-            f"--name {name}  "
-            f"--location {location} "
-            f"--admin-user {admin_username} "
-            f"--admin-password {admin_password} "
-            f"--sku-name {sku} "
-            f"--version {version} "
-            f"--backup-retention {backup_retention} "
-            f"--ssl-enforcement {ssl} "
-            f"--storage-size {storage} "
-            f"--geo-redundant-backup {geo_redundant} "
-            "--only-show-errors"
+    ) as status:
+        # The admin password isn't stored, so it is always the one given
+        checkpoint = Checkpoint("azure.create-db", resume, keep=no_wait)
+        options = checkpoint.start(
+            {
+                "name": name,
+                "resource_group": resource_group,
+                "sku": sku,
+                "backup_retention": backup_retention,
+                "geo_redundant": geo_redundant,
+                "location": location,
+                "ssl": ssl,
+                "storage": storage,
+                "version": version,
+                "admin_username": admin_username,
+            }
         )
+        name = options["name"]
+        resource_group = options["resource_group"]
+        sku = options["sku"]
+        backup_retention = options["backup_retention"]
+        geo_redundant = options["geo_redundant"]
+        location = options["location"]
+        ssl = options["ssl"]
+        storage = options["storage"]
+        version = options["version"]
+        admin_username = options["admin_username"]
 
-        # console.log(create)
-
-        credentials_json = run_command(
-            "az mariadb server show "
-            f"--resource-group {resource_group} "
-            f"--name {name}"
+        workflow = Workflow(
+            console, checkpoint=checkpoint, status=status, log_file=log_file
         )
-        credentials = json.loads(credentials_json)
+
+        if engine == Engine.arm:
+            client = ArmClient()
+
+            poller = OperationPoller(client)
+
+            if reconcile:
+                workflow.add(
+                    "snapshot",
+                    lambda results: client.load_snapshot(resource_group),
+                    checkpoint=False,
+                    description="Reading the existing resources",
+                )
+
+            # Only the operation is recorded, so that a resumed run waits for
+            # it rather than creating the server again
+            workflow.add(
+                "server",
+                lambda results: client.begin_create_mariadb_server(
+                    resource_group,
+                    name,
+                    location,
+                    sku,
+                    version,
+                    admin_username,
+                    admin_password,
+                    ssl,
+                    storage,
+                    backup_retention,
+                    geo_redundant,
+                )._asdict(),
+                requires=("snapshot",) if reconcile else (),
+                description="Initialising Server. "
+                "[dim]This may take a while...",
+            )
+
+            # The server is returned once it has been provisioned, so its
+            # details don't need to be fetched again
+            async def wait_for_server(results: Results) -> dict[str, str]:
+                server = await poller.wait(Operation(**results["server"]))
+                return {
+                    "administratorLogin": server["properties"][
+                        "administratorLogin"
+                    ],
+                    "fullyQualifiedDomainName": server["properties"][
+                        "fullyQualifiedDomainName"
+                    ],
+                }
+
+            if not no_wait:
+                workflow.add(
+                    "credentials", wait_for_server, requires=("server",)
+                )
+        else:
+            # Create the database
+            workflow.add_command(
+                "server",
+                f"az mariadb server create "
+                f"--resource-group {resource_group} "
+                f"--name {name}  "
+                f"--location {location} "
+                f"--admin-user {admin_username} "
+                f"--admin-password {admin_password} "
+                f"--sku-name {sku} "
+                f"--version {version} "
+                f"--backup-retention {backup_retention} "
+                f"--ssl-enforcement {ssl} "
+                f"--storage-size {storage} "
+                f"--geo-redundant-backup {geo_redundant} "
+                "--only-show-errors",
+                check=True,
+                stream=True,
+                description="Initialising Server. "
+                "[dim]This may take a while...",
+            )
+
+            workflow.add(
+                "credentials",
+                lambda results: read_json_keys(
+                    "az mariadb server show "
+                    f"--resource-group {resource_group} "
+                    f"--name {name}",
+                    ["administratorLogin", "fullyQualifiedDomainName"],
+                ),
+                requires=("server",),
+            )
+
+        try:
+            results = workflow.run()
+        except (CommandError, ArmError, WaitTimeoutError) as error:
+            if not isinstance(error, CommandError):
+                console.log(f"[bold red]{error}")
+            console.log(
+                "[bold red]Failed to create the database.[/bold red] Run the "
+                "command again with --resume to carry on from the failed step."
+            )
+            raise typer.Exit(1)
+
+        if reconcile:
+            console.log(
+                f"{len(client.up_to_date)} resources were already up to date"
+            )
+
+        if no_wait:
+            console.log(
+                "Started creating the server. Run the command again with "
+                "--resume to wait for it and write maria.env."
+            )
+            return
+
+        credentials = results["credentials"]
 
         console.log("Created Database")
         console.log("The credentials have been written to [bold]maria.env")
         # console.log(credentials)
 
-        # If there isn't a database config file, create one.
-        db_config_file: Path = Path.cwd() / "maria.env"
-        if not db_config_file.exists():
-            db_config_file.touch()
-            with db_config_file.open("w") as fp:
-                fp.writelines(
-                    [
-                        f"ADMIN={credentials['adminstratorLogin']}\n"
-                        f"ADMIN_PASSWORD={admin_password}\n"
-                        f"HOST={credentials['fullyQualifiedDomainName']}\n"
-                        f"NAME={name}\n"
-                    ]
-                )
-        # TODO Check for duplication in the gitignore file.
-        with (Path.cwd() / ".gitignore").open("a") as fp:
-            fp.write("maria.env\n")
+        write_db_config(name, credentials, admin_password)
+
+
+def write_db_config(
+    name: str, credentials: dict[str, str], admin_password: str
+) -> None:
+    """Writes the database's credentials to maria.env, unless it exists, and
+    adds it to .gitignore
+
+    Args:
+        name (str): The name of the server.
+        credentials (dict[str, str]): The server's administratorLogin and
+            fullyQualifiedDomainName.
+        admin_password (str): The password of the administrator.
+    """
+    # If there isn't a database config file, create one.
+    db_config_file: Path = Path.cwd() / "maria.env"
+    if not db_config_file.exists():
+        db_config_file.touch()
+        with db_config_file.open("w") as fp:
+            fp.writelines(
+                [
+                    f"ADMIN={credentials['administratorLogin']}\n"
+                    f"ADMIN_PASSWORD={admin_password}\n"
+                    f"HOST={credentials['fullyQualifiedDomainName']}\n"
+                    f"NAME={name}\n"
+                ]
+            )
+    # TODO Check for duplication in the gitignore file.
+    with (Path.cwd() / ".gitignore").open("a") as fp:
+        fp.write("maria.env\n")
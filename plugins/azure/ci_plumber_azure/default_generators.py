@@ -3,7 +3,7 @@ from typing import Any
 
 import typer
 
-from ci_plumber.helpers import get_config, get_repo
+from ci_plumber.helpers import config_option
 
 
 class Locations(str, Enum):
@@ -79,61 +79,51 @@ class Locations(str, Enum):
     qatarcentral = "qatarcentral"
 
 
+class Engine(str, Enum):
+    """The ways of talking to Azure."""
+
+    cli = "cli"
+    arm = "arm"
+
+
+def get_engine() -> Any:
+    return typer.Option(
+        Engine.cli,
+        help="Whether to run Azure CLI for each step, or to talk to Azure "
+        "Resource Manager directly over one connection.",
+    )
+
+
+def get_reconcile() -> Any:
+    return typer.Option(
+        False,
+        "--reconcile",
+        help="Read the resource group's existing resources first, and only "
+        "create or update those that differ, with --engine arm.",
+    )
+
+
 def get_resource_group() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.resource_group"),
-            help="The name of the resource group to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            "myResourceGroup",
-            help="The name of the resource group to use.",
-            prompt=True,
-        )
+    return config_option(
+        "registry.resource_group",
+        help="The name of the resource group to use.",
+        default="myResourceGroup",
+    )
 
 
 def get_image() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.image"),
-            help="The name of the image to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            ...,
-            help="The name of the image to use.",
-            prompt=True,
-        )
+    return config_option(
+        "registry.image", help="The name of the image to use."
+    )
 
 
 def get_login_server() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.url"),
-            help="The name of the login server to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            ...,
-            help="The name of the login server to use.",
-            prompt=True,
-        )
+    return config_option(
+        "registry.url", help="The name of the login server to use."
+    )
 
 
 def get_registry_name() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.name"),
-            help="The name of the registry to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            ...,
-            help="The name of the registry to use.",
-            prompt=True,
-        )
+    return config_option(
+        "registry.name", help="The name of the registry to use."
+    )
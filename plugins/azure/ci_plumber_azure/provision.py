@@ -0,0 +1,419 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import typer
+from ci_plumber_azure.arm import (
+    ArmClient,
+    ArmError,
+    Operation,
+    OperationPoller,
+)
+from ci_plumber_azure.create_app import grant_acr_pull
+from ci_plumber_azure.create_registry import Skus, save_registry_config
+from ci_plumber_azure.database import (
+    SSL,
+    DatabaseSku,
+    GeoRedundant,
+    write_db_config,
+)
+from ci_plumber_azure.default_generators import Locations
+from ci_plumber_gitlab.auth import get_gitlab_client
+from rich.console import Console
+
+from ci_plumber.helpers import (
+    CommandError,
+    ConfigSession,
+    WaitTimeoutError,
+    get_repo,
+)
+from ci_plumber.helpers.workflow import Checkpoint, Results, Workflow
+
+# The settings that a spec doesn't have to give
+DEFAULT_SPEC: dict[str, Any] = {
+    "resource_group": "myResourceGroup",
+    "location": Locations.uksouth.value,
+    "registry": {"sku": Skus.Basic.value},
+    "database": {
+        "sku": DatabaseSku.basic.value,
+        "version": "10.2",
+        "admin_username": "myadmin",
+        "storage": 51200,
+        "backup_retention": 7,
+        "geo_redundant": GeoRedundant.disabled.value,
+        "ssl": SSL.enabled.value,
+    },
+    "app": {"service_plan": "myServicePlan", "os_type": "linux"},
+}
+
+# The resources that a spec must name
+RESOURCES = ("registry", "database", "app")
+
+
+def load_spec(spec_file: Path) -> dict[str, Any]:
+    """Loads the spec of an environment, filling in the defaults, e.g.
+
+    {
+        "resource_group": "myResourceGroup",
+        "location": "uksouth",
+        "registry": {"name": "myregistry"},
+        "database": {"name": "my-database"},
+        "app": {"name": "myApp", "service_plan": "myServicePlan"}
+    }
+
+    Args:
+        spec_file (Path): The path to the spec.
+
+    Raises:
+        typer.BadParameter: If the spec isn't valid.
+
+    Returns:
+        dict[str, Any]: The spec.
+    """
+    try:
+        with spec_file.open("r") as fp:
+            given = json.load(fp)
+    except ValueError as error:
+        raise typer.BadParameter(f"{spec_file} isn't valid JSON: {error}")
+    if not isinstance(given, dict):
+        raise typer.BadParameter(f"{spec_file} isn't a JSON object")
+    spec = {**DEFAULT_SPEC, **given}
+    for resource in RESOURCES:
+        if not isinstance(given.get(resource, {}), dict):
+            raise typer.BadParameter(
+                f"The {resource} in {spec_file} isn't a JSON object"
+            )
+        spec[resource] = {**DEFAULT_SPEC[resource], **given.get(resource, {})}
+        if "name" not in spec[resource]:
+            raise typer.BadParameter(
+                f"{spec_file} doesn't name the {resource}"
+            )
+    choices = (
+        ("location", spec["location"], Locations),
+        ("registry sku", spec["registry"]["sku"], Skus),
+        ("database sku", spec["database"]["sku"], DatabaseSku),
+    )
+    for setting, value, options in choices:
+        allowed = [option.value for option in options]
+        if value not in allowed:
+            raise typer.BadParameter(
+                f"The {setting} in {spec_file} must be one of: "
+                + ", ".join(allowed)
+            )
+    return spec
+
+
+def provision(
+    spec_file: Path = typer.Option(
+        Path("environment.json"),
+        "--spec",
+        exists=True,
+        dir_okay=False,
+        help="A JSON file describing the registry, database and app.",
+    ),
+    admin_password: str = typer.Option(
+        ...,
+        help="The password of the database's administrator.",
+        prompt=True,
+        hide_input=True,
+        confirmation_prompt=True,
+    ),
+    verbose: bool = typer.Option(
+        False, "--verbose", "-v", help="Verbose output."
+    ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue the last run from the steps that didn't finish, "
+        "using the spec of the last run.",
+    ),
+    reconcile: bool = typer.Option(
+        False,
+        "--reconcile",
+        help="Read the resource group's existing resources first, and only "
+        "create or update those that differ from the spec.",
+    ),
+) -> None:
+    """Provision a registry, database and web app from one spec"""
+    console = Console()
+    spec = load_spec(spec_file)
+
+    with console.status(
+        "[bold green]Provisioning the environment...", spinner="clock"
+    ) as status:
+        repo = get_repo()
+        config = ConfigSession(repo)
+        # The registry's credentials are stored in the Gitlab project
+        try:
+            config.get("code_store.project_id")
+        except KeyError:
+            console.log(
+                "[bold red]This repo isn't linked to a Gitlab project."
+                "[/bold red] Run ci-plumber gitlab init first."
+            )
+            raise typer.Exit(1)
+
+        checkpoint = Checkpoint("azure.provision", resume, repo)
+        spec = checkpoint.start({"spec": spec})["spec"]
+
+        workflow = Workflow(
+            console,
+            limit=6,
+            verbose=verbose,
+            checkpoint=checkpoint,
+            status=status,
+        )
+        client = add_provision_steps(
+            workflow, spec, admin_password, config, reconcile
+        )
+
+        try:
+            results = workflow.run()
+        except (CommandError, ArmError, WaitTimeoutError) as error:
+            if not isinstance(error, CommandError):
+                console.log(f"[bold red]{error}")
+            console.log(
+                "[bold red]Failed to provision the environment.[/bold red] "
+                "Run the command again with --resume to carry on from the "
+                "failed step."
+            )
+            raise typer.Exit(1)
+
+        if reconcile:
+            console.log(
+                f"{len(client.up_to_date)} resources were already up to date"
+            )
+
+        save_registry_config(
+            console,
+            config,
+            results["gitlab_project"],
+            spec["resource_group"],
+            spec["registry"]["name"],
+            results["registry"]["loginServer"],
+            results["credentials"],
+        )
+        write_db_config(
+            spec["database"]["name"], results["database"], admin_password
+        )
+        console.log(
+            "The database's credentials have been written to [bold]maria.env"
+        )
+        console.log(
+            f"Deployed to https://{spec['app']['name'].lower()}"
+            ".azurewebsites.net"
+        )
+        console.log(
+            "[dim]It will come online once Gitlab CI has pushed the image"
+        )
+
+
+def add_provision_steps(
+    workflow: Workflow,
+    spec: dict[str, Any],
+    admin_password: str,
+    config: ConfigSession,
+    reconcile: bool = False,
+) -> ArmClient:
+    """Adds the steps that provision an environment through Azure Resource
+    Manager. The resource group is created first, then the registry,
+    database server and App Service plan are created at once. The web app
+    is then created, given access to the registry and told how to reach the
+    database.
+
+    Args:
+        workflow (Workflow): The workflow to add the steps to.
+        spec (dict[str, Any]): The spec of the environment.
+        admin_password (str): The password of the database's administrator.
+        config (ConfigSession): The repo's config.
+        reconcile (bool, optional): Whether to read the existing resources
+            first, and only write those that differ. Defaults to False.
+
+    Returns:
+        ArmClient: The client the steps use.
+    """
+    client = ArmClient()
+    poller = OperationPoller(client)
+    resource_group = spec["resource_group"]
+    location = spec["location"]
+    registry = spec["registry"]
+    database = spec["database"]
+    app = spec["app"]
+
+    def get_gitlab_project(results: Results) -> Any:
+        gl = get_gitlab_client()
+        return gl.projects.get(config.get("code_store.project_id"))
+
+    workflow.add("gitlab_project", get_gitlab_project, checkpoint=False)
+
+    # Everything else is created after the existing resources have been read
+    if reconcile:
+        workflow.add(
+            "snapshot",
+            lambda results: client.load_snapshot(resource_group),
+            checkpoint=False,
+            description="Reading the existing resources",
+        )
+
+    workflow.add(
+        "group",
+        lambda results: client.create_resource_group(resource_group, location),
+        requires=("snapshot",) if reconcile else (),
+        description=f"Creating resource group {resource_group}",
+    )
+
+    # The registry, server and plan only need the resource group
+    async def create_registry(results: Results) -> dict[str, str]:
+        operation = await asyncio.to_thread(
+            client.begin_create_registry,
+            resource_group,
+            registry["name"],
+            registry["sku"],
+            location,
+        )
+        created = await poller.wait(operation)
+        return {"loginServer": created["properties"]["loginServer"]}
+
+    workflow.add(
+        "registry",
+        create_registry,
+        requires=("group",),
+        description=f"Creating registry {registry['name']}",
+    )
+
+    # The credentials aren't recorded, as they include the passwords
+    workflow.add(
+        "credentials",
+        lambda results: client.registry_credentials(
+            resource_group, registry["name"]
+        ),
+        requires=("registry",),
+        checkpoint=False,
+    )
+
+    # Only the operation is recorded, so that a resumed run waits for it
+    # rather than creating the server again
+    workflow.add(
+        "server",
+        lambda results: client.begin_create_mariadb_server(
+            resource_group,
+            database["name"],
+            location,
+            database["sku"],
+            database["version"],
+            database["admin_username"],
+            admin_password,
+            database["ssl"],
+            database["storage"],
+            database["backup_retention"],
+            database["geo_redundant"],
+        )._asdict(),
+        requires=("group",),
+        description=f"Creating database server {database['name']}. "
+        "[dim]This may take a while...",
+    )
+
+    async def wait_for_server(results: Results) -> dict[str, str]:
+        server = await poller.wait(Operation(**results["server"]))
+        return {
+            "administratorLogin": server["properties"]["administratorLogin"],
+            "fullyQualifiedDomainName": server["properties"][
+                "fullyQualifiedDomainName"
+            ],
+        }
+
+    workflow.add("database", wait_for_server, requires=("server",))
+
+    workflow.add(
+        "firewall",
+        lambda results: client.allow_azure_services(
+            resource_group, database["name"]
+        ),
+        requires=("database",),
+        description="Letting Azure services connect to the database",
+    )
+
+    workflow.add(
+        "service_plan",
+        lambda results: client.create_app_service_plan(
+            resource_group, app["service_plan"], app["os_type"]
+        ),
+        requires=("group",),
+        description="Creating app service plan",
+    )
+
+    def image(results: Results) -> str:
+        return app.get("image") or (
+            f"{results['registry']['loginServer']}/"
+            f"{results['gitlab_project'].path_with_namespace}:latest"
+        )
+
+    workflow.add(
+        "web_app",
+        lambda results: client.begin_create_web_app(
+            resource_group, app["name"], app["service_plan"], image(results)
+        )._asdict(),
+        requires=("service_plan", "registry", "gitlab_project"),
+        description=f"Creating web app {app['name']}",
+    )
+
+    async def wait_for_web_app(results: Results) -> str:
+        web_app = await poller.wait(Operation(**results["web_app"]))
+        return web_app["identity"]["principalId"]
+
+    workflow.add("principal_id", wait_for_web_app, requires=("web_app",))
+
+    workflow.add(
+        "grant",
+        lambda results: grant_acr_pull(
+            client, resource_group, registry["name"], results["principal_id"]
+        ),
+        requires=("principal_id", "registry"),
+        description="Granting permission to access container registry",
+    )
+
+    workflow.add(
+        "configure",
+        lambda results: client.update_site_config(
+            resource_group, app["name"], {"acrUseManagedIdentityCreds": True}
+        ),
+        requires=("principal_id",),
+        description="Configuring app to use managed identity",
+    )
+
+    # The app settings are replaced as a whole, so this finishes before the
+    # deploy step sets the registry's URL. Only the names of the settings
+    # are recorded, as one of them is the password
+    def set_database_settings(results: Results) -> list[str]:
+        settings = {
+            "DB_HOST": results["database"]["fullyQualifiedDomainName"],
+            "DB_ADMIN": (
+                f"{results['database']['administratorLogin']}@"
+                f"{database['name']}"
+            ),
+            "DB_ADMIN_PASSWORD": admin_password,
+            "DB_NAME": database["name"],
+        }
+        client.update_app_settings(resource_group, app["name"], settings)
+        return sorted(settings)
+
+    workflow.add(
+        "app_settings",
+        set_database_settings,
+        requires=("principal_id", "database"),
+        description="Giving the app the database's details",
+    )
+
+    workflow.add(
+        "deploy",
+        lambda results: client.set_container(
+            resource_group,
+            app["name"],
+            image(results),
+            f"https://{results['registry']['loginServer']}",
+        ),
+        requires=("grant", "configure", "app_settings", "gitlab_project"),
+        description="Deploying",
+    )
+    return client
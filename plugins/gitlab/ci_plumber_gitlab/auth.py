@@ -1,14 +1,14 @@
 import gitlab
 
-from ci_plumber.helpers import get_config, get_repo
+from ci_plumber.helpers import ConfigSession, get_repo
 
 
 def get_gitlab_client() -> gitlab.Gitlab:
     # Load the config
-    repo = get_repo()
+    config = ConfigSession(get_repo())
 
-    gitlab_url = get_config(repo, "code_store.url")
-    access_token = get_config(repo, "code_store.access_token")
+    gitlab_url = config.get("code_store.url")
+    access_token = config.get("code_store.access_token")
 
     if "http" not in gitlab_url:
         gl = gitlab.Gitlab("https://" + gitlab_url, private_token=access_token)
@@ -4,11 +4,12 @@ import typer
 from rich.console import Console
 
 from ci_plumber.helpers import (
+    ConfigSession,
     generate_docker_file,
     generate_gitlab_yaml,
     get_repo,
+    set_config,
 )
-from ci_plumber.helpers.config_helpers import set_config
 from ci_plumber_gitlab.auth import get_gitlab_client
 
 
@@ -37,15 +38,20 @@ def init(
     ) as _:
         console.print("Getting remote")
         remote = get_repo(Path.cwd())
-        set_config(remote, "code_store.url", gitlab_url)
-        set_config(remote, "code_store.username", username)
-        set_config(remote, "registry.username", username)
-        set_config(remote, "registry.url", docker_registry_url)
-        set_config(remote, "code_store.email", email)
-        set_config(remote, "registry.email", email)
-        set_config(remote, "code_store.access_token", access_token)
-        set_config(remote, "registry.password", access_token)
-        set_config(remote, "code_store.type", "gitlab")
+        with ConfigSession(remote) as config:
+            config.update(
+                {
+                    "code_store.url": gitlab_url,
+                    "code_store.username": username,
+                    "registry.username": username,
+                    "registry.url": docker_registry_url,
+                    "code_store.email": email,
+                    "registry.email": email,
+                    "code_store.access_token": access_token,
+                    "registry.password": access_token,
+                    "code_store.type": "gitlab",
+                }
+            )
 
         console.log("Logging in to Gitlab")
         gl = get_gitlab_client()
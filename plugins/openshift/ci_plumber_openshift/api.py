@@ -0,0 +1,825 @@
+import base64
+import json
+import math
+from time import monotonic, sleep
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+from ci_plumber_openshift.client import get_client
+from kubernetes.client.exceptions import ApiException
+from openshift.dynamic import DynamicClient
+from openshift.dynamic.exceptions import (
+    ConflictError,
+    DynamicApiError,
+    ForbiddenError,
+    NotFoundError,
+)
+
+from ci_plumber.helpers import RetryPolicy
+from ci_plumber.helpers.run_command import backoff_delays
+
+T = TypeVar("T")
+
+# A new project's service accounts and permissions are created in the
+# background, so requests made straight after creating it may fail
+PROJECT_SETUP_RETRY = RetryPolicy(attempts=6)
+
+# How long an imported image may take to appear, which is needed to find the
+# ports that the app listens on
+IMAGE_IMPORT_RETRY = RetryPolicy(attempts=6, base_delay=2.0)
+
+# How long to wait for a router to admit a route, in seconds
+ROUTE_TIMEOUT = 60
+
+# How long to wait for an app to be ready, in seconds
+ROLLOUT_TIMEOUT = 600
+
+# How many objects to fetch per request when listing
+PAGE_SIZE = 250
+
+# The ports used if the image doesn't say which ones it exposes
+DEFAULT_PORTS = [(8080, "TCP")]
+
+# The status of a watch whose resource version is too old to resume from
+GONE = 410
+
+# The annotation holding the revision of a Deployment and its ReplicaSets
+REVISION_ANNOTATION = "deployment.kubernetes.io/revision"
+
+
+class RolloutTimeoutError(TimeoutError):
+    """Raised when an app isn't ready before the deadline"""
+
+    def __init__(self, name: str, phase: str, timeout: float) -> None:
+        super().__init__(
+            f"'{name}' wasn't ready after {timeout}s, while waiting for: "
+            f"{phase}"
+        )
+        self.name = name
+        self.phase = phase
+        self.timeout = timeout
+
+
+def docker_config_secret(
+    name: str, server: str, username: str, password: str, email: str
+) -> dict[str, Any]:
+    """Builds a pull secret, like `oc create secret docker-registry` does
+
+    Args:
+        name (str): The name of the secret.
+        server (str): The registry's server.
+        username (str): The username to log in with.
+        password (str): The password to log in with.
+        email (str): The email address of the user.
+
+    Returns:
+        dict[str, Any]: The secret.
+    """
+    auth = base64.b64encode(f"{username}:{password}".encode()).decode()
+    docker_config = {
+        "auths": {
+            server: {
+                "username": username,
+                "password": password,
+                "email": email,
+                "auth": auth,
+            }
+        }
+    }
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {"name": name},
+        "type": "kubernetes.io/dockerconfigjson",
+        "data": {
+            ".dockerconfigjson": base64.b64encode(
+                json.dumps(docker_config).encode()
+            ).decode()
+        },
+    }
+
+
+def pull_secrets_patch(
+    service_account: dict[str, Any], secrets: Iterable[str]
+) -> Optional[dict[str, Any]]:
+    """Builds a patch that adds pull secrets to a service account, keeping
+    the secrets it already has, such as the dockercfg secret that OpenShift
+    generates. imagePullSecrets has no merge key, so the patch replaces the
+    whole list. It carries the service account's resourceVersion, so it is
+    rejected with a conflict if the account has changed since it was read.
+
+    Args:
+        service_account (dict[str, Any]): The service account.
+        secrets (Iterable[str]): The names of the secrets.
+
+    Returns:
+        Optional[dict[str, Any]]: The patch, or None if the service account
+            already has every secret.
+    """
+    current = service_account.get("imagePullSecrets") or []
+    linked = {secret["name"] for secret in current}
+    missing = [secret for secret in secrets if secret not in linked]
+    if not missing:
+        return None
+    return {
+        "metadata": {
+            "resourceVersion": service_account["metadata"]["resourceVersion"]
+        },
+        "imagePullSecrets": [
+            *current,
+            *({"name": secret} for secret in missing),
+        ],
+    }
+
+
+def admitted_host(route: dict[str, Any]) -> Optional[str]:
+    """Gets the host of a route that a router has admitted
+
+    Args:
+        route (dict[str, Any]): The route.
+
+    Returns:
+        Optional[str]: The host, or None if no router has admitted the route.
+    """
+    for ingress in route.get("status", {}).get("ingress") or []:
+        for condition in ingress.get("conditions") or []:
+            if (
+                condition.get("type") == "Admitted"
+                and condition.get("status") == "True"
+            ):
+                return ingress.get("host") or route["spec"].get("host")
+    return None
+
+
+def iter_pages(
+    resource: Any, page_size: int = PAGE_SIZE, **params: Any
+) -> Iterator[list[dict[str, Any]]]:
+    """Lists objects a page at a time, using limit and continue, so that
+    large lists don't have to be fetched in one response
+
+    Args:
+        resource (Any): The resource to list.
+        page_size (int, optional): How many objects to fetch per request.
+            Defaults to PAGE_SIZE.
+        **params (Any): Other parameters of the request, e.g. namespace or
+            label_selector.
+
+    Yields:
+        Iterator[list[dict[str, Any]]]: The objects of each page.
+    """
+    token: Optional[str] = None
+    while True:
+        page = resource.get(limit=page_size, _continue=token, **params)
+        page = page.to_dict()
+        yield page.get("items") or []
+        token = page["metadata"].get("continue")
+        if not token:
+            return
+
+
+def label_selector(labels: dict[str, str]) -> str:
+    """Builds a label selector matching every label
+
+    Args:
+        labels (dict[str, str]): The labels.
+
+    Returns:
+        str: The selector, e.g. "app=myapp,deployment=myapp".
+    """
+    return ",".join(f"{key}={value}" for key, value in labels.items())
+
+
+def current_replica_set(
+    deployment: dict[str, Any], replica_set: dict[str, Any]
+) -> bool:
+    """Checks whether a ReplicaSet runs a Deployment's current revision
+
+    Args:
+        deployment (dict[str, Any]): The Deployment.
+        replica_set (dict[str, Any]): The ReplicaSet.
+
+    Returns:
+        bool: Whether the Deployment owns the ReplicaSet and they have the
+            same revision.
+    """
+    owners = replica_set["metadata"].get("ownerReferences") or []
+    owned = any(
+        owner.get("uid") == deployment["metadata"].get("uid")
+        for owner in owners
+    )
+    revision = revision_of(replica_set)
+    current = revision is not None and revision == revision_of(deployment)
+    return owned and current
+
+
+def revision_of(workload: dict[str, Any]) -> Optional[str]:
+    """Gets the revision of a Deployment or ReplicaSet
+
+    Args:
+        workload (dict[str, Any]): The Deployment or ReplicaSet.
+
+    Returns:
+        Optional[str]: The revision, if it has one yet.
+    """
+    annotations = workload["metadata"].get("annotations") or {}
+    return annotations.get(REVISION_ANNOTATION)
+
+
+def rollout_started(workload: dict[str, Any]) -> bool:
+    """Checks whether a Deployment or DeploymentConfig has rolled out its
+    latest version
+
+    Args:
+        workload (dict[str, Any]): The Deployment or DeploymentConfig.
+
+    Returns:
+        bool: Whether every replica is running the latest version.
+    """
+    status = workload.get("status") or {}
+    replicas = workload["spec"].get("replicas", 1)
+    if status.get("observedGeneration", 0) < workload["metadata"].get(
+        "generation", 0
+    ):
+        return False
+    # A DeploymentConfig's latest version is 0 until its image exists
+    if status.get("latestVersion", 1) == 0:
+        return False
+    return status.get("updatedReplicas", 0) >= replicas
+
+
+def pod_ready(pod: dict[str, Any]) -> bool:
+    """Checks whether a pod is ready to serve requests
+
+    Args:
+        pod (dict[str, Any]): The pod.
+
+    Returns:
+        bool: Whether the pod is ready and isn't being deleted.
+    """
+    if pod["metadata"].get("deletionTimestamp"):
+        return False
+    conditions = (pod.get("status") or {}).get("conditions") or []
+    return any(
+        condition.get("type") == "Ready" and condition.get("status") == "True"
+        for condition in conditions
+    )
+
+
+def image_ports(image: dict[str, Any]) -> list[tuple[int, str]]:
+    """Gets the ports that an image exposes
+
+    Args:
+        image (dict[str, Any]): The image, from an image stream tag.
+
+    Returns:
+        list[tuple[int, str]]: The ports and their protocols.
+    """
+    exposed = (
+        image.get("dockerImageMetadata", {})
+        .get("Config", {})
+        .get("ExposedPorts")
+    )
+    if not exposed:
+        return DEFAULT_PORTS
+    ports = []
+    for port in sorted(exposed):
+        number, _, protocol = port.partition("/")
+        ports.append((int(number), (protocol or "tcp").upper()))
+    return ports
+
+
+class OpenShiftApi:
+    """Runs the steps of a deploy through the OpenShift API. Every request
+    goes through one client, so kubeconfig is read once and connections are
+    reused.
+
+    Args:
+        client (DynamicClient): The client to use.
+        namespace (str): The project to deploy to.
+    """
+
+    def __init__(self, client: DynamicClient, namespace: str) -> None:
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_kubeconfig(cls, namespace: str) -> "OpenShiftApi":
+        """Connects using the current kubeconfig context
+
+        Args:
+            namespace (str): The project to deploy to.
+
+        Returns:
+            OpenShiftApi: The API.
+        """
+        return cls(get_client(), namespace)
+
+    def resource(self, api_version: str, kind: str) -> Any:
+        """Gets an API resource, e.g. Secrets
+
+        Args:
+            api_version (str): The API version, e.g. "v1".
+            kind (str): The kind of resource, e.g. "Secret".
+
+        Returns:
+            Any: The resource.
+        """
+        return self.client.resources.get(api_version=api_version, kind=kind)
+
+    def _retry(self, call: Callable[[], T], policy: RetryPolicy) -> T:
+        """Retries a request while the project is still being set up"""
+        delays = backoff_delays(policy)
+        while True:
+            try:
+                return call()
+            except (NotFoundError, ForbiddenError):
+                delay = next(delays, None)
+                if delay is None:
+                    raise
+                sleep(delay)
+
+    def create(self, api_version: str, kind: str, body: dict[str, Any]) -> Any:
+        """Creates an object in the project. If it already exists, it is left
+        as it is, so that a deploy can be run again.
+
+        Args:
+            api_version (str): The API version of the object.
+            kind (str): The kind of object.
+            body (dict[str, Any]): The object.
+
+        Returns:
+            Any: The object.
+        """
+        resource = self.resource(api_version, kind)
+        try:
+            return self._retry(
+                lambda: resource.create(body=body, namespace=self.namespace),
+                PROJECT_SETUP_RETRY,
+            )
+        except ConflictError:
+            return resource.get(
+                name=body["metadata"]["name"], namespace=self.namespace
+            )
+
+    def create_project(self) -> Any:
+        """Creates the project, like `oc new-project`
+
+        Returns:
+            Any: The project.
+        """
+        project_requests = self.resource(
+            "project.openshift.io/v1", "ProjectRequest"
+        )
+        try:
+            return project_requests.create(
+                body={
+                    "apiVersion": "project.openshift.io/v1",
+                    "kind": "ProjectRequest",
+                    "metadata": {"name": self.namespace},
+                }
+            )
+        except ConflictError:
+            return self.resource("project.openshift.io/v1", "Project").get(
+                name=self.namespace
+            )
+
+    def create_pull_secret(
+        self, name: str, server: str, username: str, password: str, email: str
+    ) -> Any:
+        """Creates a pull secret, like `oc create secret docker-registry`
+
+        Args:
+            name (str): The name of the secret.
+            server (str): The registry's server.
+            username (str): The username to log in with.
+            password (str): The password to log in with.
+            email (str): The email address of the user.
+
+        Returns:
+            Any: The secret.
+        """
+        return self.create(
+            "v1",
+            "Secret",
+            docker_config_secret(name, server, username, password, email),
+        )
+
+    def link_secrets(
+        self, service_account: str, secrets: Iterable[str]
+    ) -> Any:
+        """Lets a service account pull images with some secrets, like
+        `oc secrets link --for=pull`. The service account is read and
+        patched with all of the secrets at once, and read again if it
+        changes in between.
+
+        Args:
+            service_account (str): The name of the service account.
+            secrets (Iterable[str]): The names of the secrets.
+
+        Returns:
+            Any: The service account.
+        """
+        secrets = list(secrets)
+        service_accounts = self.resource("v1", "ServiceAccount")
+
+        def link() -> Any:
+            current = service_accounts.get(
+                name=service_account, namespace=self.namespace
+            )
+            patch = pull_secrets_patch(current.to_dict(), secrets)
+            if patch is None:
+                return current
+            return service_accounts.patch(
+                body=patch,
+                name=service_account,
+                namespace=self.namespace,
+                content_type="application/merge-patch+json",
+            )
+
+        delays = backoff_delays(PROJECT_SETUP_RETRY)
+        while True:
+            try:
+                return self._retry(link, PROJECT_SETUP_RETRY)
+            except ConflictError:
+                delay = next(delays, None)
+                if delay is None:
+                    raise
+                sleep(delay)
+
+    def import_image(self, name: str, image: str) -> Any:
+        """Creates an image stream that imports an image on a schedule, like
+        `oc import-image --scheduled --confirm`
+
+        Args:
+            name (str): The name of the image stream.
+            image (str): The image to import.
+
+        Returns:
+            Any: The image stream.
+        """
+        return self.create(
+            "image.openshift.io/v1",
+            "ImageStream",
+            {
+                "apiVersion": "image.openshift.io/v1",
+                "kind": "ImageStream",
+                "metadata": {"name": name},
+                "spec": {
+                    "tags": [
+                        {
+                            "name": "latest",
+                            "from": {"kind": "DockerImage", "name": image},
+                            "importPolicy": {"scheduled": True},
+                            "referencePolicy": {"type": "Source"},
+                        }
+                    ]
+                },
+            },
+        )
+
+    def latest_image(self, name: str) -> dict[str, Any]:
+        """Gets an image stream's latest image, waiting for it to be imported
+
+        Args:
+            name (str): The name of the image stream.
+
+        Returns:
+            dict[str, Any]: The image, or an empty dict if it wasn't imported
+                in time.
+        """
+        tags = self.resource("image.openshift.io/v1", "ImageStreamTag")
+        try:
+            tag = self._retry(
+                lambda: tags.get(
+                    name=f"{name}:latest", namespace=self.namespace
+                ),
+                IMAGE_IMPORT_RETRY,
+            )
+        except NotFoundError:
+            return {}
+        return tag.to_dict().get("image", {})
+
+    def new_app(self, name: str) -> Any:
+        """Creates a deployment and service for an image stream, like
+        `oc new-app`. The deployment is rolled out again whenever the image
+        stream is updated.
+
+        Args:
+            name (str): The name of the image stream, which is also used for
+                the app.
+
+        Returns:
+            Any: The service.
+        """
+        image = self.latest_image(name)
+        ports = image_ports(image)
+        labels = {"app": name, "deployment": name}
+        triggers = [
+            {
+                "from": {"kind": "ImageStreamTag", "name": f"{name}:latest"},
+                "fieldPath": (
+                    "spec.template.spec.containers"
+                    f'[?(@.name=="{name}")].image'
+                ),
+            }
+        ]
+        self.create(
+            "apps/v1",
+            "Deployment",
+            {
+                "apiVersion": "apps/v1",
+                "kind": "Deployment",
+                "metadata": {
+                    "name": name,
+                    "labels": {"app": name},
+                    "annotations": {
+                        "image.openshift.io/triggers": json.dumps(triggers)
+                    },
+                },
+                "spec": {
+                    "replicas": 1,
+                    "selector": {"matchLabels": {"deployment": name}},
+                    "template": {
+                        "metadata": {"labels": labels},
+                        "spec": {
+                            "containers": [
+                                {
+                                    "name": name,
+                                    # Replaced by the trigger once the
+                                    # image has been imported
+                                    "image": image.get(
+                                        "dockerImageReference",
+                                        f"{name}:latest",
+                                    ),
+                                    "ports": [
+                                        {
+                                            "containerPort": port,
+                                            "protocol": protocol,
+                                        }
+                                        for port, protocol in ports
+                                    ],
+                                }
+                            ]
+                        },
+                    },
+                },
+            },
+        )
+        return self.create(
+            "v1",
+            "Service",
+            {
+                "apiVersion": "v1",
+                "kind": "Service",
+                "metadata": {"name": name, "labels": {"app": name}},
+                "spec": {
+                    "selector": {"deployment": name},
+                    "ports": [
+                        {
+                            "name": f"{port}-{protocol.lower()}",
+                            "port": port,
+                            "targetPort": port,
+                            "protocol": protocol,
+                        }
+                        for port, protocol in ports
+                    ],
+                },
+            },
+        )
+
+    def expose(self, name: str) -> Any:
+        """Creates a route to a service's first port, like `oc expose svc`
+
+        Args:
+            name (str): The name of the service.
+
+        Returns:
+            Any: The route.
+        """
+        service = self.resource("v1", "Service").get(
+            name=name, namespace=self.namespace
+        )
+        return self.create(
+            "route.openshift.io/v1",
+            "Route",
+            {
+                "apiVersion": "route.openshift.io/v1",
+                "kind": "Route",
+                "metadata": {"name": name, "labels": {"app": name}},
+                "spec": {
+                    "to": {"kind": "Service", "name": name},
+                    "port": {"targetPort": service.spec.ports[0].name},
+                },
+            },
+        )
+
+    def watch_until(
+        self,
+        resource: Any,
+        check: Callable[[str, dict[str, Any]], bool],
+        deadline: float,
+        **selectors: str,
+    ) -> bool:
+        """Lists objects and then watches them until `check` returns True. If
+        the watch's resource version expires, the objects are listed again
+        and watched from the new version.
+
+        Args:
+            resource (Any): The resource to watch.
+            check (Callable[[str, dict[str, Any]], bool]): Called with the
+                type of each event ("ADDED" for the listed objects) and the
+                object.
+            deadline (float): When to stop watching, from time.monotonic().
+            **selectors (str): label_selector and field_selector.
+
+        Returns:
+            bool: Whether `check` returned True before the deadline.
+        """
+        version: Optional[str] = None
+        expired = True
+        # The server may end a watch early, in which case it is restarted
+        # from the last version seen
+        while expired or monotonic() < deadline:
+            if expired:
+                expired = False
+                listing = resource.get(namespace=self.namespace, **selectors)
+                listing = listing.to_dict()
+                for item in listing.get("items") or []:
+                    if check("ADDED", item):
+                        return True
+                version = listing["metadata"].get("resourceVersion")
+            try:
+                for event in resource.watch(
+                    namespace=self.namespace,
+                    resource_version=version,
+                    timeout=math.ceil(deadline - monotonic()),
+                    **selectors,
+                ):
+                    item = event["raw_object"]
+                    if event["type"] == "ERROR":
+                        raise ApiException(
+                            status=item.get("code"), reason=item.get("reason")
+                        )
+                    version = item["metadata"].get("resourceVersion", version)
+                    if check(event["type"], item):
+                        return True
+            except (DynamicApiError, ApiException) as error:
+                if error.status != GONE:
+                    raise
+                expired = True
+        return False
+
+    def pod_labels(self, workload: dict[str, Any]) -> dict[str, str]:
+        """Gets the labels of the pods of a workload's latest version, so
+        that pods of older versions aren't counted while they shut down
+
+        Args:
+            workload (dict[str, Any]): The Deployment or DeploymentConfig,
+                once its latest version has rolled out.
+
+        Returns:
+            dict[str, str]: The labels.
+        """
+        name = workload["metadata"]["name"]
+        selector = workload["spec"]["selector"]
+        # Deployments use a label selector, DeploymentConfigs a plain map
+        labels = dict(selector.get("matchLabels", selector))
+        if workload.get("kind") == "DeploymentConfig":
+            # Each version is deployed by a replication controller named
+            # after it, which labels its pods
+            version = workload["status"]["latestVersion"]
+            return {**labels, "deployment": f"{name}-{version}"}
+        # Each revision of a Deployment has a ReplicaSet, which labels its
+        # pods with the hash of their template
+        replica_sets = self.resource("apps/v1", "ReplicaSet")
+        for page in iter_pages(
+            replica_sets,
+            namespace=self.namespace,
+            label_selector=label_selector(labels),
+        ):
+            for replica_set in page:
+                if current_replica_set(workload, replica_set):
+                    template_hash = replica_set["metadata"]["labels"][
+                        "pod-template-hash"
+                    ]
+                    return {**labels, "pod-template-hash": template_hash}
+        return labels
+
+    def find_workload(self, name: str) -> tuple[Any, dict[str, Any]]:
+        """Finds the Deployment or DeploymentConfig of an app. oc new-app
+        creates either, depending on the version of OpenShift.
+
+        Args:
+            name (str): The name of the app.
+
+        Raises:
+            NotFoundError: If the app has neither.
+
+        Returns:
+            tuple[Any, dict[str, Any]]: The resource and the workload.
+        """
+        deployments = self.resource("apps/v1", "Deployment")
+        try:
+            workload = deployments.get(name=name, namespace=self.namespace)
+            return deployments, workload.to_dict()
+        except NotFoundError:
+            configs = self.resource("apps.openshift.io/v1", "DeploymentConfig")
+            workload = configs.get(name=name, namespace=self.namespace)
+            return configs, workload.to_dict()
+
+    def wait_for_rollout(
+        self, name: str, timeout: float = ROLLOUT_TIMEOUT
+    ) -> dict[str, float]:
+        """Waits for an app's latest version to be rolled out and for its
+        pods to be ready, by watching them rather than polling.
+
+        Args:
+            name (str): The name of the app's Deployment or DeploymentConfig.
+            timeout (float, optional): How long to wait, in seconds. Defaults
+                to ROLLOUT_TIMEOUT.
+
+        Raises:
+            RolloutTimeoutError: If the app isn't ready in time.
+
+        Returns:
+            dict[str, float]: How long each phase took, in seconds.
+        """
+        start = monotonic()
+        deadline = start + timeout
+        timings: dict[str, float] = {}
+
+        resource, workload = self.find_workload(name)
+        rolled_out: list[dict[str, Any]] = []
+
+        def check_rollout(event: str, item: dict[str, Any]) -> bool:
+            if rollout_started(item):
+                rolled_out.append(item)
+                return True
+            return False
+
+        if not self.watch_until(
+            resource,
+            check_rollout,
+            deadline,
+            field_selector=f"metadata.name={name}",
+        ):
+            raise RolloutTimeoutError(name, "rollout", timeout)
+        timings["rollout"] = monotonic() - start
+
+        # Listed objects don't have a kind, so it's kept from the first get
+        workload = {"kind": workload.get("kind"), **rolled_out[-1]}
+        replicas = workload["spec"].get("replicas", 1)
+        ready: set[str] = set()
+
+        def count_ready(event: str, pod: dict[str, Any]) -> bool:
+            if event != "DELETED" and pod_ready(pod):
+                ready.add(pod["metadata"]["name"])
+            else:
+                ready.discard(pod["metadata"]["name"])
+            return len(ready) >= replicas
+
+        phase_start = monotonic()
+        if replicas and not self.watch_until(
+            self.resource("v1", "Pod"),
+            count_ready,
+            deadline,
+            label_selector=label_selector(self.pod_labels(workload)),
+        ):
+            raise RolloutTimeoutError(name, "pods", timeout)
+        timings["pods"] = monotonic() - phase_start
+        return timings
+
+    def wait_for_route_host(
+        self, name: str, timeout: int = ROUTE_TIMEOUT
+    ) -> Optional[str]:
+        """Gets the host of a route once a router has admitted it. The route
+        is watched rather than polled, so the host is returned as soon as it
+        is admitted.
+
+        Args:
+            name (str): The name of the route.
+            timeout (int, optional): How long to wait for the route to be
+                admitted, in seconds. Defaults to ROUTE_TIMEOUT.
+
+        Returns:
+            Optional[str]: The admitted host. If the route isn't admitted in
+                time, the host it requested, or None if it didn't request
+                one.
+        """
+        routes = self.resource("route.openshift.io/v1", "Route")
+        route = routes.get(name=name, namespace=self.namespace).to_dict()
+        host = admitted_host(route)
+        if host:
+            return host
+        for event in routes.watch(
+            namespace=self.namespace,
+            name=name,
+            resource_version=route["metadata"].get("resourceVersion"),
+            timeout=timeout,
+        ):
+            if event["type"] == "DELETED":
+                return None
+            route = event["raw_object"]
+            host = admitted_host(route)
+            if host:
+                return host
+        return route.get("spec", {}).get("host") or None
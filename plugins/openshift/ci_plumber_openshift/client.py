@@ -0,0 +1,82 @@
+import hashlib
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import typer
+from kubernetes import config
+from openshift.dynamic import DynamicClient
+
+# The directory, inside the app directory, holding the discovery caches
+DISCOVERY_CACHE_DIR = "openshift-discovery"
+
+# How long the server's API discovery results are reused for, in seconds
+DISCOVERY_CACHE_TTL = 6 * 60 * 60
+
+
+def current_context() -> str:
+    """Gets the name of the current kubeconfig context
+
+    Returns:
+        str: The name of the context.
+    """
+    _, context = config.list_kube_config_contexts()
+    return context["name"]
+
+
+def current_namespace() -> str:
+    """Gets the project of the current kubeconfig context, which oc commands
+    use
+
+    Returns:
+        str: The project, or "default" if the context doesn't set one.
+    """
+    _, context = config.list_kube_config_contexts()
+    return context["context"].get("namespace", "default")
+
+
+def get_discovery_cache_file(context: str) -> Path:
+    """Gets the location of a context's discovery cache. Stale caches are
+    removed, so that the client rediscovers the server's APIs.
+
+    Args:
+        context (str): The name of the kubeconfig context.
+
+    Returns:
+        Path: The path to the cache.
+    """
+    cache_dir = Path(typer.get_app_dir("CI-Plumber")) / DISCOVERY_CACHE_DIR
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Context names may contain slashes and colons
+    digest = hashlib.sha256(context.encode()).hexdigest()[:16]
+    cache_file = cache_dir / f"{digest}.json"
+    try:
+        if time.time() - cache_file.stat().st_mtime > DISCOVERY_CACHE_TTL:
+            cache_file.unlink()
+    except FileNotFoundError:
+        pass
+    return cache_file
+
+
+@lru_cache(maxsize=None)
+def _get_client(context: str) -> DynamicClient:
+    return DynamicClient(
+        config.new_client_from_config(context=context),
+        cache_file=str(get_discovery_cache_file(context)),
+    )
+
+
+def get_client(context: Optional[str] = None) -> DynamicClient:
+    """Gets a client for a kubeconfig context. The client is created once per
+    context per process, and the server's API discovery results are cached on
+    disk for DISCOVERY_CACHE_TTL seconds.
+
+    Args:
+        context (Optional[str], optional): The name of the context. Defaults
+            to the current context.
+
+    Returns:
+        DynamicClient: The client.
+    """
+    return _get_client(context or current_context())
@@ -1,65 +1,31 @@
 from typing import Any
 
-import typer
-
-from ci_plumber.helpers import get_config, get_repo
+from ci_plumber.helpers import config_option
 
 
 def get_gitlab_url() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "code_store.url"),
-            help="The URL of the GitLab instance.",
-        )
-    except KeyError:
-        return typer.Option(
-            "git.cardiff.ac.uk",
-            help="The URL of the GitLab instance.",
-            prompt=True,
-        )
+    return config_option(
+        "code_store.url",
+        help="The URL of the GitLab instance.",
+        default="git.cardiff.ac.uk",
+    )
 
 
 def get_docker_registry_url() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.url"),
-            help="The URL of the Docker registry.",
-        )
-    except KeyError:
-        return typer.Option(
-            "registry.git.cf.ac.uk",
-            help="The URL of the Docker registry.",
-            prompt=True,
-        )
+    return config_option(
+        "registry.url",
+        help="The URL of the Docker registry.",
+        default="registry.git.cf.ac.uk",
+    )
 
 
 def get_email() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.email"),
-            help="The email address to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            ...,
-            help="The email address to use.",
-            prompt=True,
-        )
+    return config_option("registry.email", help="The email address to use.")
 
 
 def get_access_token() -> Any:
-    try:
-        repo = get_repo()
-        return typer.Option(
-            get_config(repo, "registry.password"),
-            help="The access token to use.",
-        )
-    except KeyError:
-        return typer.Option(
-            ...,
-            help="The access token to use.",
-            prompt=True,
-        )
+    return config_option("registry.password", help="The access token to use.")
+
+
+def get_username() -> Any:
+    return config_option("username", help="Openshift Username", prompt=True)
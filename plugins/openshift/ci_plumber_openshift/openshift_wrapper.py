@@ -1,42 +1,296 @@
-import re
+import asyncio
+import json
+from enum import Enum
 from pathlib import Path
-from typing import Any
+from typing import Any, List, Optional
 
 import typer
-from kubernetes import config
-from openshift.dynamic import DynamicClient
-from rich.console import Console
-
-from ci_plumber.helpers import (
-    get_config,
-    get_config_file,
-    get_repo,
-    load_config,
-    run_command,
-)
 from ci_plumber_gitlab.auth import get_gitlab_client
+from ci_plumber_openshift.api import (
+    PAGE_SIZE,
+    ROLLOUT_TIMEOUT,
+    OpenShiftApi,
+    RolloutTimeoutError,
+    admitted_host,
+    iter_pages,
+)
+from ci_plumber_openshift.client import (
+    current_context,
+    current_namespace,
+    get_client,
+)
 from ci_plumber_openshift.default_generators import (
     get_access_token,
     get_docker_registry_url,
     get_email,
     get_gitlab_url,
+    get_username,
 )
+from kubernetes.client.exceptions import ApiException
+from openshift.dynamic.exceptions import DynamicApiError
+from rich.console import Console
+
+from ci_plumber.helpers import (
+    CommandError,
+    gather_limited,
+    get_config,
+    get_repo,
+    run_command,
+)
+from ci_plumber.helpers.workflow import Results, Workflow
+
+
+class Engine(str, Enum):
+    """Enum for the ways of talking to OpenShift"""
+
+    api = "api"
+    oc = "oc"
+
+
+class OutputFormat(str, Enum):
+    """Enum for the output formats of listings"""
+
+    text = "text"
+    json = "json"
+
+
+SERVICE_ACCOUNTS = ("builder", "default", "deployer")
+PULL_SECRETS = ("gitlab", "gitlab-delegated")
+
+# The errors that requests to the OpenShift API raise
+API_ERRORS = (DynamicApiError, ApiException)
 
 
-def get_username() -> Any:
-    try:
-        return load_config(get_config_file(), get_repo(Path.cwd()))[0][
-            "username"
-        ]
-    except KeyError:
-        return ...
+def log_api_error(console: Console, error: Exception) -> None:
+    """Logs a failed request to the OpenShift API. Only its status and
+    reason are logged, as the request may hold secrets.
+
+    Args:
+        console (Console): The console to log to.
+        error (Exception): One of API_ERRORS.
+    """
+    status = getattr(error, "status", "")
+    reason = getattr(error, "reason", "")
+    console.log(f"[bold red]Request failed:[/bold red] {status} {reason}")
+
+
+def log_timings(console: Console, timings: dict[str, float]) -> None:
+    """Logs how long each phase of a rollout took
+
+    Args:
+        console (Console): The console to log to.
+        timings (dict[str, float]): The phases' durations, in seconds, keyed
+            by phase.
+    """
+    for phase, seconds in timings.items():
+        console.log(f"Waited {seconds:.1f}s for the {phase}")
+
+
+def add_oc_steps(
+    workflow: Workflow,
+    project: str,
+    username: str,
+    gitlab_url: str,
+    docker_registry_url: str,
+    email: str,
+    access_token: str,
+) -> None:
+    """Adds the steps of a deploy that run oc commands. They require the
+    login and gitlab_project steps, and the host step finds the app's host.
+    """
+    # Create a new project
+    workflow.add_command(
+        "project",
+        f"oc new-project {project}",
+        requires=("login",),
+        description="Creating a new project",
+    )
+
+    workflow.add_command(
+        "secret.gitlab",
+        "oc create secret docker-registry gitlab "
+        f"--docker-server={docker_registry_url} "
+        f"--docker-username={username} "
+        f"--docker-password={access_token} --docker-email={email}",
+        requires=("project",),
+        description="Creating secrets",
+    )
+    workflow.add_command(
+        "secret.gitlab-delegated",
+        "oc create secret docker-registry gitlab-delegated "
+        f"--docker-server={gitlab_url} --docker-username={username} "
+        f"--docker-password={access_token} --docker-email={email}",
+        requires=("project",),
+    )
+
+    # Each service account is linked to all of the secrets at once, rather
+    # than running oc secrets link for every pair. oc keeps the secrets it
+    # already has
+    links = []
+    for service_account in SERVICE_ACCOUNTS:
+        link = f"link.{service_account}"
+        workflow.add_command(
+            link,
+            f"oc secrets link {service_account} {' '.join(PULL_SECRETS)} "
+            "--for=pull",
+            requires=tuple(f"secret.{secret}" for secret in PULL_SECRETS),
+        )
+        links.append(link)
+
+    workflow.add_command(
+        "import_image",
+        lambda results: (
+            f"oc import-image {results['gitlab_project'].path} "
+            f"--from={docker_registry_url}/"
+            f"{results['gitlab_project'].path_with_namespace} "
+            "--scheduled --confirm"
+        ),
+        requires=("project", "gitlab_project"),
+        description="Importing image-stream",
+        stream=True,
+    )
+
+    workflow.add_command(
+        "new_app",
+        lambda results: f"oc new-app {results['gitlab_project'].path}",
+        requires=("import_image", *links),
+        description="Creating a new app",
+        stream=True,
+    )
+
+    workflow.add_command(
+        "expose",
+        lambda results: f"oc expose svc/{results['gitlab_project'].path}",
+        requires=("new_app",),
+        description="Exposing the service",
+    )
+
+    workflow.add_command(
+        "route",
+        lambda results: (
+            f"oc get route/{results['gitlab_project'].path} -o json"
+        ),
+        requires=("expose",),
+        description="Getting the route",
+    )
+
+    def get_host(results: Results) -> Optional[str]:
+        try:
+            route = json.loads(results["route"])
+        except ValueError:
+            workflow.console.log(results["route"])
+            return None
+        return admitted_host(route) or route["spec"].get("host")
+
+    workflow.add("host", get_host, requires=("route",))
+
+
+def add_api_steps(
+    workflow: Workflow,
+    project: str,
+    username: str,
+    gitlab_url: str,
+    docker_registry_url: str,
+    email: str,
+    access_token: str,
+) -> None:
+    """Adds the steps of a deploy that use the OpenShift API. They require
+    the login and gitlab_project steps, and the host step finds the app's
+    host.
+    """
+    # Every step shares the client, and its connections, from here on
+    workflow.add(
+        "client",
+        lambda results: OpenShiftApi.from_kubeconfig(project),
+        requires=("login",),
+    )
+    workflow.add(
+        "project",
+        lambda results: results["client"].create_project(),
+        requires=("client",),
+        description="Creating a new project",
+    )
+    # Later oc commands, such as create-db, use the current project
+    workflow.add_command(
+        "switch_project",
+        f"oc project {project}",
+        requires=("project",),
+    )
+
+    servers = {"gitlab": docker_registry_url, "gitlab-delegated": gitlab_url}
+    for secret, server in servers.items():
+
+        def create_secret(
+            results: Results, secret: str = secret, server: str = server
+        ) -> Any:
+            return results["client"].create_pull_secret(
+                secret, server, username, access_token, email
+            )
+
+        workflow.add(
+            f"secret.{secret}",
+            create_secret,
+            requires=("project",),
+            description="Creating secrets" if secret == "gitlab" else None,
+        )
+
+    links = []
+    for service_account in SERVICE_ACCOUNTS:
+        link = f"link.{service_account}"
+
+        def link_secrets(
+            results: Results, service_account: str = service_account
+        ) -> Any:
+            return results["client"].link_secrets(
+                service_account, PULL_SECRETS
+            )
+
+        workflow.add(
+            link,
+            link_secrets,
+            requires=tuple(f"secret.{secret}" for secret in PULL_SECRETS),
+        )
+        links.append(link)
+
+    workflow.add(
+        "import_image",
+        lambda results: results["client"].import_image(
+            results["gitlab_project"].path,
+            f"{docker_registry_url}/"
+            f"{results['gitlab_project'].path_with_namespace}",
+        ),
+        requires=("project", "gitlab_project"),
+        description="Importing image-stream",
+    )
+    workflow.add(
+        "new_app",
+        lambda results: results["client"].new_app(
+            results["gitlab_project"].path
+        ),
+        requires=("import_image", *links),
+        description="Creating a new app",
+    )
+    workflow.add(
+        "expose",
+        lambda results: results["client"].expose(
+            results["gitlab_project"].path
+        ),
+        requires=("new_app",),
+        description="Exposing the service",
+    )
+    workflow.add(
+        "host",
+        lambda results: results["client"].wait_for_route_host(
+            results["gitlab_project"].path
+        ),
+        requires=("expose",),
+        description="Waiting for the route to be admitted",
+    )
 
 
 def openshift_deploy(
     project: str = typer.Option(..., help="Project name", prompt=True),
-    username: str = typer.Option(
-        get_username(), help="Openshift Username", prompt=True
-    ),
+    username: str = get_username(),
     password: str = typer.Option(
         ...,
         help="Openshift Password",
@@ -48,91 +302,162 @@ def openshift_deploy(
     docker_registry_url: str = get_docker_registry_url(),
     email: str = get_email(),
     access_token: str = get_access_token(),
+    log_file: Optional[Path] = typer.Option(
+        None, help="Append the output of the oc commands to this file."
+    ),
+    engine: Engine = typer.Option(
+        Engine.api,
+        help="Whether to deploy through the OpenShift API, or by running oc "
+        "for each step.",
+    ),
+    wait: bool = typer.Option(
+        False,
+        "--wait",
+        help="Wait for the app to be rolled out and its pods to be ready.",
+    ),
+    deadline: int = typer.Option(
+        ROLLOUT_TIMEOUT,
+        help="How long to wait for the app to be ready, in seconds.",
+    ),
 ) -> None:
     """Deploys a project to OpenShift"""
     console = Console()
 
     with console.status(
         "[bold green]Deploying to Openshift...", spinner="clock"
-    ) as _:
+    ) as status:
         # Load the config
         repo = get_repo(Path.cwd())
 
-        console.log("Logginginto GitLab")
-        gl = get_gitlab_client()
-
-        console.log("Getting the Gitlab project")
-        gl_project = gl.projects.get(get_config(repo, "code_store.project_id"))
-
-        console.log("Loggin in to Openshift")
-        run_command(f"oc login -u {username} -p {password}")
-
-        # Create a new project
-        console.log("Creating a new project")
-        run_command(f"oc new-project {project}")
-
-        console.log("Creating secrets")
-        run_command(
-            "oc create secret docker-registry gitlab "
-            f"--docker-server={docker_registry_url} "
-            f"--docker-username={username} "
-            f"--docker-password={access_token} --docker-email={email}"
-        )
-
-        run_command("oc secrets link builder gitlab --for=pull")
-
-        run_command("oc secrets link default gitlab --for=pull")
-
-        run_command("oc secrets link deployer gitlab --for=pull")
-
-        run_command(
-            "oc create secret docker-registry gitlab-delegated "
-            f"--docker-server={gitlab_url} --docker-username={username} "
-            f"--docker-password={access_token} --docker-email={email}"
+        def get_gitlab_project(results: Results) -> Any:
+            console.log("Logginginto GitLab")
+            gl = get_gitlab_client()
+            console.log("Getting the Gitlab project")
+            return gl.projects.get(get_config(repo, "code_store.project_id"))
+
+        workflow = Workflow(console, limit=6, status=status, log_file=log_file)
+        workflow.add("gitlab_project", get_gitlab_project)
+        # oc login writes the token to kubeconfig, which the API client uses
+        workflow.add_command(
+            "login",
+            f"oc login -u {username} -p {password}",
+            check=True,
+            description="Loggin in to Openshift",
         )
 
-        run_command("oc secrets link builder gitlab-delegated --for=pull")
-
-        run_command("oc secrets link default gitlab-delegated --for=pull")
-
-        run_command("oc secrets link deployer gitlab-delegated --for=pull")
-
-        console.log("Importing image-stream")
-        run_command(
-            f"oc import-image {gl_project.path} "
-            f"--from={docker_registry_url}/{gl_project.path_with_namespace} "
-            "--scheduled --confirm"
+        add_steps = add_api_steps if engine == Engine.api else add_oc_steps
+        add_steps(
+            workflow,
+            project,
+            username,
+            gitlab_url,
+            docker_registry_url,
+            email,
+            access_token,
         )
 
-        console.log("Creating a new app")
-        run_command(f"oc new-app {gl_project.path}")
-
-        console.log("Exposing the service")
-        run_command(f"oc expose svc/{gl_project.path}")
+        if wait:
+            # Runs while the service is exposed
+            def wait_for_rollout(results: Results) -> dict[str, float]:
+                client = results.get("client") or OpenShiftApi.from_kubeconfig(
+                    project
+                )
+                return client.wait_for_rollout(
+                    results["gitlab_project"].path, deadline
+                )
 
-        console.log("Here are the details")
-        # TODO Get the dns out of this
-        routes = run_command(f"oc describe routes/{gl_project.path}")
-        host = re.search(r"Requested Host:[\s]+(\S*)\n", routes)
+            workflow.add(
+                "ready",
+                wait_for_rollout,
+                requires=("new_app",),
+                description="Waiting for the app to be ready",
+            )
+
+        try:
+            results = workflow.run()
+        except RolloutTimeoutError as error:
+            console.log(f"[bold red]{error}")
+            raise typer.Exit(1)
+        except CommandError:
+            # The failed command has already been logged
+            raise typer.Exit(1)
+        except API_ERRORS as error:
+            log_api_error(console, error)
+            raise typer.Exit(1)
+
+        if wait:
+            log_timings(console, results["ready"])
+        host = results["host"]
         if host:
-            console.log(f"Host: {host.group(1)}")
+            console.log(f"Host: {host}")
         else:
             console.log("No host found")
-            console.log(routes)
-
-
-def list_projects() -> None:
-    k8s_client = config.new_client_from_config()
-    dyn_client = DynamicClient(k8s_client)
 
-    v1_projects = dyn_client.resources.get(
-        api_version="project.openshift.io/v1", kind="Project"
-    )
-
-    project_list = v1_projects.get()
 
-    for project in project_list.items:
-        typer.echo(f"{project.metadata.name}")
+def list_projects(
+    context: Optional[List[str]] = typer.Option(
+        None,
+        "--context",
+        help="A kubeconfig context to list the projects of. Can be given "
+        "more than once to query several clusters at once. Defaults to the "
+        "current context.",
+    ),
+    output: OutputFormat = typer.Option(
+        OutputFormat.text,
+        "--output",
+        "-o",
+        help="Print project names, or one JSON object per project.",
+    ),
+    page_size: int = typer.Option(
+        PAGE_SIZE, help="How many projects to fetch per request."
+    ),
+) -> None:
+    """Lists the projects on OpenShift"""
+    console = Console(stderr=True)
+    contexts = context or [current_context()]
+    failed: list[str] = []
+
+    def print_project(context: str, project: dict[str, Any]) -> None:
+        if output == OutputFormat.json:
+            typer.echo(
+                json.dumps(
+                    {
+                        "context": context,
+                        "name": project["metadata"]["name"],
+                        "status": project.get("status", {}).get("phase"),
+                    }
+                )
+            )
+        elif len(contexts) > 1:
+            typer.echo(f"{context}\t{project['metadata']['name']}")
+        else:
+            typer.echo(project["metadata"]["name"])
+
+    async def list_context(context: str) -> None:
+        # The client is synchronous, so each request runs in a thread and the
+        # contexts are queried concurrently
+        try:
+            client = await asyncio.to_thread(get_client, context)
+            projects = await asyncio.to_thread(
+                client.resources.get,
+                api_version="project.openshift.io/v1",
+                kind="Project",
+            )
+            pages = iter_pages(projects, page_size)
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                for project in page:
+                    print_project(context, project)
+        except Exception as error:
+            console.log(f"[bold red]Failed to list {context}:[/bold red]")
+            console.log(error)
+            failed.append(context)
+
+    asyncio.run(gather_limited(map(list_context, contexts), limit=8))
+    if failed:
+        raise typer.Exit(1)
 
 
 def create_db(
@@ -173,7 +498,18 @@ def create_db(
     volume_capacity: str = typer.Option(
         "1Gi", help="Volume space available for data, e.g. 512Mi, 2Gi."
     ),
+    wait: bool = typer.Option(
+        False,
+        "--wait",
+        help="Wait for the database to be rolled out and its pods to be "
+        "ready.",
+    ),
+    deadline: int = typer.Option(
+        ROLLOUT_TIMEOUT,
+        help="How long to wait for the database to be ready, in seconds.",
+    ),
 ) -> None:
+    """Creates a MariaDB database on OpenShift"""
     console = Console()
 
     with console.status(
@@ -217,14 +553,15 @@ def create_db(
         console.log("Exposing DB")
         run_command("oc expose service/mariadb")
         console.log("Getting DNS")
-        routes = run_command("oc describe routes/mariadb")
-
-        # TODO Use the k8s API instead of this monstrocity.
-        host = re.search(r"Requested Host:[\s]+(\S*)\n", routes)
+        try:
+            api = OpenShiftApi.from_kubeconfig(current_namespace())
+            dns = api.wait_for_route_host("mariadb")
+        except API_ERRORS as error:
+            log_api_error(console, error)
+            raise typer.Exit(1)
 
         console.log("Writing config to [bold]maria.env")
-        if host:
-            dns = host.group(1)
+        if dns:
             db_credentials: Path = Path.cwd() / "maria.env"
             if not db_credentials.exists():
                 db_credentials.touch()
@@ -240,4 +577,16 @@ def create_db(
                     )
         else:
             console.log("Unable to find DNS, exiting.")
-            typer.Exit(1)
+            raise typer.Exit(1)
+
+        if wait:
+            console.log("Waiting for the database to be ready")
+            try:
+                timings = api.wait_for_rollout(database_service_name, deadline)
+            except RolloutTimeoutError as error:
+                console.log(f"[bold red]{error}")
+                raise typer.Exit(1)
+            except API_ERRORS as error:
+                log_api_error(console, error)
+                raise typer.Exit(1)
+            log_timings(console, timings)
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import threading
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+from typing import Any, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from ci_plumber_azure.arm import (
+    ACR_PULL_ROLE,
+    API_VERSIONS,
+    POLL_INTERVAL,
+    ArmClient,
+    ArmError,
+    Operation,
+    OperationPoller,
+    api_version,
+    operation_from_response,
+)
+from ci_plumber_azure.auth import AccessToken
+
+from ci_plumber.helpers import WaitTimeoutError
+
+SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+REGISTRY = (
+    f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg/providers/"
+    "Microsoft.ContainerRegistry/registries/registry"
+)
+
+
+class StubArm:
+    """A stand-in for Azure Resource Manager. Each route answers with the
+    responses queued for it, in order, repeating the last one. Every request
+    is recorded.
+    """
+
+    def __init__(self) -> None:
+        self.routes: dict[
+            tuple[str, str], list[tuple[int, Any, dict[str, str]]]
+        ] = {}
+        self.requests: list[dict[str, Any]] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def handle_request(self) -> None:
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                stub.requests.append(
+                    {
+                        "method": self.command,
+                        "path": url.path,
+                        "query": parse_qs(url.query),
+                        "headers": dict(self.headers),
+                        "body": json.loads(body) if body else None,
+                    }
+                )
+                queue = stub.routes.get((self.command, url.path))
+                if not queue:
+                    status, data, headers = 404, {"error": {}}, {}
+                else:
+                    status, data, headers = (
+                        queue.pop(0) if len(queue) > 1 else queue[0]
+                    )
+                content = (
+                    json.dumps(data).encode() if data is not None else b""
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_PUT = do_PATCH = do_POST = handle_request
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def add(
+        self,
+        method: str,
+        path: str,
+        status: int,
+        body: Any = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> None:
+        """Queues a response for a route"""
+        self.routes.setdefault((method, path), []).append(
+            (status, body, headers or {})
+        )
+
+    def sent(self, method: str, path: str) -> list[dict[str, Any]]:
+        """Gets the requests made to a route"""
+        return [
+            request
+            for request in self.requests
+            if request["method"] == method and request["path"] == path
+        ]
+
+
+@pytest.fixture
+def stub() -> Iterator[StubArm]:
+    stub = StubArm()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def client(stub: StubArm) -> ArmClient:
+    return ArmClient(
+        lambda: AccessToken("token", SUBSCRIPTION, "tenant", time() + 3600),
+        stub.url,
+    )
+
+
+def test_api_version_uses_innermost_provider() -> None:
+    assert api_version(
+        f"{REGISTRY}/providers/Microsoft.Authorization/roleAssignments/x"
+    ) == (API_VERSIONS["Microsoft.Authorization"])
+    assert api_version(REGISTRY) == API_VERSIONS["Microsoft.ContainerRegistry"]
+    assert api_version(f"/subscriptions/{SUBSCRIPTION}/resourceGroups/rg") == (
+        API_VERSIONS["resourcegroups"]
+    )
+
+
+def test_put_and_get(stub: StubArm, client: ArmClient) -> None:
+    path = client.resource_group_path("rg")
+    group = {"location": "uksouth", "properties": {}}
+    stub.add("PUT", path, 201, group)
+    stub.add("GET", path, 200, group)
+
+    assert client.create_resource_group("rg", "uksouth") == group
+    assert client.get_location("rg") == "uksouth"
+
+    (put,) = stub.sent("PUT", path)
+    assert put["body"] == {"location": "uksouth"}
+    assert put["query"]["api-version"] == [API_VERSIONS["resourcegroups"]]
+    assert put["headers"]["Authorization"] == "Bearer token"
+
+
+def test_errors_raise_arm_error(stub: StubArm, client: ArmClient) -> None:
+    stub.add(
+        "GET",
+        REGISTRY,
+        404,
+        {"error": {"code": "ResourceNotFound", "message": "Not found"}},
+    )
+
+    with pytest.raises(ArmError) as error:
+        client.get(REGISTRY)
+    assert error.value.status == 404
+    assert error.value.code == "ResourceNotFound"
+
+
+def test_iter_resources_follows_next_link(
+    stub: StubArm, client: ArmClient
+) -> None:
+    stub.add(
+        "GET",
+        "/subscriptions",
+        200,
+        {
+            "value": [{"subscriptionId": "a"}],
+            "nextLink": f"{stub.url}/page2?api-version=2020-01-01",
+        },
+    )
+    stub.add("GET", "/page2", 200, {"value": [{"subscriptionId": "b"}]})
+
+    subscriptions = list(client.list_subscriptions())
+
+    assert [s["subscriptionId"] for s in subscriptions] == ["a", "b"]
+    # The nextLink already has its API version
+    assert stub.sent("GET", "/page2")[0]["query"]["api-version"] == [
+        "2020-01-01"
+    ]
+
+
+def test_put_waits_for_async_operation(
+    stub: StubArm, client: ArmClient
+) -> None:
+    operation = f"{stub.url}/operations/1"
+    stub.add(
+        "PUT",
+        REGISTRY,
+        201,
+        {"properties": {"provisioningState": "Creating"}},
+        {"Azure-AsyncOperation": operation, "Retry-After": "0"},
+    )
+    stub.add("GET", "/operations/1", 200, {"status": "InProgress"})
+    stub.add("GET", "/operations/1", 200, {"status": "Succeeded"})
+    registry = {"properties": {"loginServer": "registry.azurecr.io"}}
+    stub.add("GET", REGISTRY, 200, registry)
+
+    assert client.put(REGISTRY, {"location": "uksouth"}) == registry
+    assert len(stub.sent("GET", "/operations/1")) == 2
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("7", (7, 7)),
+        (formatdate(time() + 30, usegmt=True), (25, 30)),
+        (formatdate(time() - 30, usegmt=True), (0, 0)),
+        ("soon", (POLL_INTERVAL, POLL_INTERVAL)),
+    ],
+)
+def test_retry_after_is_seconds_or_a_date(
+    stub: StubArm,
+    client: ArmClient,
+    header: str,
+    expected: tuple[float, float],
+) -> None:
+    stub.add(
+        "PUT",
+        REGISTRY,
+        202,
+        None,
+        {"Location": f"{stub.url}/operations/3", "Retry-After": header},
+    )
+    response = client.request("PUT", REGISTRY, {})
+
+    operation = operation_from_response(response, REGISTRY)
+
+    assert operation is not None
+    low, high = expected
+    assert low <= operation.retry_after <= high
+
+
+def test_failed_async_operation_raises(
+    stub: StubArm, client: ArmClient
+) -> None:
+    stub.add(
+        "PUT",
+        REGISTRY,
+        202,
+        None,
+        {"Azure-AsyncOperation": f"{stub.url}/operations/2"},
+    )
+    stub.add(
+        "GET",
+        "/operations/2",
+        200,
+        {"status": "Failed", "error": {"code": "Conflict", "message": "x"}},
+    )
+
+    with pytest.raises(ArmError) as error:
+        client.wait(client.begin("PUT", REGISTRY, {})._replace(retry_after=0))
+    assert error.value.code == "Conflict"
+
+
+def test_wait_times_out(stub: StubArm, client: ArmClient) -> None:
+    creating = {"properties": {"provisioningState": "Creating"}}
+    stub.add("GET", REGISTRY, 200, creating)
+
+    with pytest.raises(WaitTimeoutError):
+        client.wait(Operation(REGISTRY, retry_after=0), timeout=0)
+
+
+def test_poller_waits_for_every_operation(
+    stub: StubArm, client: ArmClient
+) -> None:
+    server = REGISTRY.replace("registries/registry", "registries/other")
+    creating = {"properties": {"provisioningState": "Creating"}}
+    for path in (REGISTRY, server):
+        stub.add("GET", path, 200, creating)
+        stub.add("GET", path, 200, {"id": path})
+
+    async def wait() -> list[dict[str, Any]]:
+        poller = OperationPoller(client)
+        return await asyncio.gather(
+            poller.wait(Operation(REGISTRY, retry_after=0)),
+            poller.wait(Operation(server, retry_after=0)),
+        )
+
+    assert asyncio.run(wait()) == [{"id": REGISTRY}, {"id": server}]
+
+
+def test_poller_times_out(stub: StubArm, client: ArmClient) -> None:
+    creating = {"properties": {"provisioningState": "Creating"}}
+    stub.add("GET", REGISTRY, 200, creating)
+    poller = OperationPoller(client, timeout=0)
+
+    with pytest.raises(WaitTimeoutError):
+        asyncio.run(poller.wait(Operation(REGISTRY, retry_after=0)))
+    assert not poller.pending
+
+
+def test_assign_role(stub: StubArm, client: ArmClient) -> None:
+    roles = f"{REGISTRY}/providers/Microsoft.Authorization/roleAssignments"
+    # The name is derived from the scope, principal and role
+    name = uuid.uuid5(
+        uuid.NAMESPACE_URL, f"{REGISTRY}/principal/{ACR_PULL_ROLE}"
+    )
+    assignment = {"properties": {"principalId": "principal"}}
+    stub.add("PUT", f"{roles}/{name}", 201, assignment)
+    stub.add("GET", roles, 200, {"value": [{"id": "assignment"}]})
+
+    assert client.assign_role(REGISTRY, "principal", ACR_PULL_ROLE) == (
+        assignment
+    )
+    assert client.list_role_assignments(REGISTRY, "principal") == [
+        {"id": "assignment"}
+    ]
+
+    (put,) = stub.sent("PUT", f"{roles}/{name}")
+    assert put["query"]["api-version"] == [
+        API_VERSIONS["Microsoft.Authorization"]
+    ]
+    assert put["body"]["properties"]["principalId"] == "principal"
+    assert put["body"]["properties"]["roleDefinitionId"].endswith(
+        ACR_PULL_ROLE
+    )
+    (listed,) = stub.sent("GET", roles)
+    assert listed["query"]["api-version"] == [
+        API_VERSIONS["Microsoft.Authorization"]
+    ]
+    assert listed["query"]["$filter"] == ["principalId eq 'principal'"]
+
+
+def test_assign_role_again_is_a_no_op(
+    stub: StubArm, client: ArmClient
+) -> None:
+    name = uuid.uuid5(
+        uuid.NAMESPACE_URL, f"{REGISTRY}/principal/{ACR_PULL_ROLE}"
+    )
+    path = (
+        f"{REGISTRY}/providers/Microsoft.Authorization/roleAssignments/{name}"
+    )
+    stub.add(
+        "PUT",
+        path,
+        409,
+        {"error": {"code": "RoleAssignmentExists", "message": "Exists"}},
+    )
+    stub.add("GET", path, 200, {"id": path})
+
+    assert client.assign_role(REGISTRY, "principal", ACR_PULL_ROLE) == {
+        "id": path
+    }
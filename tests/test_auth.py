@@ -0,0 +1,28 @@
+import pytest
+import typer
+from ci_plumber_azure.auth import (
+    ARM_TOKEN_ENV_VAR,
+    SUBSCRIPTION_ENV_VAR,
+    get_arm_token,
+)
+
+
+def test_env_token_uses_given_subscription(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv(ARM_TOKEN_ENV_VAR, "token")
+    monkeypatch.setenv(SUBSCRIPTION_ENV_VAR, "default")
+
+    assert get_arm_token("given").subscription == "given"
+    assert get_arm_token().subscription == "default"
+    assert get_arm_token().token == "token"
+
+
+def test_env_token_needs_a_subscription(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv(ARM_TOKEN_ENV_VAR, "token")
+    monkeypatch.delenv(SUBSCRIPTION_ENV_VAR, raising=False)
+
+    with pytest.raises(typer.BadParameter, match=SUBSCRIPTION_ENV_VAR):
+        get_arm_token()
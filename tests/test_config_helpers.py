@@ -0,0 +1,100 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from ci_plumber.helpers.config_helpers import (
+    ConfigSession,
+    lock_config,
+    save_config,
+)
+
+REMOTE = "git@gitlab.example.com:group/project.git"
+
+
+@pytest.fixture
+def config_path(tmp_path: Path) -> Path:
+    config_path = tmp_path / "config.json"
+    save_config(config_path, {"repos": {REMOTE: {"registry.url": "old"}}})
+    return config_path
+
+
+def saved_config(config_path: Path) -> dict[str, Any]:
+    with config_path.open("r") as fp:
+        return json.load(fp)["repos"][REMOTE]
+
+
+def test_changes_are_only_saved_on_commit(config_path: Path) -> None:
+    config = ConfigSession(REMOTE, config_path)
+    config.set("registry.url", "new")
+
+    assert config.get("registry.url") == "new"
+    assert saved_config(config_path) == {"registry.url": "old"}
+    config.commit()
+    assert saved_config(config_path) == {"registry.url": "new"}
+
+
+def test_commit_keeps_changes_made_since_loading(config_path: Path) -> None:
+    first = ConfigSession(REMOTE, config_path)
+    with ConfigSession(REMOTE, config_path) as second:
+        second.set("registry.name", "registry")
+
+    first.update({"registry.url": "new", "username": "user"})
+    first.commit()
+
+    assert saved_config(config_path) == {
+        "registry.url": "new",
+        "registry.name": "registry",
+        "username": "user",
+    }
+
+
+def test_commit_waits_for_the_lock(config_path: Path) -> None:
+    config = ConfigSession(REMOTE, config_path)
+    config.set("registry.url", "new")
+    committed = threading.Event()
+
+    def commit() -> None:
+        config.commit()
+        committed.set()
+
+    with lock_config(config_path):
+        thread = threading.Thread(target=commit)
+        thread.start()
+        assert not committed.wait(0.2)
+    thread.join()
+
+    assert committed.is_set()
+    assert saved_config(config_path) == {"registry.url": "new"}
+
+
+def test_delete_removes_the_key_on_commit(config_path: Path) -> None:
+    with ConfigSession(REMOTE, config_path) as config:
+        config.set("username", "user")
+        config.delete("registry.url")
+        # Deleting a key that isn't set does nothing
+        config.delete("missing")
+
+        with pytest.raises(KeyError):
+            config.get("registry.url")
+
+    assert saved_config(config_path) == {"username": "user"}
+
+
+def test_setting_a_deleted_key_keeps_it(config_path: Path) -> None:
+    with ConfigSession(REMOTE, config_path) as config:
+        config.delete("registry.url")
+        config.set("registry.url", "new")
+
+    assert saved_config(config_path) == {"registry.url": "new"}
+
+
+def test_failed_session_isnt_committed(config_path: Path) -> None:
+    with pytest.raises(RuntimeError):
+        with ConfigSession(REMOTE, config_path) as config:
+            config.set("registry.url", "new")
+            raise RuntimeError("failed")
+
+    assert saved_config(config_path) == {"registry.url": "old"}
@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pytest
+
+from ci_plumber.helpers.git_helpers import (
+    REMOTE_ENV_VAR,
+    RepoContext,
+    find_git_dir,
+    get_repo_context,
+    read_remotes,
+)
+
+ORIGIN = "git@gitlab.example.com:group/project.git"
+FORK = "git@gitlab.example.com:me/project.git"
+
+CONFIG = f"""[core]
+    bare = false
+[remote "origin"]
+    url = {ORIGIN}
+    fetch = +refs/heads/*:refs/remotes/origin/*
+[remote "fork"]
+    url = "{FORK}" ; where changes are pushed
+[branch "main"]
+    remote = origin
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_remote_env_var(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(REMOTE_ENV_VAR, raising=False)
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    (tmp_path / "repo" / ".git").mkdir(parents=True)
+    (tmp_path / "repo" / ".git" / "config").write_text(CONFIG)
+    return tmp_path / "repo"
+
+
+def test_remote_defaults_to_origin() -> None:
+    context = RepoContext(None, {"origin": ORIGIN, "fork": FORK})
+
+    assert context.remote() == ORIGIN
+    assert context.remote("fork") == FORK
+
+
+def test_env_var_selects_the_remote(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(REMOTE_ENV_VAR, "fork")
+    context = RepoContext(None, {"origin": ORIGIN, "fork": FORK})
+
+    assert context.remote() == FORK
+    # A remote given by name wins over the environment
+    assert context.remote("origin") == ORIGIN
+
+
+def test_only_remote_is_used_whatever_its_name() -> None:
+    assert RepoContext(None, {"upstream": ORIGIN}).remote() == ORIGIN
+
+
+def test_unknown_remote_raises_key_error() -> None:
+    context = RepoContext(None, {"fork": FORK, "mine": FORK})
+
+    # With several remotes and no origin, one has to be chosen
+    with pytest.raises(KeyError, match="'origin' not found"):
+        context.remote()
+    with pytest.raises(KeyError, match="'upstream' not found"):
+        context.remote("upstream")
+    with pytest.raises(KeyError, match="no remotes"):
+        RepoContext(None, {}).remote()
+
+
+def test_remotes_are_read_from_the_config(repo: Path) -> None:
+    (repo / "src").mkdir()
+
+    root, git_dir = find_git_dir(repo / "src")
+
+    assert root == repo
+    assert git_dir == repo / ".git"
+    assert read_remotes(repo / ".git") == {"origin": ORIGIN, "fork": FORK}
+
+
+def test_includes_are_left_to_gitpython(repo: Path) -> None:
+    config = repo / ".git" / "config"
+    config.write_text(CONFIG + "[include]\n    path = ~/.gitconfig.extra\n")
+
+    assert read_remotes(repo / ".git") is None
+
+
+def test_worktrees_use_the_main_repos_config(
+    tmp_path: Path, repo: Path
+) -> None:
+    worktree_dir = repo / ".git" / "worktrees" / "feature"
+    worktree_dir.mkdir(parents=True)
+    (worktree_dir / "commondir").write_text("../..\n")
+    worktree = tmp_path / "feature"
+    worktree.mkdir()
+    (worktree / ".git").write_text(f"gitdir: {worktree_dir}\n")
+
+    root, git_dir = find_git_dir(worktree)
+
+    assert root == worktree
+    assert git_dir == (repo / ".git").resolve()
+    assert get_repo_context(worktree).remote() == ORIGIN
+
+
+def test_outside_a_repo(tmp_path: Path) -> None:
+    assert find_git_dir(tmp_path) == (None, None)
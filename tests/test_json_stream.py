@@ -0,0 +1,78 @@
+import json
+from typing import Any, Iterator
+
+import pytest
+
+from ci_plumber.helpers.json_stream import extract_json_keys, iter_json_items
+
+ACCOUNTS = [
+    {"name": "Pay-As-You-Go", "id": "a", "isDefault": True},
+    {"name": 'Quoted "name", with [brackets]', "id": "b", "isDefault": False},
+    {"name": "Numbers", "id": 12345.678, "tags": [1, -2e10, None]},
+]
+
+
+def chunked(text: str, size: int) -> Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 4096])
+def test_items_span_chunk_boundaries(size: int) -> None:
+    text = json.dumps(ACCOUNTS, indent=2)
+
+    assert list(iter_json_items(chunked(text, size))) == ACCOUNTS
+
+
+@pytest.mark.parametrize("size", [1, 2, 5])
+def test_numbers_span_chunk_boundaries(size: int) -> None:
+    assert list(iter_json_items(chunked("[12345, 6.0e-3, 7]", size))) == [
+        12345,
+        6.0e-3,
+        7,
+    ]
+
+
+@pytest.mark.parametrize("text", ["", "  \n", "[]", " [ ] "])
+def test_empty_input_yields_nothing(text: str) -> None:
+    assert list(iter_json_items(chunked(text, 1) if text else [])) == []
+
+
+@pytest.mark.parametrize(
+    "text, before",
+    [
+        ('[{"id": "a"}, {"id": "b"', 1),
+        ('[{"id": "a"},', 1),
+        ('[{"id": "a"}', 1),
+        ("[", 0),
+    ],
+)
+def test_truncated_input_raises(text: str, before: int) -> None:
+    items: list[Any] = []
+
+    with pytest.raises(ValueError):
+        for item in iter_json_items(chunked(text, 3)):
+            items.append(item)
+    # The items before the cut are still yielded
+    assert items == [{"id": "a"}] * before
+
+
+def test_non_array_raises() -> None:
+    with pytest.raises(ValueError):
+        list(iter_json_items(['{"id": "a"}']))
+
+
+def test_extract_json_keys_stops_once_found() -> None:
+    def chunks() -> Iterator[str]:
+        yield '{"accessToken": "token", "subscription": "sub",'
+        raise AssertionError("Read past the wanted keys")
+
+    assert extract_json_keys(chunks(), ["subscription", "accessToken"]) == {
+        "accessToken": "token",
+        "subscription": "sub",
+    }
+
+
+def test_extract_json_keys_raises_for_missing_keys() -> None:
+    with pytest.raises(KeyError, match="tenant"):
+        extract_json_keys(chunked('{"a": 1, "b": [2]}', 2), ["a", "tenant"])
@@ -0,0 +1,127 @@
+from time import monotonic
+from typing import Any, Iterator, Optional
+
+from ci_plumber_openshift.api import GONE, OpenShiftApi, label_selector
+from kubernetes.client.exceptions import ApiException
+
+
+class Listing(dict):
+    """A response, as the dynamic client returns it"""
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self)
+
+
+class StubResource:
+    """A stand-in for a resource of the dynamic client. Each watch yields
+    the events queued for it, in order.
+    """
+
+    def __init__(
+        self, items: list[dict[str, Any]], watches: list[list[Any]]
+    ) -> None:
+        self.items = items
+        self.watches = watches
+        self.lists = 0
+        self.versions: list[Optional[str]] = []
+
+    def get(self, **params: Any) -> Listing:
+        self.lists += 1
+        return Listing(
+            items=self.items,
+            metadata={"resourceVersion": str(self.lists), "continue": None},
+        )
+
+    def watch(
+        self, resource_version: Optional[str] = None, **params: Any
+    ) -> Iterator[dict[str, Any]]:
+        self.versions.append(resource_version)
+        for event in self.watches.pop(0):
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+
+class StubClient:
+    def __init__(self, resources: dict[str, StubResource]) -> None:
+        self.resources = self
+        self.kinds = resources
+
+    def get(self, api_version: str, kind: str) -> StubResource:
+        return self.kinds[kind]
+
+
+def pod(name: str) -> dict[str, Any]:
+    return {
+        "metadata": {"name": name, "resourceVersion": "9"},
+        "status": {"conditions": [{"type": "Ready", "status": "True"}]},
+    }
+
+
+def test_watch_until_lists_again_when_version_expires() -> None:
+    gone = {"type": "ERROR", "raw_object": {"code": GONE, "reason": "Gone"}}
+    resource = StubResource(
+        [],
+        [
+            [gone],
+            [ApiException(status=GONE, reason="Gone")],
+            [{"type": "ADDED", "raw_object": pod("app-1")}],
+        ],
+    )
+    api = OpenShiftApi(StubClient({}), "project")
+
+    assert api.watch_until(
+        resource, lambda event, item: event == "ADDED", monotonic() + 60
+    )
+    assert resource.lists == 3
+    # Each watch starts from the version of the latest list
+    assert resource.versions == ["1", "2", "3"]
+
+
+def test_pod_labels_select_deployment_config_version() -> None:
+    api = OpenShiftApi(StubClient({}), "project")
+    config = {
+        "kind": "DeploymentConfig",
+        "metadata": {"name": "app"},
+        "spec": {"selector": {"deploymentconfig": "app"}},
+        "status": {"latestVersion": 3},
+    }
+
+    assert api.pod_labels(config) == {
+        "deploymentconfig": "app",
+        "deployment": "app-3",
+    }
+
+
+def test_pod_labels_select_current_replica_set() -> None:
+    revision = "deployment.kubernetes.io/revision"
+
+    def replica_set(template_hash: str, version: str) -> dict[str, Any]:
+        return {
+            "metadata": {
+                "labels": {"app": "app", "pod-template-hash": template_hash},
+                "annotations": {revision: version},
+                "ownerReferences": [{"uid": "uid"}],
+            }
+        }
+
+    replica_sets = StubResource(
+        [replica_set("old", "1"), replica_set("new", "2")], []
+    )
+    api = OpenShiftApi(
+        StubClient({"ReplicaSet": replica_sets}),
+        "project",
+    )
+    deployment = {
+        "kind": "Deployment",
+        "metadata": {
+            "name": "app",
+            "uid": "uid",
+            "annotations": {revision: "2"},
+        },
+        "spec": {"selector": {"matchLabels": {"app": "app"}}},
+    }
+
+    assert label_selector(api.pod_labels(deployment)) == (
+        "app=app,pod-template-hash=new"
+    )
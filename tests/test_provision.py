@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+import typer
+from ci_plumber_azure.provision import DEFAULT_SPEC, load_spec
+
+SPEC = {
+    "resource_group": "rg",
+    "location": "ukwest",
+    "registry": {"name": "registry", "sku": "Standard"},
+    "database": {"name": "database"},
+    "app": {"name": "app"},
+}
+
+
+def write_spec(tmp_path: Path, spec: dict[str, Any]) -> Path:
+    spec_file = tmp_path / "environment.json"
+    spec_file.write_text(json.dumps(spec))
+    return spec_file
+
+
+def test_load_spec_fills_in_defaults(tmp_path: Path) -> None:
+    spec = load_spec(write_spec(tmp_path, SPEC))
+
+    assert spec["location"] == "ukwest"
+    assert spec["registry"] == {"name": "registry", "sku": "Standard"}
+    assert spec["database"]["sku"] == DEFAULT_SPEC["database"]["sku"]
+    assert spec["app"]["service_plan"] == DEFAULT_SPEC["app"]["service_plan"]
+
+
+def test_load_spec_rejects_unknown_location(tmp_path: Path) -> None:
+    spec_file = write_spec(tmp_path, {**SPEC, "location": "mars"})
+
+    with pytest.raises(typer.BadParameter, match="location"):
+        load_spec(spec_file)
+
+
+@pytest.mark.parametrize("resource", ["registry", "database"])
+def test_load_spec_rejects_unknown_sku(tmp_path: Path, resource: str) -> None:
+    spec = {**SPEC, resource: {"name": resource, "sku": "Huge"}}
+
+    with pytest.raises(typer.BadParameter, match=f"{resource} sku"):
+        load_spec(write_spec(tmp_path, spec))
+
+
+def test_load_spec_rejects_unnamed_resource(tmp_path: Path) -> None:
+    spec_file = write_spec(tmp_path, {**SPEC, "app": {}})
+
+    with pytest.raises(typer.BadParameter, match="app"):
+        load_spec(spec_file)
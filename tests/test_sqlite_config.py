@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from ci_plumber.helpers.config_helpers import ConfigSession
+from ci_plumber.helpers.sqlite_config import (
+    SQLITE_CONFIG_FILE,
+    delete_values,
+    get_value,
+    load_remote,
+    migrate_json_config,
+    set_values,
+)
+
+REMOTE = "git@gitlab.example.com:group/project.git"
+OTHER = "git@gitlab.example.com:group/other.git"
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    return tmp_path / SQLITE_CONFIG_FILE
+
+
+def test_set_values_inserts_and_updates(db_path: Path) -> None:
+    set_values(db_path, {REMOTE: {"registry.url": "old", "port": 8080}})
+    set_values(db_path, {REMOTE: {"registry.url": "new"}, OTHER: {"a": 1}})
+
+    assert load_remote(db_path, REMOTE) == {
+        "registry.url": "new",
+        "port": 8080,
+    }
+    assert get_value(db_path, OTHER, "a") == 1
+
+
+def test_missing_values_raise_key_error(db_path: Path) -> None:
+    set_values(db_path, {REMOTE: {"registry.url": "url"}})
+
+    with pytest.raises(KeyError):
+        get_value(db_path, REMOTE, "missing")
+    assert load_remote(db_path, OTHER) == {}
+
+
+def test_delete_values_only_deletes_the_remotes_keys(db_path: Path) -> None:
+    set_values(db_path, {REMOTE: {"a": 1, "b": 2}, OTHER: {"a": 1}})
+
+    delete_values(db_path, REMOTE, ["a", "missing"])
+
+    assert load_remote(db_path, REMOTE) == {"b": 2}
+    assert load_remote(db_path, OTHER) == {"a": 1}
+
+
+def test_migrate_json_config(tmp_path: Path, db_path: Path) -> None:
+    json_path = tmp_path / "config.json"
+    repos = {
+        REMOTE: {"registry.url": "url", "workflows.test": {"results": {}}},
+        OTHER: {"username": "user"},
+    }
+    json_path.write_text(json.dumps({"repos": repos}))
+
+    assert migrate_json_config(json_path, db_path) == 2
+
+    assert not json_path.exists()
+    assert json_path.with_name("config.json.bak").is_file()
+    assert load_remote(db_path, REMOTE) == repos[REMOTE]
+    assert load_remote(db_path, OTHER) == repos[OTHER]
+
+
+def test_config_session_uses_the_database(db_path: Path) -> None:
+    set_values(db_path, {REMOTE: {"registry.url": "old", "username": "a"}})
+
+    with ConfigSession(REMOTE, db_path) as config:
+        assert config.get("registry.url") == "old"
+        config.set("registry.url", "new")
+        config.delete("username")
+
+    assert load_remote(db_path, REMOTE) == {"registry.url": "new"}
@@ -0,0 +1,207 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from rich.console import Console
+
+from ci_plumber.helpers import config_helpers
+from ci_plumber.helpers.config_helpers import save_config
+from ci_plumber.helpers.workflow import (
+    Checkpoint,
+    Results,
+    Workflow,
+    WorkflowError,
+)
+
+REMOTE = "git@gitlab.example.com:group/project.git"
+
+
+def quiet_workflow(**kwargs: Any) -> Workflow:
+    return Workflow(Console(quiet=True), **kwargs)
+
+
+def test_steps_run_after_their_requirements() -> None:
+    order: list[str] = []
+    workflow = quiet_workflow()
+
+    def step(name: str) -> Any:
+        def action(results: Results) -> str:
+            order.append(name)
+            return name
+
+        return action
+
+    workflow.add("app", step("app"), requires=("plan", "registry"))
+    workflow.add("plan", step("plan"), requires=("group",))
+    workflow.add("registry", step("registry"), requires=("group",))
+    workflow.add("group", step("group"))
+
+    results = workflow.run()
+
+    assert results == {name: name for name in order}
+    assert order[0] == "group"
+    assert order[-1] == "app"
+
+
+def test_independent_steps_run_at_once() -> None:
+    running = 0
+    most_running = 0
+    workflow = quiet_workflow(limit=2)
+
+    async def action(results: Results) -> None:
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    for name in ("a", "b", "c"):
+        workflow.add(name, action)
+    workflow.run()
+
+    # No more than the limit run at once
+    assert most_running == 2
+
+
+def test_results_are_passed_to_later_steps() -> None:
+    workflow = quiet_workflow()
+    workflow.add("group", lambda results: "rg")
+    workflow.add(
+        "registry",
+        lambda results: f"{results['group']}/registry",
+        requires=("group",),
+    )
+
+    assert workflow.run()["registry"] == "rg/registry"
+
+
+def test_cycles_are_rejected() -> None:
+    workflow = quiet_workflow()
+    workflow.add("a", lambda results: None, requires=("b",))
+    workflow.add("b", lambda results: None, requires=("a",))
+    workflow.add("c", lambda results: None)
+
+    with pytest.raises(WorkflowError, match="depend on each other"):
+        workflow.run()
+
+
+def test_unknown_requirements_are_rejected() -> None:
+    workflow = quiet_workflow()
+    workflow.add("a", lambda results: None, requires=("missing",))
+
+    with pytest.raises(WorkflowError, match="unknown step 'missing'"):
+        workflow.validate()
+
+
+def test_steps_cant_be_added_twice() -> None:
+    workflow = quiet_workflow()
+    workflow.add("a", lambda results: None)
+
+    with pytest.raises(WorkflowError):
+        workflow.add("a", lambda results: None)
+
+
+def test_failure_cancels_running_steps() -> None:
+    cancelled = False
+    ran: list[str] = []
+    workflow = quiet_workflow()
+
+    async def slow(results: Results) -> None:
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def fail(results: Results) -> None:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("failed")
+
+    workflow.add("slow", slow)
+    workflow.add("fail", fail)
+    workflow.add("after", lambda results: ran.append("after"), ("fail",))
+
+    with pytest.raises(RuntimeError, match="failed"):
+        workflow.run()
+    assert cancelled
+    assert not ran
+
+
+@pytest.fixture
+def config_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    config_path = tmp_path / "config.json"
+    save_config(config_path, {"repos": {}})
+    monkeypatch.setattr(config_helpers, "get_config_file", lambda: config_path)
+    return config_path
+
+
+def saved_run(config_path: Path) -> Any:
+    with config_path.open("r") as fp:
+        repo_config = json.load(fp)["repos"].get(REMOTE, {})
+    return repo_config.get("workflows.test")
+
+
+def test_checkpoint_records_finished_steps(config_file: Path) -> None:
+    checkpoint = Checkpoint("test", remote=REMOTE)
+
+    assert checkpoint.start({"name": "app"}) == {"name": "app"}
+    checkpoint.record("group", "rg")
+
+    assert saved_run(config_file) == {
+        "options": {"name": "app"},
+        "results": {"group": "rg"},
+    }
+
+
+def test_resumed_run_skips_recorded_steps(config_file: Path) -> None:
+    first = Checkpoint("test", remote=REMOTE)
+    first.start({"name": "app"})
+    first.record("group", "rg")
+
+    ran: list[str] = []
+    checkpoint = Checkpoint("test", resume=True, remote=REMOTE)
+    # The options of the last run are used
+    assert checkpoint.start({"name": "other"}) == {"name": "app"}
+    workflow = quiet_workflow(checkpoint=checkpoint)
+    workflow.add("group", lambda results: ran.append("group"))
+    workflow.add(
+        "registry",
+        lambda results: f"{results['group']}/registry",
+        requires=("group",),
+    )
+
+    assert workflow.run() == {"group": "rg", "registry": "rg/registry"}
+    assert not ran
+
+
+def test_failed_run_keeps_its_checkpoint(config_file: Path) -> None:
+    checkpoint = Checkpoint("test", remote=REMOTE)
+    checkpoint.start({})
+
+    def fail(results: Results) -> None:
+        raise RuntimeError("failed")
+
+    workflow = quiet_workflow(checkpoint=checkpoint)
+    workflow.add("group", lambda results: "rg")
+    workflow.add("registry", fail, requires=("group",))
+
+    with pytest.raises(RuntimeError):
+        workflow.run()
+    assert saved_run(config_file)["results"] == {"group": "rg"}
+
+
+@pytest.mark.parametrize("keep", [False, True])
+def test_finished_run_removes_its_checkpoint(
+    config_file: Path, keep: bool
+) -> None:
+    checkpoint = Checkpoint("test", remote=REMOTE, keep=keep)
+    checkpoint.start({})
+    workflow = quiet_workflow(checkpoint=checkpoint)
+    workflow.add("group", lambda results: "rg")
+
+    workflow.run()
+
+    assert (saved_run(config_file) is not None) == keep